@@ -0,0 +1,434 @@
+"""
+AI-CFO 計算 API（JSON over HTTP）
+=======================================
+engine の計算結果（app.py と同じ bep_rev・safety_margin_ratio・cf_line・min_cash・
+short_month・invest_payback_sales など）を、CRM や月次レポートなどの他システムから取得するための
+軽量な HTTP サービス。標準ライブラリの asyncio だけで動く（Streamlit は読み込まない）。
+
+    python api.py --port 8765
+
+エンドポイント:
+    POST /v1/simulate   JSON を受け取り、JSON で返す（最大 MAX_SIMULATE_ROWS 行）
+        {"company": {...}, "scenarios": [{...}, ...], "n_months": 12}
+        {"companies": [{...}, ...], "scenarios": [...]}     会社 × シナリオの全組み合わせ
+    POST /v1/batch?n_months=12
+        JSON Lines（1 行 = batch.py の入力 1 行）を受け取り、BATCH_CHUNK 行ごとに計算して
+        JSON Lines で順に返す（Transfer-Encoding: chunked。入力も chunked で送ってよい）。
+        行数の上限はなく、サーバーが抱えるのは 1 チャンク分だけ。
+    GET  /healthz, GET /metrics（Prometheus テキスト形式）
+
+会社・シナリオの項目名は batch.py と同じ（revenue, cogs, fixed_cost, cash, receivables, payables,
+invest, cost_cut, sales_change, ramp_months, industry, id, revenue_history）。
+行ごとの計算は batch.evaluate_chunk を使うので、バッチ CLI と結果は完全に一致する。
+
+INLINE_ROWS 行（12ヶ月換算）を超える計算（evaluate）はサーバーごとのスレッドプールで動かし、イベントループは止めない。
+大きな /v1/simulate の計算中も、/healthz や流している途中の /v1/batch の応答は待たされない
+（NumPy の配列演算は GIL を離すので、計算どうしも並行して進む）。数ミリ秒で終わる小さな計算は
+スレッドの受け渡しのほうが高くつくので、ループの上でそのまま計算する。
+
+各応答には Server-Timing（parse / engine / encode / total、ミリ秒）を付ける。
+/v1/batch は本文を流し始めたあとに決まるので、HTTP のトレーラーで返す。
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+import batch
+import engine
+import metrics
+import rules
+
+logger = logging.getLogger("ai_cfo.api")
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 8 * 1024 * 1024
+MAX_SIMULATE_ROWS = 10_000
+MAX_MONTHS = 120
+BATCH_CHUNK = 2_000
+# 行数 × 月数がこの行数の 12ヶ月分以下なら、イベントループの上で計算する（500 行・12ヶ月で数ミリ秒）
+INLINE_ROWS = 500
+READ_BLOCK = 64 * 1024
+# 円の金額は整数に丸めて返す
+YEN_FIELDS = ("target_rev", "target_op_profit", "bep_rev", "invest_payback_sales", "min_cash", "final_cash")
+RATIO_FIELDS = ("safety_margin_ratio", "months_sales_ratio", "sim_v_rate", "m_rec", "m_pay")
+# メトリクスの path ラベルに使う経路。それ以外（404 になる任意の URL）は "other" にまとめ、
+# 時系列の数が相手の送る URL で増え続けないようにする
+ROUTED_PATHS = ("/v1/simulate", "/v1/batch", "/healthz", "/metrics")
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            411: "Length Required", 413: "Payload Too Large", 431: "Request Header Fields Too Large",
+            500: "Internal Server Error"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# ─────────────────────────────────────
+# 計算と結果の組み立て
+# ─────────────────────────────────────
+def _n_months(value):
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        raise HttpError(400, "n_months は整数で指定してください。") from None
+    if not 1 <= n <= MAX_MONTHS:
+        raise HttpError(400, f"n_months は 1〜{MAX_MONTHS} で指定してください。")
+    return n
+
+
+def expand_rows(payload):
+    """/v1/simulate の本文を batch.py と同じ形の行の並びにする（会社 × シナリオ）。"""
+    if not isinstance(payload, dict):
+        raise HttpError(400, "本文は JSON オブジェクトで送ってください。")
+    if "companies" in payload:
+        companies = payload["companies"]
+    elif "company" in payload:
+        companies = [payload["company"]]
+    else:
+        raise HttpError(400, '"company" または "companies" が必要です。')
+    scenarios = payload.get("scenarios") or [{}]
+    if not isinstance(companies, list) or not isinstance(scenarios, list):
+        raise HttpError(400, '"companies" と "scenarios" は配列で送ってください。')
+    if len(companies) * len(scenarios) > MAX_SIMULATE_ROWS:
+        raise HttpError(413, f"1 回に計算できるのは {MAX_SIMULATE_ROWS:,} 行までです。/v1/batch を使ってください。")
+    rows = []
+    for i, company in enumerate(companies):
+        if not isinstance(company, dict):
+            raise HttpError(400, "会社は JSON オブジェクトで送ってください。")
+        for j, scenario in enumerate(scenarios):
+            if not isinstance(scenario, dict):
+                raise HttpError(400, "シナリオは JSON オブジェクトで送ってください。")
+            row = {**company, **scenario}
+            row.setdefault("id", company.get("id", i))
+            row["scenario"] = scenario.get("name", j)
+            rows.append(row)
+    return rows
+
+
+def evaluate(rows, start, n_months):
+    """行の並びを計算し、1 行 1 つの dict（JSON にできる値だけ）のリストを返す。"""
+    cols = batch.evaluate_chunk(rows, start, n_months, with_cash=True)
+    # JSON として読めなかった行（"_error" 付き）もエラー行として返す
+    for i, row in enumerate(rows):
+        if row.get("_error"):
+            cols["error"][i] = row["_error"]
+    bad = np.array([bool(e) for e in cols["error"]])
+    cash = np.rint(np.nan_to_num(cols["cash"])).astype(np.int64).tolist()
+    values = {f: np.rint(np.nan_to_num(cols[f])).astype(np.int64).tolist() for f in YEN_FIELDS}
+    values.update({f: np.round(np.nan_to_num(cols[f]), 4).tolist() for f in RATIO_FIELDS if f in cols})
+    short = cols["short_month"].tolist()
+    out = []
+    for i, row in enumerate(rows):
+        if bad[i]:
+            result = {"id": cols["id"][i], "error": cols["error"][i]}
+            if "scenario" in row:
+                result["scenario"] = row["scenario"]
+            out.append(result)
+            continue
+        result = {"id": cols["id"][i]}
+        if "scenario" in row:
+            result["scenario"] = row["scenario"]
+        for f in values:
+            result[f] = values[f][i]
+        result["short_month"] = short[i] if short[i] >= 0 else None
+        for f in rules.LABEL_FIELDS:
+            result[f] = cols[f][i]
+        result["cf_line"] = cash[i]
+        out.append(result)
+    return out
+
+
+def _timing(phases):
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in phases.items())
+
+
+# ─────────────────────────────────────
+# HTTP（最小限の HTTP/1.1。keep-alive と chunked に対応）
+# ─────────────────────────────────────
+async def _read_body(reader, headers, limit):
+    """本文をまとめて読む（/v1/simulate 用）。"""
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        parts, size = [], 0
+        async for data in _iter_chunked(reader):
+            size += len(data)
+            if size > limit:
+                raise HttpError(413, "本文が大きすぎます。")
+            parts.append(data)
+        return b"".join(parts)
+    if "content-length" not in headers:
+        raise HttpError(411, "Content-Length が必要です。")
+    length = int(headers["content-length"])
+    if length > limit:
+        raise HttpError(413, "本文が大きすぎます。")
+    return await reader.readexactly(length)
+
+
+async def _iter_chunked(reader):
+    while True:
+        size_line = await reader.readuntil(b"\r\n")
+        size = int(size_line.split(b";", 1)[0].strip(), 16)
+        if size == 0:
+            # トレーラー（あれば）と最後の空行を読み捨てる
+            while (await reader.readuntil(b"\r\n")) != b"\r\n":
+                pass
+            return
+        yield await reader.readexactly(size)
+        await reader.readexactly(2)
+
+
+async def _iter_body(reader, headers):
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        async for data in _iter_chunked(reader):
+            yield data
+        return
+    if "content-length" not in headers:
+        raise HttpError(411, "Content-Length が必要です。")
+    remaining = int(headers["content-length"])
+    while remaining > 0:
+        data = await reader.read(min(READ_BLOCK, remaining))
+        if not data:
+            raise asyncio.IncompleteReadError(b"", remaining)
+        remaining -= len(data)
+        yield data
+
+
+async def _iter_lines(reader, headers):
+    tail = b""
+    async for data in _iter_body(reader, headers):
+        lines = (tail + data).split(b"\n")
+        tail = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield line
+    if tail.strip():
+        yield tail
+
+
+def _head(status, headers):
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}"]
+    lines += [f"{k}: {v}" for k, v in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def _send(writer, status, body, content_type="application/json; charset=utf-8", extra=None, keep_alive=True):
+    headers = {"Content-Type": content_type, "Content-Length": str(len(body)),
+               "Connection": "keep-alive" if keep_alive else "close", **(extra or {})}
+    writer.write(_head(status, headers) + body)
+
+
+# json.dumps に引数を渡すと呼ぶたびにエンコーダーを作り直すので、1 つを使い回す
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def _json(obj):
+    return _encoder.encode(obj).encode("utf-8")
+
+
+def _parse_lines(lines):
+    """JSON Lines の行の並びを dict の並びにする。
+
+    まとめて 1 回の json.loads で読み、読めない行が混じっていたときだけ 1 行ずつ読み直す。
+    """
+    try:
+        rows = json.loads(b"[" + b",".join(lines) + b"]")
+        if all(isinstance(row, dict) for row in rows) and len(rows) == len(lines):
+            return rows
+    except ValueError:
+        pass
+    rows = []
+    for line in lines:
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError("JSON オブジェクトではありません")
+        except ValueError as e:
+            row = {"_error": f"invalid json: {e}"}
+        rows.append(row)
+    return rows
+
+
+class ApiServer:
+    def __init__(self, n_months=engine.N_MONTHS, workers=None):
+        self.n_months = n_months
+        # 計算用のスレッド（既定は CPU 数。同時に抱える計算中の配列もこの数までに抑える）
+        self.executor = ThreadPoolExecutor(workers or os.cpu_count() or 1, thread_name_prefix="api-engine")
+        self.requests = 0
+        self.scenarios = 0
+        metrics.add_gauges("api", lambda: {"requests": self.requests, "scenarios": self.scenarios})
+
+    async def evaluate(self, rows, start, n_months):
+        """evaluate() を、大きな計算ならスレッドプールで動かす。"""
+        if len(rows) * n_months <= INLINE_ROWS * engine.N_MONTHS:
+            return evaluate(rows, start, n_months)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, evaluate, rows, start, n_months)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    _send(writer, 431, _json({"error": "ヘッダーが大きすぎます。"}), keep_alive=False)
+                    break
+                started = time.perf_counter()
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, target, version = (request_line.split(" ") + ["", ""])[:3]
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        k, v = line.split(":", 1)
+                        headers[k.strip().lower()] = v.strip()
+                keep_alive = (headers.get("connection", "").lower() != "close"
+                              and version == "HTTP/1.1")
+                url = urlsplit(target)
+                try:
+                    status = await self.route(method, url, headers, reader, writer, started, keep_alive)
+                except HttpError as e:
+                    status = e.status
+                    # 本文を読み残している可能性があるので、エラーのあとは接続を閉じる
+                    keep_alive = False
+                    _send(writer, status, _json({"error": str(e)}), keep_alive=False)
+                except (ValueError, asyncio.IncompleteReadError) as e:
+                    status = 400
+                    keep_alive = False
+                    _send(writer, status, _json({"error": f"リクエストを読めません: {e}"}), keep_alive=False)
+                self.requests += 1
+                metrics.count("api_requests_total", path=url.path if url.path in ROUTED_PATHS else "other",
+                              status=status)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        except Exception:
+            logger.exception("api handler failed")
+        finally:
+            writer.close()
+
+    async def route(self, method, url, headers, reader, writer, started, keep_alive):
+        path = url.path
+        if path == "/healthz":
+            _send(writer, 200, _json({"status": "ok"}), keep_alive=keep_alive)
+            return 200
+        if path == "/metrics":
+            _send(writer, 200, metrics.render_prometheus().encode("utf-8"),
+                  content_type="text/plain; version=0.0.4", keep_alive=keep_alive)
+            return 200
+        if path not in ("/v1/simulate", "/v1/batch"):
+            raise HttpError(404, f"{path} はありません。")
+        if method != "POST":
+            raise HttpError(405, "POST で送ってください。")
+        if path == "/v1/simulate":
+            return await self.simulate(url, headers, reader, writer, started, keep_alive)
+        return await self.batch(url, headers, reader, writer, started, keep_alive)
+
+    async def simulate(self, url, headers, reader, writer, started, keep_alive):
+        body = await _read_body(reader, headers, MAX_BODY_BYTES)
+        try:
+            payload = json.loads(body)
+        except ValueError as e:
+            raise HttpError(400, f"JSON として読めません: {e}") from None
+        rows = expand_rows(payload)
+        query = parse_qs(url.query)
+        n_months = _n_months(payload.get("n_months", query.get("n_months", [self.n_months])[0]))
+        phases = {"parse": time.perf_counter() - started}
+
+        t = time.perf_counter()
+        results = await self.evaluate(rows, 0, n_months)
+        phases["engine"] = time.perf_counter() - t
+        t = time.perf_counter()
+        out = _json({"n_months": n_months, "results": results})
+        phases["encode"] = time.perf_counter() - t
+        phases["total"] = time.perf_counter() - started
+
+        self.scenarios += len(rows)
+        metrics.count("api_scenarios_total", len(rows), path="/v1/simulate")
+        _send(writer, 200, out, keep_alive=keep_alive,
+              extra={"Server-Timing": _timing(phases), "X-Scenarios": str(len(rows))})
+        return 200
+
+    async def batch(self, url, headers, reader, writer, started, keep_alive):
+        n_months = _n_months(parse_qs(url.query).get("n_months", [self.n_months])[0])
+        if "content-length" not in headers and headers.get("transfer-encoding", "").lower() != "chunked":
+            raise HttpError(411, "Content-Length か Transfer-Encoding: chunked が必要です。")
+        writer.write(_head(200, {
+            "Content-Type": "application/x-ndjson; charset=utf-8", "Transfer-Encoding": "chunked",
+            "Trailer": "Server-Timing, X-Scenarios", "Connection": "keep-alive" if keep_alive else "close",
+        }))
+        phases = {"parse": 0.0, "engine": 0.0, "encode": 0.0}
+        done = 0
+
+        async def flush(lines):
+            nonlocal done
+            t = time.perf_counter()
+            rows = _parse_lines(lines)
+            t1 = time.perf_counter()
+            results = await self.evaluate(rows, done, n_months)
+            t2 = time.perf_counter()
+            data = "\n".join(map(_encoder.encode, results)).encode("utf-8") + b"\n"
+            phases["parse"] += t1 - t
+            phases["engine"] += t2 - t1
+            phases["encode"] += time.perf_counter() - t2
+            writer.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            done += len(rows)
+            # 相手が読むのを待つ（遅いクライアントでもサーバー側に結果を溜め込まない）
+            await writer.drain()
+
+        lines = []
+        try:
+            async for line in _iter_lines(reader, headers):
+                lines.append(line)
+                if len(lines) >= BATCH_CHUNK:
+                    await flush(lines)
+                    lines = []
+        except (ValueError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            # 応答はもう流し始めているので、エラーは返さず接続を切る（相手には途中までの結果が届く）
+            raise ConnectionAbortedError(f"batch body broken: {e}") from e
+        if lines:
+            await flush(lines)
+        phases["total"] = time.perf_counter() - started
+
+        self.scenarios += done
+        metrics.count("api_scenarios_total", done, path="/v1/batch")
+        writer.write(f"0\r\nServer-Timing: {_timing(phases)}\r\nX-Scenarios: {done}\r\n\r\n".encode("ascii"))
+        return 200
+
+
+async def serve(host="127.0.0.1", port=8765, n_months=engine.N_MONTHS, ready=None):
+    server = ApiServer(n_months)
+    srv = await asyncio.start_server(server.handle, host, port, limit=MAX_HEADER_BYTES)
+    address = srv.sockets[0].getsockname()
+    print(f"AI-CFO API: http://{address[0]}:{address[1]}", flush=True)
+    if ready is not None:
+        ready(address)
+    async with srv:
+        await srv.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI-CFO 計算 API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="0 なら空いているポートを使う")
+    parser.add_argument("--months", type=int, default=engine.N_MONTHS, help="n_months を省略したときの予測期間")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.months))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
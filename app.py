@@ -5,10 +5,30 @@ GAIS AI-CFO（未来会計シミュレーター）
 Gemini 2.5 Flash による AI-CFO 診断付き。
 """
 
+import html
+import time
+import uuid
+from functools import lru_cache
+
 import streamlit as st
-import plotly.graph_objects as go
 import numpy as np
-import google.generativeai as genai
+
+import cash_events
+import charts
+import daily
+import diagnosis
+import diagnosis_cache
+import engine
+import grid_cache
+import llm_client
+import metrics
+import montecarlo
+import rules
+import scenario_store
+import seasonal
+import sensitivity
+import solver
+from formatting import jp_format
 
 # ─────────────────────────────────────
 # ページ設定
@@ -20,6 +40,17 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
+# 計測（AI_CFO_METRICS=1 で有効。URL に ?debug=1 を付けるとこのセッションだけ記録し、内訳を表示）
+if "metrics_session" not in st.session_state:
+    st.session_state["metrics_session"] = uuid.uuid4().hex[:8]
+st.session_state["metrics_debug"] = st.query_params.get("debug") == "1"
+metrics.begin_rerun("full", st.session_state["metrics_session"], force=st.session_state["metrics_debug"])
+
+# 保存したシナリオの持ち主（URL の ?ws= を残しておけば、開き直しても同じシナリオを使える）
+if "scenario_owner" not in st.session_state:
+    st.session_state["scenario_owner"] = st.query_params.get("ws") or uuid.uuid4().hex[:12]
+    st.query_params["ws"] = st.session_state["scenario_owner"]
+
 # ─────────────────────────────────────
 # ヘルパー関数
 # ─────────────────────────────────────
@@ -29,16 +60,8 @@ def get_step_size(val):
     if val >= 1_000_000:   return 10_000
     return 1_000
 
-def jp_format(val):
-    abs_val = abs(val)
-    if abs_val >= 100_000_000:
-        return f"{val/100_000_000:.1f}億円"
-    elif abs_val >= 10_000:
-        return f"{val/10_000:.0f}万円"
-    else:
-        return f"{val:,.0f}円"
-
-# Helper: Generate Tooltip HTML
+# Helper: Generate Tooltip HTML（同じ説明文の SVG は 1 回だけ組み立てる）
+@lru_cache(maxsize=256)
 def get_tooltip_html(help_text):
     if not help_text:
         return ""
@@ -52,6 +75,7 @@ def get_tooltip_html(help_text):
     </div>'''
 
 # Helper function for Custom Input Label
+@lru_cache(maxsize=64)
 def custom_label(label, help_text=""):
     tooltip_html = get_tooltip_html(help_text)
     return f'''<div class="input-label-row">{label}{tooltip_html}</div>'''
@@ -80,6 +104,42 @@ def custom_metric(label, value, sub="", help_text="", color_type="neutral"):
     </div>
     '''
 
+# シナリオ比較表（st.dataframe より軽いので HTML で組む。名前は利用者の入力なのでエスケープする）
+# STEP 2 のスライダーの範囲（逆算の結果がこれを超えるときは「制約なし」と表示する）
+SALES_CHANGE_RANGE = (-50, 50)
+COST_CUT_RANGE = (-20.0, 20.0)
+
+SCENARIO_COLUMNS = ("シナリオ", "売上変化", "原価率", "固定費増減", "達成期間",
+                    "月次営業利益", "安全余裕率", "最低預金残高", "資金ショート")
+
+def scenario_row(name, levers, kpis):
+    # levers はレバー、kpis は scenario_store.KPI_FIELDS の値
+    short_month = int(kpis["short_month"])
+    short_class = ' class="metric-value-negative"' if short_month >= 0 else ""
+    return (
+        f"<tr><td>{html.escape(name)}</td>"
+        f"<td>{levers['sales_change']:+.0f}%</td><td>{levers['cost_cut']:+.1f}%</td>"
+        f"<td>{jp_format(levers['invest'])}</td><td>{levers['ramp_months']:.0f}ヶ月</td>"
+        f"<td>{jp_format(kpis['target_op_profit'])}</td><td>{kpis['safety_margin_ratio']:.1f}%</td>"
+        f"<td{short_class}>{jp_format(kpis['min_cash'])}</td>"
+        f"<td{short_class}>{f'{short_month}ヶ月目' if short_month >= 0 else 'なし'}</td></tr>"
+    )
+
+def scenario_table(rows, columns=SCENARIO_COLUMNS):
+    head = "".join(f"<th>{c}</th>" for c in columns)
+    return f'<table class="scenario-table"><thead><tr>{head}</tr></thead><tbody>{"".join(rows)}</tbody></table>'
+
+# 感度分析の表の 1 行（entry は sensitivity.analyze の出力 1 つ分、i は入力の添字）
+def sensitivity_row(entry, i):
+    elasticity = entry["elasticity"][i]
+    low, high = entry["low"][i] - entry["base"], entry["high"][i] - entry["base"]
+    return (
+        f"<tr><td>{sensitivity.INPUT_LABELS[sensitivity.INPUTS[i]]}</td>"
+        f"<td>{'+' if low > 0 else ''}{jp_format(low)}</td>"
+        f"<td>{'+' if high > 0 else ''}{jp_format(high)}</td>"
+        f"<td>{'―' if np.isnan(elasticity) else f'{elasticity:+.2f}'}</td></tr>"
+    )
+
 # ─────────────────────────────────────
 # 回帰コールバック（スライダー同期）
 # ─────────────────────────────────────
@@ -103,6 +163,76 @@ def update_sales_from_number():
     st.session_state["sales_slider"] = st.session_state["sales_number"]
 
 
+# ─────────────────────────────────────
+# レバーグリッド・キャッシュ（全セッション共有）
+# ─────────────────────────────────────
+@st.cache_resource
+def get_lever_cache():
+    cache = grid_cache.LeverGridCache()
+    metrics.add_gauges("lever_cache", cache.stats)
+    return cache
+
+lever_cache = get_lever_cache()
+
+
+@st.cache_resource
+def get_diagnosis_cache():
+    cache = diagnosis_cache.DiagnosisCache()
+    metrics.add_gauges("diagnosis_cache", cache.stats)
+    return cache
+
+diag_cache = get_diagnosis_cache()
+
+
+@st.cache_resource
+def get_scenario_store():
+    return scenario_store.ScenarioStore()
+
+scenario_db = get_scenario_store()
+
+
+def save_scenario(owner, levers):
+    try:
+        scenario_db.save(owner, st.session_state.get("scenario_name", ""), levers)
+    except ValueError as e:
+        st.session_state["scenario_error"] = str(e)
+
+
+@st.cache_resource
+def get_scenario_memo():
+    memo = scenario_store.ResultMemo()
+    metrics.add_gauges("scenario_memo", memo.stats)
+    return memo
+
+scenario_memo = get_scenario_memo()
+
+
+@st.cache_resource
+def get_ledger_cache():
+    # pandas を読み込むので、初めてファイルが選ばれたときに import する（起動時間を増やさない）
+    import ledger_import
+    cache = ledger_import.AggregateCache()
+    metrics.add_gauges("ledger_cache", cache.stats)
+    return cache
+
+
+def apply_ledger(values):
+    for field, value in values.items():
+        st.session_state[field] = value
+
+
+def apply_ledger_history(series):
+    st.session_state["season_history"] = "\n".join(f"{v:.0f}" for v in series)
+    st.session_state["season_mode"] = True
+
+
+@st.cache_resource
+def start_metrics_exporter():
+    return metrics.start_exporter()
+
+start_metrics_exporter()
+
+
 # ─────────────────────────────────────
 # カスタム CSS
 # ─────────────────────────────────────
@@ -257,6 +387,16 @@ html, body, [class*="css"] {
     border-bottom: 1px dashed #CBD5E1; padding-bottom: 0.3rem;
 }
 
+/* ── シナリオ比較表 ── */
+.scenario-table { width: 100%; border-collapse: collapse; font-size: 0.85rem; }
+.scenario-table th {
+    background: #F1F5F9; color: #475569; font-weight: 600;
+    padding: 6px 8px; text-align: right; border-bottom: 2px solid #CBD5E1;
+}
+.scenario-table td { padding: 5px 8px; text-align: right; border-bottom: 1px solid #E2E8F0; }
+.scenario-table th:first-child, .scenario-table td:first-child { text-align: left; }
+.scenario-table tbody tr:first-child { font-weight: 700; background: #F8FAFC; }
+
 /* ── 入力ラベル ── */
 div[data-testid="stNumberInput"] label { font-weight: 600; color: #475569; }
 .stSlider label { font-weight: 600; color: #475569; }
@@ -373,13 +513,70 @@ with st.sidebar:
             st.session_state["invest_number"] = 0
             st.rerun()
     st.markdown("---")
+    st.header("会計データ取り込み")
+    ledger_file = st.file_uploader(
+        "仕訳帳・試算表（CSV）", type=["csv", "txt"], key="ledger_file",
+        help="会計ソフトから書き出した仕訳帳・試算表（Shift-JIS / UTF-8、複数年分可）から STEP 1 の数値を求めます。")
+    if ledger_file is not None:
+        import ledger_import
+        ledger_cache = get_ledger_cache()
+        if st.session_state.get("ledger_file_id") != ledger_file.file_id:
+            # 再実行のたびにハッシュを取り直さないよう、アップロード 1 回につき 1 度だけ読む
+            try:
+                st.session_state["ledger_agg"] = ledger_cache.load(ledger_file)
+                st.session_state["ledger_error"] = None
+            except ValueError as e:
+                st.session_state["ledger_agg"] = None
+                st.session_state["ledger_error"] = f"読み込めませんでした: {e}"
+            st.session_state["ledger_file_id"] = ledger_file.file_id
+        agg = st.session_state.get("ledger_agg")
+        if st.session_state.get("ledger_error"):
+            st.error(st.session_state["ledger_error"])
+        elif agg is not None:
+            ledger_months = st.select_slider("平均する月数（直近）", options=[3, 6, 12, 24, 36], value=12,
+                                             key="ledger_months")
+            with st.expander("勘定科目の割り当て"):
+                mapping_text = st.text_area(
+                    "項目 = 科目名またはコード（* で前方・後方一致）",
+                    value=ledger_import.format_mapping(ledger_import.load_mapping()),
+                    key="ledger_mapping", height=240)
+                period_months = st.number_input(
+                    "期間の列がない試算表の月数", min_value=1, max_value=36, value=12, key="ledger_period")
+            try:
+                mapping = ledger_import.parse_mapping(mapping_text)
+            except ValueError as e:
+                st.error(str(e))
+                mapping = None
+            if mapping is not None:
+                summary = ledger_import.summarize(agg, mapping, months=ledger_months, period_months=period_months)
+                kind = "仕訳帳" if agg["kind"] == "journal" else "試算表"
+                period = f"{summary['period'][0]}〜{summary['period'][1]}" if summary["period"] else "期間指定なし"
+                st.caption(f"{kind}・{agg['rows']:,} 行（{period}、直近 {summary['months']}ヶ月平均）")
+                st.markdown("  \n".join(
+                    f"{ledger_import.FIELD_LABELS[f]}: **{jp_format(summary[f])}**" for f in ledger_import.FIELDS))
+                if summary["unmapped"]:
+                    st.caption("割り当てのない科目: " + "、".join(summary["unmapped"][:8])
+                               + (" ほか" if len(summary["unmapped"]) > 8 else ""))
+                st.button("この数値を STEP 1 に反映", key="ledger_apply", use_container_width=True,
+                          on_click=apply_ledger, args=({f: summary[f] for f in ledger_import.FIELDS},))
+                monthly = summary["monthly"]
+                if monthly is not None and len(monthly["labels"]) >= seasonal.MIN_MONTHS:
+                    st.button("売上の月次推移を季節性に使う", key="ledger_season", use_container_width=True,
+                              on_click=apply_ledger_history,
+                              args=(monthly["revenue"][-seasonal.MAX_MONTHS:].tolist(),))
+    st.markdown("---")
     st.header("ストレステスト")
     if st.button("売上 -30% を検証", key="stress_test", use_container_width=True):
         st.session_state["sales_change"] = -30
         st.session_state["sales_slider"] = -30 
         st.session_state["sales_number"] = -30
         st.rerun()
+    st.markdown("---")
+    st.header("高速モード")
+    st.toggle("スライダー操作を事前計算で高速化", value=True, key="grid_mode",
+              help="STEP 1 の数値が決まると、スライダーの全組み合わせをバックグラウンドで計算して保持します。")
 
+metrics.lap("page_setup")
 
 # ─────────────────────────────────────
 # STEP 1: 現状の数値入力
@@ -451,343 +648,805 @@ with col_bs:
     if site_parts:
         st.info("  \n".join(site_parts))
 
+# 月次実績からの季節性（任意）
+with st.expander("📈 月次実績から季節性を反映する（任意）"):
+    st.toggle("売上の季節変動を資金繰り予測に反映する", key="season_mode",
+              help="過去の月次売上から「水準 + 傾き + 月ごとの季節効果」を当てはめ、一定の月間売上の代わりに使います。")
+    st.text_area(
+        "月次売上の実績（古い順・1 行に 1ヶ月、12〜60ヶ月分。最後の行が先月）",
+        key="season_history", height=160,
+        placeholder="4200000\n3900000\n5100000\n...")
+    season_model = None
+    if st.session_state.get("season_mode"):
+        try:
+            history = seasonal.parse_history(st.session_state.get("season_history", ""))
+        except ValueError as e:
+            st.warning(str(e))
+        else:
+            season_model = seasonal.fit(history)
+            index = seasonal.seasonal_index(season_model)[0]
+            peak, low = int(index.argmax()), int(index.argmin())
+            trend = "あり" if history.size >= seasonal.MIN_TREND_MONTHS else "なし（24ヶ月以上で推定）"
+            st.caption(
+                f"{history.size}ヶ月分から推定: 直近の水準 {jp_format(float(season_model['level'][0]))}・"
+                f"傾き {jp_format(round(float(season_model['trend'][0])))}/月（{trend}）。"
+                f"季節の山は {peak + 1}ヶ月後（{index[peak]:.0%}）、谷は {low + 1}ヶ月後（{index[low]:.0%}）。"
+                "感度分析・日次予測・モンテカルロは一定の月間売上で計算します。")
+    st.session_state["season_model"] = season_model
+
+# 借入金の返済・当座貸越（任意）
+with st.expander("🏦 借入金・当座貸越（任意）"):
+    st.caption("借入金の毎月の返済（元金 + 利息）を資金繰りに含め、残高が 0 円を下回る月は当座貸越の枠まで自動で借ります。")
+    b1, b2, b3 = st.columns(3)
+    with b1:
+        st.number_input("借入金残高", min_value=0, step=bs_step, value=0, format="%d", key="loan_balance")
+        st.number_input("当座貸越の枠（0 = なし）", min_value=0, step=bs_step, value=0, format="%d", key="credit_line")
+    with b2:
+        st.number_input("毎月の元金返済額", min_value=0, step=max(10_000, bs_step // 10), value=0, format="%d",
+                        key="loan_principal")
+        st.number_input("当座貸越の金利（年 %）", min_value=0.0, max_value=20.0, value=2.0, step=0.1,
+                        key="overdraft_rate")
+    with b3:
+        st.number_input("借入金の金利（年 %）", min_value=0.0, max_value=20.0, value=1.5, step=0.1, key="loan_rate")
+    financing = {f: float(st.session_state[f]) for f in
+                 ("loan_balance", "loan_principal", "loan_rate", "credit_line", "overdraft_rate")}
+    if financing["loan_principal"] > 0 and financing["loan_balance"] > 0:
+        months_left = -(-financing["loan_balance"] // financing["loan_principal"])
+        st.caption(f"完済まで {months_left:.0f}ヶ月（この期間の返済は元金均等で計算します）")
+st.session_state["financing"] = financing
+
+# 賞与・税金・設備投資の予定（任意）
+with st.expander("📅 賞与・税金・設備投資の予定（任意）"):
+    events_start = cash_events.default_start()
+    st.caption(f"毎月の資金繰りとは別に、決まった月にまとめて出ていくお金を予測に含めます（期首は {events_start}）。")
+    e1, e2, e3 = st.columns(3)
+    with e1:
+        st.number_input("賞与（1 回あたり・7月と12月）", min_value=0, step=fixed_step, value=0, format="%d",
+                        key="bonus_amount")
+        st.number_input("設備投資の一括払い（固定費の増加の何ヶ月分）", min_value=0, max_value=60, value=0, step=1,
+                        key="capex_months",
+                        help="STEP 2 の固定費の増加（投資）に見合う設備代などを、期首から指定の月に一括で払います。")
+        st.number_input("設備投資を払う月（期首から何ヶ月目）", min_value=1, max_value=60, value=1, step=1,
+                        key="capex_month")
+    with e2:
+        st.selectbox("決算月", list(range(1, 13)), index=2, format_func=lambda m: f"{m}月", key="fiscal_end")
+        st.checkbox("中間納付あり（前年の半分を 6ヶ月後に納める）", key="tax_interim")
+    with e3:
+        st.number_input("法人税等（年額）", min_value=0, step=fixed_step, value=0, format="%d", key="corporate_tax")
+        st.number_input("消費税（年額）", min_value=0, step=fixed_step, value=0, format="%d", key="consumption_tax")
+    st.text_area(
+        "その他の予定（1 行に 1 件: 年月[-日]・金額（マイナスが支払い）・繰り返しの月数（12 で毎年、省略で 1 回））",
+        key="extra_events", height=100, placeholder="2027-03-15, -2,000,000\n2027-04, -600,000, 12")
+    try:
+        extra_events = cash_events.parse(st.session_state.get("extra_events", ""))
+    except ValueError as e:
+        st.warning(str(e))
+        extra_events = cash_events.empty()
+    # 設備投資は STEP 2 の固定費の増加で決まるので、それ以外をここで組み立てておく
+    st.session_state["events"] = cash_events.combine(
+        cash_events.bonus(st.session_state["bonus_amount"], events_start),
+        cash_events.taxes(st.session_state["corporate_tax"], st.session_state["consumption_tax"],
+                          st.session_state["fiscal_end"], events_start, interim=st.session_state["tax_interim"]),
+        extra_events)
+    st.session_state["events_start"] = events_start
+    # ウィジェットのキーはフラグメントだけの再実行では読めないので、値を別のキーに写しておく
+    st.session_state["capex"] = {"months": int(st.session_state["capex_months"]),
+                                 "month": int(st.session_state["capex_month"])}
+
+metrics.lap("inputs")
 
 # ─────────────────────────────────────
-# STEP 2: シナリオ設定
+# STEP 2 以降（シナリオ・結果・AI診断）
 # ─────────────────────────────────────
-st.markdown('<div class="section-title"><span class="section-badge">STEP 2</span> シナリオ設定（感度分析）</div>', unsafe_allow_html=True)
-st.markdown('<span style="color:#d32f2f; font-weight:bold; font-size:0.9rem;">⚠️ 売上が急増する際、運転資金の増加によって一時的に資金が減るリスクがあります。</span>', unsafe_allow_html=True)
-
-s1, s2, s3, s4 = st.columns(4, gap="medium")
-slider_invest_step = max(10_000, fixed_step // 10)
-
-# スライダーと入力欄の同期（Invest & Sales）
-
-with s1:
-    st.markdown("**固定費の増減（月額）**")
-    st.slider(
-        "invest_slider_hidden", # ラベル非表示（Markdownで自作）
-        min_value=-5_000_000, max_value=5_000_000, 
-        value=st.session_state.get("invest", 0), 
-        step=slider_invest_step,
-        key="invest_slider", on_change=update_invest_from_slider,
-        label_visibility="collapsed"
-    )
-    st.number_input(
-        "金額指定", 
-        value=st.session_state.get("invest", 0), 
-        step=slider_invest_step,
-        key="invest_number", on_change=update_invest_from_number,
-        label_visibility="collapsed"
-    )
-    if st.session_state.get("invest", 0) != 0: 
-        st.markdown(f"**変化額: {jp_format(st.session_state['invest'])}**")
-
-with s2:
-    st.markdown("**仕入・外注単価の変動**")
-    cost_cut = st.slider(
-        "label_cost",
-        min_value=-20.0, max_value=20.0, value=0.0, step=0.5,
-        format="%+.1f%%",
-        help="原価率の変化（－：改善、＋：悪化）",
+# スライダー操作ではこのフラグメントだけを再実行する。
+# CSS・ヘッダー・サイドバー・STEP 1 は再実行も再送信もされない。
+def _metrics_context():
+    return st.session_state["metrics_session"], st.session_state["metrics_debug"]
+
+
+@st.fragment
+@metrics.timed_fragment(_metrics_context)
+def scenario_section():
+    # ─────────────────────────────────────
+    # STEP 2: シナリオ設定
+    # ─────────────────────────────────────
+    st.markdown('<div class="section-title"><span class="section-badge">STEP 2</span> シナリオ設定（感度分析）</div>', unsafe_allow_html=True)
+    st.markdown('<span style="color:#d32f2f; font-weight:bold; font-size:0.9rem;">⚠️ 売上が急増する際、運転資金の増加によって一時的に資金が減るリスクがあります。</span>', unsafe_allow_html=True)
+
+    s1, s2, s3, s4 = st.columns(4, gap="medium")
+    slider_invest_step = max(10_000, fixed_step // 10)
+
+    # スライダーと入力欄の同期（Invest & Sales）
+
+    with s1:
+        st.markdown("**固定費の増減（月額）**")
+        st.slider(
+            "invest_slider_hidden", # ラベル非表示（Markdownで自作）
+            min_value=-5_000_000, max_value=5_000_000, 
+            value=st.session_state.get("invest", 0), 
+            step=slider_invest_step,
+            key="invest_slider", on_change=update_invest_from_slider,
+            label_visibility="collapsed"
+        )
+        st.number_input(
+            "金額指定", 
+            value=st.session_state.get("invest", 0), 
+            step=slider_invest_step,
+            key="invest_number", on_change=update_invest_from_number,
+            label_visibility="collapsed"
+        )
+        if st.session_state.get("invest", 0) != 0: 
+            st.markdown(f"**変化額: {jp_format(st.session_state['invest'])}**")
+
+    with s2:
+        st.markdown("**仕入・外注単価の変動**")
+        cost_cut = st.slider(
+            "label_cost",
+            min_value=COST_CUT_RANGE[0], max_value=COST_CUT_RANGE[1], value=0.0, step=0.5,
+            format="%+.1f%%",
+            help="原価率の変化（－：改善、＋：悪化）",
+            label_visibility="collapsed"
+        )
+
+    with s3:
+        st.markdown("**売上目標の変化**")
+        st.slider(
+            "sales_slider_hidden",
+            min_value=SALES_CHANGE_RANGE[0], max_value=SALES_CHANGE_RANGE[1], 
+            value=st.session_state.get("sales_change", 0),
+            step=1, format="%+d%%",
+            key="sales_slider", on_change=update_sales_from_slider,
+            label_visibility="collapsed"
+        )
+        st.number_input(
+            "sales_number_hidden",
+            min_value=SALES_CHANGE_RANGE[0], max_value=SALES_CHANGE_RANGE[1], 
+            value=st.session_state.get("sales_change", 0),
+            step=1, 
+            key="sales_number", on_change=update_sales_from_number,
+            label_visibility="collapsed"
+        )
+
+        target_rev_preview = st.session_state["revenue"] * (1 + st.session_state.get("sales_change", 0) / 100)
+        st.markdown(f"**目標: {jp_format(target_rev_preview)}**")
+
+    with s4:
+        st.markdown("**目標達成期間**")
+        ramp_months = st.slider(
+            "label_ramp",
+            min_value=1, max_value=6, value=1, step=1,
+            format="%dヶ月",
+            help="売上が目標に到達するまでの期間",
+            label_visibility="collapsed"
+        )
+
+    st.markdown("**予測期間**")
+    horizon = st.select_slider(
+        "horizon_hidden",
+        options=[6, 12, 18, 24, 36, 48, 60], value=engine.N_MONTHS,
+        format_func=lambda m: f"{m}ヶ月",
+        help="資金繰りを何ヶ月先まで予測するか",
         label_visibility="collapsed"
     )
-
-with s3:
-    st.markdown("**売上目標の変化**")
-    st.slider(
-        "sales_slider_hidden",
-        min_value=-50, max_value=50, 
-        value=st.session_state.get("sales_change", 0),
-        step=1, format="%+d%%",
-        key="sales_slider", on_change=update_sales_from_slider,
-        label_visibility="collapsed"
+    metrics.lap("scenario_inputs")
+
+    # ─────────────────────────────────────
+    # 計算ロジック
+    # ─────────────────────────────────────
+    rev = st.session_state["revenue"]
+    cgs = st.session_state["cogs"]
+    fxd = st.session_state["fixed_cost"]
+    csh = st.session_state["cash"]
+    rec = st.session_state["receivables"]
+    pay = st.session_state["payables"]
+    ind = st.session_state["industry"]
+    invest = st.session_state.get("invest", 0)
+    sales_change = st.session_state.get("sales_change", 0)
+
+    base = {f: st.session_state[f] for f in grid_cache.BASE_FIELDS}
+    season_model = st.session_state.get("season_model")
+    revenue_base = seasonal.baseline(season_model, horizon) if season_model is not None else None
+    result = None
+    if st.session_state.get("grid_mode", True) and revenue_base is None:
+        result = lever_cache.lookup(base, invest, cost_cut, sales_change, ramp_months, n_months=horizon)
+    if result is None:
+        result = engine.project(
+            rev, cgs, fxd, csh, rec, pay,
+            sales_change=sales_change, cost_cut=cost_cut, invest=invest, ramp_months=ramp_months,
+            n_months=horizon, revenue_base=revenue_base,
+        )
+
+    # 賞与・税金・設備投資の予定と借入金の返済・当座貸越は全シナリオ共通の後処理なので、
+    # グリッドの結果にもそのまま当てはめる（予定 → 借入・貸越の順）
+    events_start = st.session_state["events_start"]
+    capex = st.session_state["capex"]
+    events = cash_events.combine(
+        st.session_state["events"],
+        cash_events.capex(max(invest, 0) * capex["months"], events_start, capex["month"]))
+    if len(events):
+        result = cash_events.apply(result, events, events_start)
+
+    financing = st.session_state["financing"]
+    has_financing = financing["loan_balance"] > 0 or financing["credit_line"] > 0
+    pre_financing_cash = result["cash"]
+    if has_financing:
+        result = engine.apply_financing(result, **financing)
+
+    if st.session_state.get("grid_mode", True):
+        cache_stats = lever_cache.stats()
+        st.caption(
+            f"⚡ 高速モード: ヒット {cache_stats['hits']} / ミス {cache_stats['misses']}"
+            f"・保持 {cache_stats['entries']}件（{cache_stats['bytes'] / 1024 / 1024:.1f}MB）"
+        )
+
+    m_rec  = float(result["m_rec"][0])
+    m_pay  = float(result["m_pay"][0])
+
+    target_rev    = float(result["target_rev"][0])
+    sim_v_rate    = float(result["sim_v_rate"][0])
+
+    bep_rev = float(result["bep_rev"][0])
+
+    target_op_profit = float(result["target_op_profit"][0])
+    safety_margin_ratio = float(result["safety_margin_ratio"][0])
+    invest_payback_sales = float(result["invest_payback_sales"][0])
+
+    months_label = [f"{i}ヶ月" for i in range(horizon + 1)]
+    cf_line = result["cash"][0].tolist()
+
+    min_cash = float(result["min_cash"][0])
+    short_month = int(result["short_month"][0]) if result["short_month"][0] >= 0 else None
+    months_sales_ratio = float(result["months_sales_ratio"][0])
+    metrics.lap("calc")
+
+    # ─────────────────────────────────────
+    # RESULT: 診断結果
+    # ─────────────────────────────────────
+    st.markdown('<div class="section-title"><span class="section-badge">RESULT</span> 診断結果</div>', unsafe_allow_html=True)
+
+
+
+    # KPIカード
+    k1, k2, k3, k4, k5 = st.columns(5)
+    with k1:
+        st.markdown(custom_metric(
+            label="月次営業利益（目標時）",
+            value=jp_format(target_op_profit),
+            sub="",
+            help_text=f"目標売上 {jp_format(target_rev)} の時の営業利益",
+            color_type="positive" if target_op_profit >= 0 else "negative"
+        ), unsafe_allow_html=True)
+
+    with k2:
+        st.markdown(custom_metric(
+            label="損益分岐点売上高",
+            value=jp_format(bep_rev),
+            sub="",
+            help_text=f"売上 {jp_format(bep_rev)} で収支均衡（利益ゼロ）",
+            color_type="neutral"
+        ), unsafe_allow_html=True)
+
+    with k3:
+        st.markdown(custom_metric(
+            label="安全余裕率",
+            value=f"{safety_margin_ratio:.1f}%",
+            sub=f"売上{safety_margin_ratio:.1f}%減まで黒字" if safety_margin_ratio > 0 else "赤字水準",
+            help_text="現在の売上がどれだけ減っても赤字にならないかの割合",
+            color_type="positive" if safety_margin_ratio > 0 else "negative"
+        ), unsafe_allow_html=True)
+
+    with k4:
+        sub_text = f"{invest_payback_sales/10000:.0f}万円の売上が必要" if invest > 0 else ""
+        st.markdown(custom_metric(
+            label="投資回収に必要な売上",
+            value=jp_format(invest_payback_sales),
+            sub=sub_text,
+            help_text="増えた固定費（投資）を賄うために必要な追加売上高",
+            color_type="neutral"
+        ), unsafe_allow_html=True)
+
+    with k5:
+        st.markdown(custom_metric(
+            label=f"最低預金残高（{horizon}ヶ月間）",
+            value=jp_format(min_cash),
+            sub=("資金ショート警告" if min_cash < 0
+                 else f"うち当座貸越 {jp_format(float(result['peak_overdraft'][0]))}"
+                 if has_financing and result["peak_overdraft"][0] > 0 else ""),
+            help_text=f"今後{horizon}ヶ月で最も預金が減るタイミングの残高",
+            color_type="positive" if min_cash > 0 else "negative"
+        ), unsafe_allow_html=True)
+
+
+    metrics.lap("kpi_html")
+
+    # 目標逆算（ゴールシーク）
+    goal = solver.solve(
+        rev, cgs, fxd, csh, rec, pay,
+        sales_change=sales_change, cost_cut=cost_cut, invest=invest, ramp_months=ramp_months,
+        n_months=horizon, financing=financing if has_financing else None,
+        events=st.session_state["events"], start=events_start,
+        capex_months=capex["months"], capex_month=capex["month"], revenue_base=revenue_base,
     )
-    st.number_input(
-        "sales_number_hidden",
-        min_value=-50, max_value=50, 
-        value=st.session_state.get("sales_change", 0),
-        step=1, 
-        key="sales_number", on_change=update_sales_from_number,
-        label_visibility="collapsed"
-    )
-    
-    target_rev_preview = st.session_state["revenue"] * (1 + st.session_state.get("sales_change", 0) / 100)
-    st.markdown(f"**目標: {jp_format(target_rev_preview)}**")
-
-with s4:
-    st.markdown("**目標達成期間**")
-    ramp_months = st.slider(
-        "label_ramp",
-        min_value=1, max_value=6, value=1, step=1,
-        format="%dヶ月",
-        help="売上が目標に到達するまでの期間",
-        label_visibility="collapsed"
-    )
-
-
-# ─────────────────────────────────────
-# 計算ロジック
-# ─────────────────────────────────────
-rev = st.session_state["revenue"]
-cgs = st.session_state["cogs"]
-fxd = st.session_state["fixed_cost"]
-csh = st.session_state["cash"]
-rec = st.session_state["receivables"]
-pay = st.session_state["payables"]
-ind = st.session_state["industry"]
-invest = st.session_state.get("invest", 0)
-sales_change = st.session_state.get("sales_change", 0)
-
-v_rate = cgs / rev if rev > 0 else 0.0
-m_rec  = rec / rev if rev > 0 else 0.0
-m_pay  = pay / cgs if cgs > 0 else 0.0
-
-target_rev    = rev * (1 + sales_change / 100)
-sim_v_rate    = v_rate * (1 + cost_cut / 100)
-sim_fxd       = fxd + invest
-
-mg_rate = max(1.0 - sim_v_rate, 0.001)
-bep_rev  = sim_fxd / mg_rate
-bep_diff = target_rev - bep_rev
-
-target_op_profit = target_rev - (target_rev * sim_v_rate) - sim_fxd
-safety_margin_ratio = (bep_diff / target_rev * 100) if target_rev > 0 else 0.0
-invest_payback_sales = invest / mg_rate if invest > 0 and mg_rate > 0 else 0.0
-
-months_label = [f"{i}ヶ月" for i in range(7)]
-cf_line = [csh]
-
-current_act_csh = csh
-prev_ar_balance = rec
-prev_ap_balance = pay
-
-for i in range(1, 7):
-    if ramp_months <= 1:
-        month_rev = target_rev
-    else:
-        progress = min(i / ramp_months, 1.0)
-        month_rev = rev + (target_rev - rev) * progress
-    
-    month_cgs = month_rev * sim_v_rate
-    month_op_profit = month_rev - month_cgs - sim_fxd
-    
-    curr_ar_balance = month_rev * m_rec
-    curr_ap_balance = month_cgs * m_pay
-    
-    delta_ar = curr_ar_balance - prev_ar_balance
-    delta_ap = curr_ap_balance - prev_ap_balance
-    
-    month_cash_flow = month_op_profit - delta_ar + delta_ap
-    
-    current_act_csh += month_cash_flow
-    cf_line.append(current_act_csh)
-    
-    prev_ar_balance = curr_ar_balance
-    prev_ap_balance = curr_ap_balance
-
-min_cash = min(cf_line)
-short_month = next((i for i, x in enumerate(cf_line) if x < 0), None)
-months_sales_ratio = min_cash / target_rev if target_rev > 0 else 0
-
-# ─────────────────────────────────────
-# RESULT: 診断結果
-# ─────────────────────────────────────
-st.markdown('<div class="section-title"><span class="section-badge">RESULT</span> 診断結果</div>', unsafe_allow_html=True)
-
-
-
-# KPIカード
-k1, k2, k3, k4, k5 = st.columns(5)
-with k1:
-    st.markdown(custom_metric(
-        label="月次営業利益（目標時）",
-        value=jp_format(target_op_profit),
-        sub="",
-        help_text=f"目標売上 {jp_format(target_rev)} の時の営業利益",
-        color_type="positive" if target_op_profit >= 0 else "negative"
-    ), unsafe_allow_html=True)
-
-with k2:
-    st.markdown(custom_metric(
-        label="損益分岐点売上高",
-        value=jp_format(bep_rev),
-        sub="",
-        help_text=f"売上 {jp_format(bep_rev)} で収支均衡（利益ゼロ）",
-        color_type="neutral"
-    ), unsafe_allow_html=True)
-
-with k3:
-    st.markdown(custom_metric(
-        label="安全余裕率",
-        value=f"{safety_margin_ratio:.1f}%",
-        sub=f"売上{safety_margin_ratio:.1f}%減まで黒字" if safety_margin_ratio > 0 else "赤字水準",
-        help_text="現在の売上がどれだけ減っても赤字にならないかの割合",
-        color_type="positive" if safety_margin_ratio > 0 else "negative"
-    ), unsafe_allow_html=True)
-
-with k4:
-    sub_text = f"{invest_payback_sales/10000:.0f}万円の売上が必要" if invest > 0 else ""
-    st.markdown(custom_metric(
-        label="投資回収に必要な売上",
-        value=jp_format(invest_payback_sales),
-        sub=sub_text,
-        help_text="増えた固定費（投資）を賄うために必要な追加売上高",
-        color_type="neutral"
-    ), unsafe_allow_html=True)
-
-with k5:
-    st.markdown(custom_metric(
-        label="最低預金残高（6ヶ月間）",
-        value=jp_format(min_cash),
-        sub="" if min_cash > 0 else "資金ショート警告",
-        help_text="今後6ヶ月で最も預金が減るタイミングの残高",
-        color_type="positive" if min_cash > 0 else "negative"
-    ), unsafe_allow_html=True)
-
-
-
-st.write("")
-
-# グラフ行
-g1, g2 = st.columns([3, 2], gap="large")
-
-# 単位調整ロジック（万円/億円）
-max_cash = max(max(cf_line), abs(min(cf_line)))
-if max_cash >= 100_000_000:
-    unit_str = "億円"
-    divider = 100_000_000
-else:
-    unit_str = "万円"
-    divider = 10_000
-
-y_cf_scaled = [v / divider for v in cf_line]
-
-with g1:
-    st.markdown(f'<div class="graph-header">【推移】資金繰り予測 ({unit_str}単位)</div>', unsafe_allow_html=True)
-    fig = go.Figure()
-    # 軸の最小値調整（ショート時）
-    min_y_scaled = min(min(y_cf_scaled), -100) if min(y_cf_scaled) < 0 else 0
-    
-    fig.add_hrect(y0=min_y_scaled, y1=0, fillcolor="#FEF2F2", opacity=0.8, layer="below", line_width=0)
-    fig.add_hline(y=0, line_dash="dash", line_color="#EF4444", annotation_text="0", annotation_position="bottom right")
-    fig.add_trace(go.Scatter(
-        x=months_label, y=y_cf_scaled, mode='lines+markers',
-        line=dict(color='#1A365D', width=3),
-        marker=dict(size=8, color=['#EF4444' if x < 0 else '#1A365D' for x in cf_line]),
-        name="現預金推移",
-        text=[jp_format(v) for v in cf_line], hovertemplate='%{x}<br>残高: %{text}<extra></extra>'
-    ))
-    fig.update_layout(
-        xaxis_title="", yaxis_title=f"現預金残高 ({unit_str})",
-        height=300, margin=dict(l=10, r=10, t=10, b=10),
-        plot_bgcolor='white', paper_bgcolor='white',
-    )
-    st.plotly_chart(fig, use_container_width=True)
-
-with g2:
-    st.markdown('<div class="graph-header">【安全性】目標売上と損益分岐点売上高の距離</div>', unsafe_allow_html=True)
-    max_range = max(target_rev, bep_rev) * 1.3
-    # こちらも単位調整
-    max_range_scaled = max_range / divider
-    target_rev_scaled = target_rev / divider
-    bep_rev_scaled = bep_rev / divider
-    
-    fig2 = go.Figure()
-    fig2.add_shape(type="rect", x0=0, x1=bep_rev_scaled, y0=0, y1=1, xref="x", yref="paper",
-                   fillcolor="#FFE4E6", line_width=0, opacity=0.5) 
-    fig2.add_shape(type="rect", x0=bep_rev_scaled, x1=max_range_scaled, y0=0, y1=1, xref="x", yref="paper",
-                   fillcolor="#D1FAE5", line_width=0, opacity=0.5) 
-    
-    fig2.add_trace(go.Bar(
-        x=[target_rev_scaled], y=["売上"], orientation='h',
-        marker_color="#1A365D", width=0.5,
-        name="目標売上", text=jp_format(target_rev), textposition='auto'
-    ))
-    
-    fig2.add_vline(x=bep_rev_scaled, line_width=3, line_color="#EF4444", line_dash="dash")
-    
-    fig2.add_annotation(x=bep_rev_scaled, y=1.05, xref="x", yref="paper",
-                        text=f"損益分岐点\n{jp_format(bep_rev)}", showarrow=False, 
-                        font=dict(color="#EF4444", size=12), xanchor="left")
-
-    fig2.update_layout(
-        xaxis=dict(range=[0, max_range_scaled], visible=False),
-        yaxis=dict(visible=False),
-        height=250, margin=dict(l=10, r=10, t=30, b=10),
-        plot_bgcolor='white',
-        showlegend=False
-    )
-    st.plotly_chart(fig2, use_container_width=True)
-
-
-# ─────────────────────────────────────
-# AI-CFO 診断
-# ─────────────────────────────────────
-st.markdown("---")
-col_btn, col_res = st.columns([1, 4])
-
-with col_btn:
-    st.markdown("### AI-CFO 相談")
-    st.write("シミュレーション結果をもとに、AIが経営アドバイスを生成します。")
-    ask_ai = st.button("診断を実行する", type="primary", use_container_width=True)
-
-with col_res:
-    if ask_ai:
-        api_key = None
-        if "GEMINI_API_KEY" in st.secrets:
-            api_key = st.secrets["GEMINI_API_KEY"]
-        elif "secrets" in st.secrets and "GEMINI_API_KEY" in st.secrets["secrets"]:
-            api_key = st.secrets["secrets"]["GEMINI_API_KEY"]
-
-        if not api_key:
-            st.error("APIキーが設定されていません。.streamlit/secrets.toml を確認してください。")
+    credit = solver.min_credit_line(
+        pre_financing_cash, financing["loan_balance"], financing["loan_principal"], financing["loan_rate"],
+        overdraft_rate=financing["overdraft_rate"])
+    credit_needed = float(credit["credit_line"][0])
+    credit_interest = float(credit["interest_cost"][0])
+    max_invest = float(goal["max_invest"][0])
+    min_sales_needed = float(goal["min_sales_change"][0])
+    max_sales_allowed = float(goal["max_sales_change"][0])
+    max_cost_allowed = float(goal["max_cost_cut"][0])
+
+    st.write("")
+    st.markdown("##### 🎯 逆算：資金ショートを避けられる限界（他の条件は今のまま）")
+    q1, q2, q3, q4 = st.columns(4)
+    with q1:
+        st.markdown(custom_metric(
+            label="投資できる上限（固定費の増加）",
+            value=jp_format(max_invest) if np.isfinite(max_invest) else "―",
+            sub=f"今の設定からあと {jp_format(max_invest - invest)}" if np.isfinite(max_invest) and max_invest > invest
+                else ("上限を超えています" if np.isfinite(max_invest) else "現預金が不足しています"),
+            help_text=f"{horizon}ヶ月間の最低預金残高が 0 円を下回らない固定費増の上限（月額）"
+                      + ("。借入金の返済と当座貸越の枠を含めて判定" if has_financing else "")
+                      + ("。賞与・税金などの予定を含めて判定" if len(events) else ""),
+            color_type="positive" if np.isfinite(max_invest) and max_invest >= invest else "negative"
+        ), unsafe_allow_html=True)
+    with q2:
+        if np.isnan(min_sales_needed):
+            sales_text, sales_sub = "―", "売上の増減だけでは回避できません"
+        elif min_sales_needed <= solver.LEVER_MIN:
+            sales_text, sales_sub = "制約なし", ""
         else:
-            prompt = f"""以下の中小企業（業種: {ind}）のシミュレーション結果を分析し、貴社に向けたアドバイスを作成してください。
-なお、ユーザーの役職を特定せず、「社長」などの呼びかけは避け、「貴社」という表現を使用してください。
-
-※厳守事項：利益、不足額、回収日数などの数値は絶対にAI自身で計算・推測しないでください。必ず上記【データ】セクションで渡された数値をそのまま引用して解説してください。
-
-※【超重要】カタカナ語（アップセル、リードタイム、アライアンス、コンセンサスなど）は使用厳禁です。
-必ず現場の従業員や中学生でも直感的にわかる、泥臭く平易な日本語（例：お金の回り、ついで買い、待ち時間、最悪の事態）に翻訳して話してください。
-ただし、日常的に使われる言葉（リスク、コスト、システムなど）は許容しますが、コンサル用語は徹底して排除してください。
-
-※【超重要】全方位の一般的なコストカット提案（あれもこれもやれ）は絶対にやめてください。
-渡されたデータ（特に『固定費増(投資)』や『変動費率』）を見て、利益を圧迫している【最大の要因1つ】を特定し、そこだけをピンポイントで厳しく指摘・メスを入れてください。
-（例：投資額が重すぎるなら、その投資計画自体の撤回や延期を強く迫ること、原価が高すぎるなら仕入れの見直しのみを迫ること）
-
-### ① 資金繰りリスクの評価
-- 資金推移（6ヶ月間で最も現金が減った時の残高: {jp_format(min_cash)}）を分析し、資金ショートのリスクがあれば警告してください。
-- 現預金月商倍率（最低時）が{months_sales_ratio:.1f}ヶ月分あることが、どの程度の安全性（または危険性）を示すのか評価してください。
-- ショートや減少の原因が「売上急増による運転資金の増加（黒字倒産リスク）」なのか、「赤字垂れ流しによる資金枯渇」なのかを明確に区別して指摘してください。
-- 業界（{ind}）の平均的な回収サイクルと比べて、貴社のサイト（入金{m_rec:.1f}ヶ月、出金{m_pay:.1f}ヶ月）が適正かも一言触れてください。
-
-### ② 財務の健康診断と潜在リスク
-- 「変動費率（原価の重さ）」や「固定費の重さ」など、なぜそのような利益構造になっているのかという【根本原因】を分析してください。
-- 安全余裕率は「{safety_margin_ratio:.1f}%」です。{ind}としてこの数値が安全圏か評価してください。
-
-### ③ 明日からやるべき具体的戦術
-- 精神論禁止。最大の要因を解決するための具体的アクションを3つ提示してください。
-
-【データ】
-- 業種: {ind}
-- 売上: {jp_format(rev)} -> {jp_format(target_rev)} ({sales_change:+d}%)
-- 変動費率（原価率）: {sim_v_rate:.1%}
-- 固定費増（社長の決断した投資額）: {jp_format(invest)}
-- 損益分岐点売上高: {jp_format(bep_rev)}
-- 6ヶ月後残高: {jp_format(cf_line[-1])}
-- 資金ショート: {"あり（黒字倒産リスク）" if short_month else "なし"}
-- 現預金月商倍率（最低時）: {months_sales_ratio:.1f}ヶ月
-"""
-            with st.spinner("AI-CFOがデータを分析中..."):
+            sales_text, sales_sub = f"{min_sales_needed:+.1f}%以上", ""
+        if np.isfinite(max_sales_allowed) and max_sales_allowed < SALES_CHANGE_RANGE[1]:
+            sales_sub = f"{max_sales_allowed:+.1f}%を超える急成長は運転資金不足"
+        st.markdown(custom_metric(
+            label="必要な売上変化",
+            value=sales_text,
+            sub=sales_sub,
+            help_text="資金ショートを避けるために必要な売上の増減（今の売上に対する%）",
+            color_type="positive" if not np.isnan(min_sales_needed) and min_sales_needed <= sales_change else "negative"
+        ), unsafe_allow_html=True)
+    with q3:
+        if np.isnan(max_cost_allowed):
+            cost_text = "―"
+        elif max_cost_allowed >= COST_CUT_RANGE[1]:
+            cost_text = "制約なし"
+        else:
+            cost_text = f"{max_cost_allowed:+.1f}%まで"
+        st.markdown(custom_metric(
+            label="耐えられる原価率の悪化",
+            value=cost_text,
+            sub="原価の見直しだけでは回避できません" if np.isnan(max_cost_allowed) else "",
+            help_text="仕入・外注単価がどこまで上がっても資金ショートしないか（今の原価率に対する%）",
+            color_type="positive" if not np.isnan(max_cost_allowed) and max_cost_allowed >= cost_cut else "negative"
+        ), unsafe_allow_html=True)
+    with q4:
+        if credit_needed <= 0:
+            credit_sub = "借入なしで乗り切れます"
+        elif credit_needed <= financing["credit_line"]:
+            credit_sub = f"今の枠 {jp_format(financing['credit_line'])} で足ります"
+        else:
+            credit_sub = f"利息 約{jp_format(credit_interest)}（{horizon}ヶ月間）"
+        st.markdown(custom_metric(
+            label="必要な当座貸越の枠",
+            value=jp_format(credit_needed) if credit_needed > 0 else "不要",
+            sub=credit_sub,
+            help_text=f"{horizon}ヶ月間、残高を 0 円以上に保つのに必要な当座貸越（借入）の枠の最低額。"
+                      f"利息は年 {financing['overdraft_rate']:.1f}% で計算",
+            color_type="positive" if credit_needed <= financing["credit_line"] else "negative"
+        ), unsafe_allow_html=True)
+
+    st.write("")
+    metrics.lap("goal_seek")
+
+    # ─────────────────────────────────────
+    # シナリオの保存と比較
+    # ─────────────────────────────────────
+    owner = st.session_state["scenario_owner"]
+    current_levers = {"sales_change": sales_change, "cost_cut": cost_cut, "invest": invest, "ramp_months": ramp_months}
+    # 保存・削除はボタンのコールバックで済ませるので、ここで読む一覧には反映済み
+    saved = scenario_db.list(owner)
+
+    with st.expander(f"💾 シナリオを保存して比べる（保存済み {len(saved)}件）", expanded=bool(saved)):
+        n1, n2 = st.columns([3, 1])
+        with n1:
+            st.text_input("シナリオ名", key="scenario_name", placeholder="例：2名採用＋値上げ5%",
+                                     label_visibility="collapsed")
+        with n2:
+            st.button("今の設定を保存", key="scenario_save", use_container_width=True,
+                      on_click=save_scenario, args=(owner, current_levers))
+        if st.session_state.get("scenario_error"):
+            st.warning(st.session_state.pop("scenario_error"))
+
+        names = [s["name"] for s in saved]
+        compare_names = st.multiselect("グラフと比較表に重ねるシナリオ", names, default=names) if names else []
+        if names:
+            d1, d2 = st.columns([3, 1])
+            with d1:
+                delete_name = st.selectbox("削除するシナリオ", names, key="scenario_delete_name",
+                                           label_visibility="collapsed")
+            with d2:
+                st.button("削除", key="scenario_delete", use_container_width=True,
+                          on_click=scenario_db.delete, args=(owner, delete_name))
+
+    # 保存済みシナリオは今の STEP 1 の数値で評価する（計算済みの組はメモから引く）
+    compared = [s for s in saved if s["name"] in compare_names]
+    comparison = (scenario_memo.compare(base, compared, n_months=horizon, revenue_base=revenue_base)
+                  if compared else None)
+    if comparison is not None and (len(st.session_state["events"]) or capex["months"]):
+        comparison = cash_events.apply(comparison, st.session_state["events"], events_start)
+        if capex["months"]:
+            # 設備投資の一括払いは保存したシナリオごとの固定費の増加で決まる
+            capex_cash = np.array([cash_events.cumulative(
+                cash_events.capex(max(s["invest"], 0) * capex["months"], events_start, capex["month"]),
+                events_start, horizon) for s in compared])
+            comparison = engine.with_cash(comparison, comparison["cash"] + capex_cash)
+    if comparison is not None and has_financing:
+        comparison = engine.apply_financing(comparison, **financing)
+    cash_rows = cf_line if comparison is None else np.vstack([cf_line, comparison["cash"]])
+    metrics.lap("scenario_compare")
+
+    # グラフ行
+    g1, g2 = st.columns([3, 2], gap="large")
+
+    # 単位調整ロジック（万円/億円）。グラフは単位ごとのひな形に数値を差し込んで作る
+    unit_str = charts.choose_unit(cash_rows)
+
+    with g1:
+        st.markdown(f'<div class="graph-header">【推移】資金繰り予測 ({unit_str}単位)</div>', unsafe_allow_html=True)
+        fig = charts.cash_chart(cash_rows, months_label, unit_str, names=[s["name"] for s in compared])
+        metrics.lap("chart_build")
+        st.plotly_chart(fig, use_container_width=True)
+        planned = cash_events.summary(events, events_start, horizon)
+        if planned:
+            st.caption("予定を反映: " + "、".join(f"{m} {kind} {jp_format(amount)}" for m, kind, amount in planned[:8])
+                       + (f" ほか {len(planned) - 8}件" if len(planned) > 8 else ""))
+        metrics.lap("chart_send")
+
+    with g2:
+        st.markdown('<div class="graph-header">【安全性】目標売上と損益分岐点売上高の距離</div>', unsafe_allow_html=True)
+        fig2 = charts.bep_chart(target_rev, bep_rev, unit_str)
+        metrics.lap("chart_build")
+        st.plotly_chart(fig2, use_container_width=True)
+        metrics.lap("chart_send")
+
+    if comparison is not None:
+        st.markdown("##### 📋 シナリオ比較")
+        rows = [scenario_row("今の設定", current_levers, {f: result[f][0] for f in scenario_store.KPI_FIELDS})]
+        for i, s in enumerate(compared):
+            rows.append(scenario_row(s["name"], s, {f: comparison[f][i] for f in scenario_store.KPI_FIELDS}))
+        st.markdown(scenario_table(rows), unsafe_allow_html=True)
+        metrics.lap("scenario_compare")
+
+    # ─────────────────────────────────────
+    # SENSITIVITY: 感度分析（トルネード）
+    # ─────────────────────────────────────
+    st.markdown('<div class="section-title"><span class="section-badge">SENSITIVITY</span> どの数字が効くか（感度分析）</div>', unsafe_allow_html=True)
+
+    if st.toggle("感度分析を表示する", key="sens_mode",
+                 help="決算数値とシナリオの各項目を 1 つずつ上下に動かし、結果への影響が大きい順に並べます。"):
+        v1, v2 = st.columns([3, 2], gap="medium")
+        with v1:
+            sens_output = st.radio(
+                "見る指標", sensitivity.OUTPUTS, format_func=sensitivity.OUTPUT_LABELS.get,
+                horizontal=True, key="sens_output",
+            )
+        with v2:
+            sens_pct = st.select_slider(
+                "動かす幅", options=[5, 10, 20, 30], value=10, format_func=lambda p: f"±{p}%",
+                key="sens_pct",
+                help="売上変化・原価率は ±ポイント、固定費の増減は今の固定費に対する ±%、目標達成期間は 6ヶ月に対する ±%",
+            )
+
+        # 基準 + 全項目の上げ・下げを 1 回の計算で求める
+        sens = sensitivity.analyze(
+            rev, cgs, fxd, csh, rec, pay,
+            sales_change=sales_change, cost_cut=cost_cut, invest=invest, ramp_months=ramp_months,
+            pct=sens_pct, n_months=horizon, revenue_base=revenue_base,
+            events=st.session_state["events"], start=events_start,
+            capex_months=capex["months"], capex_month=capex["month"],
+            financing=financing if has_financing else None,
+        )
+        entry = sens[sens_output]
+        order = sensitivity.ranking(entry)
+
+        if np.allclose(entry["low"], entry["base"]) and np.allclose(entry["high"], entry["base"]):
+            st.caption("この条件では、どの項目を動かしてもこの指標は変わりません。")
+        else:
+            t1, t2 = st.columns([3, 2], gap="large")
+            with t1:
+                sens_unit = charts.choose_unit(np.concatenate([entry["low"], entry["high"]]))
+                st.markdown(f'<div class="graph-header">【感度】{sensitivity.OUTPUT_LABELS[sens_output]}'
+                            f'（基準 {jp_format(entry["base"])}・{sens_unit}単位）</div>', unsafe_allow_html=True)
+                fig4 = charts.tornado_chart(
+                    [sensitivity.INPUT_LABELS[sensitivity.INPUTS[i]] for i in order],
+                    entry["base"], entry["low"][order], entry["high"][order], sens_unit,
+                )
+                st.plotly_chart(fig4, use_container_width=True)
+            with t2:
+                st.markdown(scenario_table([sensitivity_row(entry, i) for i in order],
+                                           ("項目", "下げたとき", "上げたとき", "弾力性")), unsafe_allow_html=True)
+                st.caption("弾力性: 項目を 1% 動かしたときに指標が何% 動くか（基準が 0 のときは ―）")
+    metrics.lap("sensitivity")
+
+    # ─────────────────────────────────────
+    # DAILY: 日次の資金繰り（締め日・支払日）
+    # ─────────────────────────────────────
+    st.markdown('<div class="section-title"><span class="section-badge">DAILY</span> 月の途中の資金繰り（締め日・支払日）</div>', unsafe_allow_html=True)
+
+    if st.toggle("日次で検証する", key="daily_mode",
+                 help="入金・支払・給与などを実際の日付に並べ、月末の残高では見えない月の途中の資金不足を調べます。"):
+        terms = list(daily.TERMS)
+        w1, w2, w3 = st.columns(3, gap="medium")
+        with w1:
+            sales_terms = st.selectbox("売上の回収条件", terms, index=terms.index(daily.DEFAULT_SALES_TERMS), key="daily_sales_terms")
+        with w2:
+            cost_terms = st.selectbox("仕入・外注の支払条件", terms, index=terms.index(daily.DEFAULT_COST_TERMS), key="daily_cost_terms")
+        with w3:
+            pay_day = st.selectbox("給与日（固定費の6割）", [10, 15, 20, 25, 31], index=3, key="daily_pay_day",
+                                   format_func=lambda d: "月末" if d == 31 else f"{d}日")
+
+        day_result = daily.project_daily(
+            rev, cgs, fxd, csh, rec, pay,
+            sales_change=sales_change, cost_cut=cost_cut, invest=invest, ramp_months=ramp_months,
+            n_months=horizon, sales_terms=sales_terms, cost_terms=cost_terms,
+            fixed_schedule=((pay_day, daily.FIXED_SCHEDULE[0][1]), daily.FIXED_SCHEDULE[1]), daily=True,
+            start=events_start, events=events, revenue_base=revenue_base,
+        )
+        day_cash = day_result["cash"][0]
+        day_min = int(day_result["min_cash"][0])
+        day_labels = [str(d) for d in day_result["dates"]]
+        short_day = int(day_result["short_day"][0])
+
+        y1, y2, y3 = st.columns(3)
+        with y1:
+            st.markdown(custom_metric(
+                label="月の途中を含む最低残高",
+                value=jp_format(day_min),
+                sub=f"{day_labels[int(day_result['min_day'][0])]} 時点",
+                help_text="入金日・支払日・給与日の順に残高を追ったときの最も少ない残高",
+                color_type="positive" if day_min > 0 else "negative"
+            ), unsafe_allow_html=True)
+        with y2:
+            st.markdown(custom_metric(
+                label="月末残高で見た最低残高",
+                value=jp_format(min_cash),
+                sub=f"月の途中はさらに {jp_format(min_cash - day_min)} 少ない" if day_min < min_cash else "",
+                help_text="上の結果（月単位の計算）の最低預金残高",
+                color_type="positive" if min_cash > 0 else "negative"
+            ), unsafe_allow_html=True)
+        with y3:
+            st.markdown(custom_metric(
+                label="最初に資金が足りなくなる日",
+                value=day_labels[short_day] if short_day >= 0 else "なし",
+                sub="",
+                help_text="日次の残高が初めてマイナスになる日（土日・祝日の入金は翌営業日、支払は前営業日）",
+                color_type="negative" if short_day >= 0 else "positive"
+            ), unsafe_allow_html=True)
+
+        day_unit = charts.choose_unit(day_cash)
+        st.markdown(f'<div class="graph-header">【日次】資金繰り予測 ({day_unit}単位)</div>', unsafe_allow_html=True)
+        st.plotly_chart(charts.cash_chart(day_cash, day_labels, day_unit), use_container_width=True)
+        st.caption(f"{day_labels[0]} から。土日・祝日（年末年始を含む）の入金は翌営業日、支払は前営業日として計算しています。")
+    metrics.lap("daily")
+
+
+    # ─────────────────────────────────────
+    # RISK: 確率モード（モンテカルロ）
+    # ─────────────────────────────────────
+    st.markdown('<div class="section-title"><span class="section-badge">RISK</span> 資金ショート確率（モンテカルロ）</div>', unsafe_allow_html=True)
+
+    if st.toggle("確率モードで検証する", key="mc_mode",
+                 help="売上・原価率・回収／支払サイトのブレを大量に試し、資金ショートの確率を求めます。"):
+        r1, r2, r3, r4, r5 = st.columns(5, gap="medium")
+        with r1:
+            st.markdown("**予測期間**")
+            mc_months = st.select_slider(
+                "mc_months_hidden", options=[6, 12, 24, 36], value=24,
+                format_func=lambda m: f"{m}ヶ月", label_visibility="collapsed")
+            mc_paths = st.select_slider(
+                "mc_paths_hidden", options=[10_000, 100_000, 1_000_000], value=100_000,
+                format_func=lambda n: f"{n // 10_000}万通り", label_visibility="collapsed",
+                help="試行回数。全パスは保持せず、月ごとの分位点スケッチで集計します。")
+        with r2:
+            st.markdown("**売上のブレ（月次）**")
+            mc_rev_sigma = st.slider(
+                "mc_rev_hidden", min_value=0.0, max_value=50.0, value=10.0, step=1.0,
+                format="%.0f%%", help="月ごとの売上のばらつき（標準偏差）", label_visibility="collapsed")
+        with r3:
+            st.markdown("**原価率のブレ**")
+            mc_v_sigma = st.slider(
+                "mc_v_hidden", min_value=0.0, max_value=30.0, value=5.0, step=0.5,
+                format="%.1f%%", help="変動費率のばらつき（標準偏差・相対）", label_visibility="collapsed")
+        with r4:
+            st.markdown("**回収サイトのブレ**")
+            mc_rec_sigma = st.slider(
+                "mc_rec_hidden", min_value=0.0, max_value=2.0, value=0.2, step=0.1,
+                format="%.1fヶ月", label_visibility="collapsed")
+        with r5:
+            st.markdown("**支払サイトのブレ**")
+            mc_pay_sigma = st.slider(
+                "mc_pay_hidden", min_value=0.0, max_value=2.0, value=0.2, step=0.1,
+                format="%.1fヶ月", label_visibility="collapsed")
+
+        mc = montecarlo.run(
+            rev, cgs, fxd, csh, rec, pay,
+            sales_change=sales_change, cost_cut=cost_cut, invest=invest, ramp_months=ramp_months,
+            n_months=mc_months, n_paths=mc_paths,
+            rev_sigma=mc_rev_sigma / 100, v_rate_sigma=mc_v_sigma / 100,
+            rec_sigma=mc_rec_sigma, pay_sigma=mc_pay_sigma, seed=0, financing=financing,
+            events=events, start=events_start,
+            # 予測期間が上と違うので、季節性のある基準売上はこの期間の長さで作り直す
+            revenue_base=seasonal.baseline(season_model, mc_months) if season_model is not None else None,
+        )
+        p_short_total = mc["p_short_cum"][-1] * 100
+
+        m1, m2, m3, m4 = st.columns(4)
+        with m1:
+            st.markdown(custom_metric(
+                label=f"資金ショート確率（{mc_months}ヶ月間）",
+                value=f"{p_short_total:.1f}%",
+                sub=f"{mc['n_paths']:,}通りの試算",
+                help_text="期間中に一度でも預金残高がマイナスになる確率",
+                color_type="negative" if p_short_total >= 5 else "positive"
+            ), unsafe_allow_html=True)
+        with m2:
+            st.markdown(custom_metric(
+                label="予想不足額（期待値）",
+                value=jp_format(mc["expected_shortfall"]),
+                sub=f"ショート時の平均 {jp_format(mc['shortfall_if_short'])}" if p_short_total > 0 else "",
+                help_text="期間中で最も預金が減った時の不足額の平均（ショートしない場合は 0 として計算）",
+                color_type="negative" if mc["expected_shortfall"] > 0 else "positive"
+            ), unsafe_allow_html=True)
+        with m3:
+            st.markdown(custom_metric(
+                label="悲観ケース（下位5%）の最終残高",
+                value=jp_format(mc["bands"][5][-1]),
+                sub=f"中央値 {jp_format(mc['bands'][50][-1])}",
+                help_text="20回に1回はこれを下回る水準",
+                color_type="positive" if mc["bands"][5][-1] > 0 else "negative"
+            ), unsafe_allow_html=True)
+        with m4:
+            st.markdown(custom_metric(
+                label="必要な当座貸越の枠（95%で足りる額）",
+                value=jp_format(mc["credit_line"][95]) if mc["credit_line"][95] > 0 else "不要",
+                sub=f"中央値 {jp_format(mc['credit_line'][50])}・借入が必要な確率 {mc['p_needs_credit']:.0%}",
+                help_text="試算の 95% で残高を 0 円以上に保てる当座貸越の枠（借入金の返済を含む）",
+                color_type="positive" if mc["credit_line"][95] <= financing["credit_line"] else "negative"
+            ), unsafe_allow_html=True)
+
+        mc_unit = charts.choose_unit(np.concatenate([mc["bands"][5], mc["bands"][95]]))
+        mc_label = [f"{i}ヶ月" for i in range(mc_months + 1)]
+
+        st.markdown(f'<div class="graph-header">【確率】資金繰りの幅 ({mc_unit}単位) と資金ショート確率</div>', unsafe_allow_html=True)
+        fig3 = charts.fan_chart(mc, mc_label, mc_unit)
+        st.plotly_chart(fig3, use_container_width=True)
+    metrics.lap("montecarlo")
+
+
+    # ─────────────────────────────────────
+    # AI-CFO 診断
+    # ─────────────────────────────────────
+    st.markdown("---")
+    col_btn, col_res = st.columns([1, 4])
+
+    with col_btn:
+        st.markdown("### AI-CFO 相談")
+        st.write("シミュレーション結果をもとに、AIが経営アドバイスを生成します。")
+        ask_ai = st.button("診断を実行する", type="primary", use_container_width=True)
+        cancel_area = st.empty()
+
+    with col_res:
+        diag_inputs = {
+            "industry": ind, "rev": rev, "target_rev": target_rev, "sales_change": sales_change,
+            "sim_v_rate": sim_v_rate, "invest": invest, "bep_rev": bep_rev,
+            "min_cash": min_cash, "final_cash": cf_line[-1], "short_month": short_month,
+            "months_sales_ratio": months_sales_ratio, "m_rec": m_rec, "m_pay": m_pay,
+            "safety_margin_ratio": safety_margin_ratio, "horizon": horizon,
+        }
+        # ルールでの一次診断（数値だけで決まる判定）は毎回すぐに出し、AI の文章はその下に重ねる
+        st.markdown("#### ⚡ 即時診断（ルール）")
+        st.markdown(rules.render(diag_inputs, rules.diagnose(diag_inputs)))
+        metrics.lap("rules")
+
+        cache_key = diagnosis_cache.cache_key(diag_inputs)
+        diag_state = st.session_state.get("diagnosis")
+
+        # 回答の途中で再実行された（中止ボタン・他の操作）→ 中断扱い
+        if diag_state and diag_state["status"] == "streaming":
+            diag_state["status"] = "cancelled"
+
+        if ask_ai:
+            metrics.count("diagnosis_requests_total")
+            cached = diag_cache.get(cache_key)
+
+            api_key = None
+            needs_key = llm_client.backend_name() == "gemini"
+            if cached is None and needs_key:
+                if "GEMINI_API_KEY" in st.secrets:
+                    api_key = st.secrets["GEMINI_API_KEY"]
+                elif "secrets" in st.secrets and "GEMINI_API_KEY" in st.secrets["secrets"]:
+                    api_key = st.secrets["secrets"]["GEMINI_API_KEY"]
+
+            if cached is not None:
+                metrics.count("diagnosis_cache_hits_total")
+                diag_state = {"key": cache_key, "text": cached["text"], "status": "cached",
+                              "ttft": None, "total": cached["gen_seconds"]}
+                st.session_state["diagnosis"] = diag_state
+            elif needs_key and not api_key:
+                diag_state = None
+                st.error("APIキーが設定されていません。.streamlit/secrets.toml を確認してください。")
+            else:
+                prompt = diagnosis.build_prompt(diag_inputs)
+                diag_state = {"key": cache_key, "text": "", "status": "streaming", "ttft": None, "total": None}
+                st.session_state["diagnosis"] = diag_state
+                cancel_area.button("回答を中止", key="cancel_ai", use_container_width=True)
+                box = st.empty()
+                box.caption("AI-CFOがデータを分析中...")
+                metrics.count("llm_calls_total", backend=llm_client.backend_name())
+                metrics.lap("ai_section")
                 try:
-                    genai.configure(api_key=api_key)
-                    model = genai.GenerativeModel('gemini-2.5-flash')
-                    response = model.generate_content(prompt)
-                    if response and response.candidates and response.candidates[0].content.parts:
-                        st.markdown(f'<div class="diagnosis-box">{response.text}</div>',
-                                    unsafe_allow_html=True)
+                    started = time.perf_counter()
+                    for piece in llm_client.get_client(api_key).stream(prompt):
+                        if diag_state["ttft"] is None:
+                            diag_state["ttft"] = time.perf_counter() - started
+                        diag_state["text"] += piece
+                        box.markdown(f'<div class="diagnosis-box">{diag_state["text"]}▌</div>',
+                                     unsafe_allow_html=True)
+                    diag_state["total"] = time.perf_counter() - started
+                    metrics.lap("diagnosis")
+                    box.empty()
+                    if diag_state["text"]:
+                        diag_state["status"] = "done"
+                        diag_cache.put(cache_key, diag_state["text"], diag_state["total"])
+                        diagnosis.logger.info("diagnosis streamed ttft=%.2fs total=%.2fs chars=%d",
+                                              diag_state["ttft"], diag_state["total"], len(diag_state["text"]))
                     else:
-                         st.error("AIからの回答が空でした。入力内容を見直すか、しばらく待ってから再試行してください。")
+                        diag_state["status"] = "error"
+                        metrics.count("errors_total", type="EmptyResponse")
+                        st.error("AIからの回答が空でした。入力内容を見直すか、しばらく待ってから再試行してください。")
+                except llm_client.LLMError as e:
+                    metrics.lap("diagnosis")
+                    metrics.count_error(e)
+                    box.empty()
+                    diag_state["status"] = "error"
+                    st.error(e.user_message)
                 except Exception as e:
+                    metrics.lap("diagnosis")
+                    metrics.count_error(e)
+                    box.empty()
+                    diag_state["status"] = "error"
                     st.error(f"AI診断中にエラーが発生しました: {e}")
+                cancel_area.empty()
+
+        # 直近の診断（今の入力と同じものだけ）を表示
+        if diag_state and diag_state["key"] == cache_key and diag_state["status"] != "error":
+            st.markdown(f'<div class="diagnosis-box">{diag_state["text"]}</div>', unsafe_allow_html=True)
+            if diag_state["status"] == "cached":
+                st.caption(f"前回の診断結果を表示しています（生成時間 {diag_state['total']:.1f}秒を節約）")
+            elif diag_state["status"] == "cancelled":
+                st.caption("回答の途中で中止しました。")
+            elif diag_state["status"] == "done":
+                st.caption(f"最初の表示まで {diag_state['ttft']:.1f}秒・全体 {diag_state['total']:.1f}秒")
+    metrics.lap("ai_section")
+
+    # ─────────────────────────────────────
+    # 計測パネル（?debug=1 のときだけ）
+    # ─────────────────────────────────────
+    if st.session_state["metrics_debug"]:
+        with st.expander("🔧 再実行の内訳（直近）", expanded=False):
+            rows = [
+                {"種別": r["kind"], "合計(ms)": r["total_ms"], **r["phases_ms"]}
+                for r in reversed(metrics.history(st.session_state["metrics_session"]))
+            ]
+            if rows:
+                st.dataframe(rows, use_container_width=True, hide_index=True)
+            else:
+                st.caption("まだ記録がありません。")
+
+
+scenario_section()
+metrics.end_rerun()
+# 画面を返し終えてから、AI 診断用の SDK を裏で読み込んでおく
+llm_client.prewarm()
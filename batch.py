@@ -0,0 +1,350 @@
+"""
+AI-CFO バッチ実行（顧問先一括シミュレーション）
+=======================================
+顧問先ごとの決算数値とシナリオを CSV / JSON Lines で受け取り、
+engine でまとめて計算して結果を少しずつ書き出すコマンドライン入口。
+
+    python batch.py clients.csv -o results.csv --workers 4
+    python batch.py clients.jsonl -o results_parquet --format parquet
+
+入力の列（CSV のヘッダー / JSON のキー）:
+    id（省略時は行番号）, revenue, cogs, fixed_cost, cash, receivables, payables, industry,
+    invest, cost_cut, sales_change, ramp_months（レバーは省略時 0 / 0 / 0 / 1）,
+    revenue_history（任意。月次売上の実績を古い順に「;」区切り、JSON では数値の配列。
+    12ヶ月以上あれば seasonal で季節性のある基準売上を当てはめ、一定の revenue の代わりに使う）
+
+出力には計算結果に加えて、rules のルール診断（資金が減る原因・最大の要因・業界の目安との比較）を付ける。
+
+入力は chunk 行ずつ読み、プロセスプールで並列に計算して入力順に書き出す。
+進み具合は <出力>.progress に記録するので、途中で止まっても同じコマンドで続きから再開できる
+（--restart で最初からやり直し）。
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import engine
+import rules
+import seasonal
+
+BASE_FIELDS = ("revenue", "cogs", "fixed_cost", "cash", "receivables", "payables")
+LEVER_DEFAULTS = {"invest": 0.0, "cost_cut": 0.0, "sales_change": 0.0, "ramp_months": 1.0}
+OUTPUT_FIELDS = (
+    "id", "industry", "target_rev", "target_op_profit", "bep_rev", "safety_margin_ratio",
+    "invest_payback_sales", "min_cash", "short_month", "months_sales_ratio", "final_cash",
+    "m_rec", "m_pay", *rules.LABEL_FIELDS, "error",
+)
+
+
+# ─────────────────────────────────────
+# 入力（ストリーミング）
+# ─────────────────────────────────────
+def read_rows(path, fmt=None):
+    """入力ファイルを 1 行ずつ dict で返す。全体をメモリに載せない。"""
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv")
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if fmt == "jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from csv.DictReader(f)
+
+
+def chunked(rows, size):
+    it = iter(rows)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# ─────────────────────────────────────
+# 計算（ワーカープロセス側）
+# ─────────────────────────────────────
+def _number(value, default):
+    if value is None or value == "":
+        return default
+    return float(value)
+
+
+def _history(value):
+    """revenue_history の値（「;」区切りの文字列か数値の配列）を配列にする。空なら空配列。"""
+    if value is None or value == "":
+        return np.empty(0)
+    if isinstance(value, str):
+        value = [v for v in value.replace(",", ";").split(";") if v.strip()]
+    return np.asarray([float(v) for v in value][-seasonal.MAX_MONTHS:], dtype=float)
+
+
+def revenue_baseline(revenue, histories, n_months):
+    """実績が 12ヶ月以上ある行は季節性のある基準売上、それ以外の行は一定の revenue。
+
+    全行を右詰めの 1 枚の配列にして seasonal.fit / baseline を 1 回ずつ呼ぶ。
+    実績のある行が 1 つもなければ None（engine.project は従来どおり一定の売上で計算する）。
+    """
+    has = np.array([len(h) >= seasonal.MIN_MONTHS for h in histories])
+    if not has.any():
+        return None
+    model = seasonal.fit(seasonal.stack_histories([h if ok else () for h, ok in zip(histories, has)]))
+    return np.where(has[:, None], seasonal.baseline(model, n_months), revenue[:, None])
+
+
+def evaluate_chunk(rows, start, n_months=engine.N_MONTHS, with_cash=False):
+    """行の chunk を配列に直して engine.project で一括計算し、列ごとの結果を返す。
+
+    with_cash=True なら現預金の推移 (行数, n_months + 1) も "cash" として返す（api.py 用）。
+    "diagnosis_inputs" は AI 診断のプロンプト入力の列（batch_diagnosis.py 用。出力ファイルには書かない）。
+    """
+    fields = BASE_FIELDS + tuple(LEVER_DEFAULTS)
+    values = np.zeros((len(rows), len(fields)))
+    errors = [""] * len(rows)
+    for j, f in enumerate(fields):
+        default = LEVER_DEFAULTS.get(f, 0.0)
+        column = [row.get(f) for row in rows]
+        try:
+            # 列ごとに NumPy でまとめて変換する（JSON の数値・数字だけの文字列）
+            values[:, j] = np.array([default if v is None else v for v in column], dtype=float)
+        except (TypeError, ValueError):
+            # 空欄や読めない値を含む列だけ 1 行ずつ読む
+            for i, v in enumerate(column):
+                try:
+                    values[i, j] = _number(v, default)
+                except (TypeError, ValueError) as e:
+                    errors[i] = errors[i] or f"invalid number: {e}"
+    histories = [np.empty(0)] * len(rows)
+    for i, row in enumerate(rows):
+        if row.get("revenue_history") is None:
+            continue
+        try:
+            histories[i] = _history(row["revenue_history"])
+        except (TypeError, ValueError) as e:
+            errors[i] = errors[i] or f"invalid number: {e}"
+    for i, e in enumerate(errors):
+        if e:
+            values[i] = [LEVER_DEFAULTS.get(f, 0.0) for f in fields]
+            histories[i] = np.empty(0)
+
+    cols = dict(zip(fields, values.T))
+    result = engine.project(
+        cols["revenue"], cols["cogs"], cols["fixed_cost"], cols["cash"],
+        cols["receivables"], cols["payables"],
+        sales_change=cols["sales_change"], cost_cut=cols["cost_cut"],
+        invest=cols["invest"], ramp_months=cols["ramp_months"], n_months=n_months,
+        revenue_base=revenue_baseline(cols["revenue"], histories, n_months),
+    )
+
+    out = {
+        "id": [row.get("id", start + i) for i, row in enumerate(rows)],
+        "industry": [row.get("industry", "") for row in rows],
+        "final_cash": result["cash"][:, -1],
+        "error": errors,
+    }
+    for f in OUTPUT_FIELDS:
+        if f in result:
+            out[f] = result[f]
+    # 画面の diag_inputs と同じ値（diagnosis.INPUT_FIELDS）を列で持ち、ルール診断と一括診断のプロンプトに使う
+    diag = {
+        "industry": out["industry"], "rev": cols["revenue"], "target_rev": result["target_rev"],
+        "sales_change": cols["sales_change"], "sim_v_rate": result["sim_v_rate"], "invest": cols["invest"],
+        "bep_rev": result["bep_rev"], "min_cash": result["min_cash"], "final_cash": out["final_cash"],
+        "short_month": result["short_month"], "months_sales_ratio": result["months_sales_ratio"],
+        "m_rec": result["m_rec"], "m_pay": result["m_pay"],
+        "safety_margin_ratio": result["safety_margin_ratio"], "horizon": n_months,
+    }
+    # 画面と同じルール診断を全行まとめて付ける（行ごとに AI を呼ばなくても一次判定が出る）
+    out.update(rules.labels(rules.diagnose(diag)))
+    out["diagnosis_inputs"] = diag
+    if with_cash:
+        out["cash"] = result["cash"]
+    # 読めなかった行の数値は空欄にする
+    bad = np.array([bool(e) for e in errors])
+    if bad.any():
+        for f in OUTPUT_FIELDS:
+            if f == "short_month":
+                out[f] = np.where(bad, -1, out[f])
+            elif isinstance(out[f], np.ndarray):
+                out[f] = np.where(bad, np.nan, out[f])
+            elif f in rules.LABEL_FIELDS:
+                out[f] = ["" if b else v for b, v in zip(bad, out[f])]
+        if with_cash:
+            out["cash"] = np.where(bad[:, None], np.nan, out["cash"])
+    return out
+
+
+# ─────────────────────────────────────
+# 出力（少しずつ書き出す）
+# ─────────────────────────────────────
+class CsvSink:
+    def __init__(self, path, resume_bytes):
+        exists = os.path.exists(path) and resume_bytes > 0
+        self.f = open(path, "r+b" if exists else "wb")
+        if exists:
+            # 最後に記録した位置より後ろ（書きかけの行）は捨てる
+            self.f.truncate(resume_bytes)
+            self.f.seek(resume_bytes)
+        else:
+            self.f.write((",".join(OUTPUT_FIELDS) + "\n").encode("utf-8"))
+
+    def write(self, columns):
+        cells = [_csv_column(f, columns[f]) for f in OUTPUT_FIELDS]
+        text = "\n".join(map(",".join, zip(*cells))) + "\n"
+        self.f.write(text.encode("utf-8"))
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        return self.f.tell()
+
+    def close(self):
+        self.f.close()
+
+
+def _csv_column(name, values):
+    """1 列分を CSV のセル文字列のリストにする（数値列は NumPy でまとめて変換）。"""
+    if isinstance(values, np.ndarray):
+        if name == "short_month":
+            return ["" if v < 0 else str(int(v)) for v in values]
+        return np.where(np.isnan(values), "", values.astype(str)).tolist()
+    cells = []
+    for v in values:
+        text = str(v)
+        if any(c in text for c in ',"\n'):
+            text = '"' + text.replace('"', '""') + '"'
+        cells.append(text)
+    return cells
+
+
+class ParquetSink:
+    """出力ディレクトリに chunk ごとの part ファイルを書く（pyarrow が必要）。"""
+
+    def __init__(self, path, resume_parts):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.pa, self.pq = pa, pq
+        self.path = path
+        self.part = resume_parts
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, columns):
+        columns = dict(columns)
+        columns["id"] = [str(v) for v in columns["id"]]
+        columns["short_month"] = self.pa.array(columns["short_month"], mask=columns["short_month"] < 0)
+        table = self.pa.table({f: columns[f] for f in OUTPUT_FIELDS})
+        tmp = os.path.join(self.path, f".part-{self.part:05d}.parquet")
+        self.pq.write_table(table, tmp)
+        os.replace(tmp, os.path.join(self.path, f"part-{self.part:05d}.parquet"))
+        self.part += 1
+        return self.part
+
+    def close(self):
+        pass
+
+
+def _load_progress(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"rows_done": 0, "position": 0}
+
+
+def _save_progress(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+# ─────────────────────────────────────
+# 実行
+# ─────────────────────────────────────
+def run(input_path, output_path, fmt="csv", input_format=None, workers=None,
+        chunk_size=10_000, n_months=engine.N_MONTHS, restart=False, log=sys.stderr):
+    progress_path = output_path + ".progress"
+    if restart and os.path.exists(progress_path):
+        os.remove(progress_path)
+    state = _load_progress(progress_path)
+    # 前回と違う条件で続きを書くと、別の前提で計算した行が同じ出力に混ざるので断る
+    # （これらのキーがない古い .progress は、そのまま続きから実行する）
+    settings = {"chunk_size": chunk_size, "format": fmt, "n_months": n_months,
+                "input": os.path.abspath(input_path)}
+    if any(state.get(k, v) != v for k, v in settings.items()):
+        raise SystemExit("前回と chunk サイズ / 出力形式 / 予測期間 / 入力ファイルが異なります。"
+                         "--restart で最初からやり直してください。")
+
+    skip = state["rows_done"]
+    if fmt == "parquet":
+        sink = ParquetSink(output_path, state["position"])
+    else:
+        sink = CsvSink(output_path, state["position"])
+
+    rows = itertools.islice(read_rows(input_path, input_format), skip, None)
+    start_time = time.perf_counter()
+    done = 0
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        chunks = chunked(rows, chunk_size)
+        offset = skip
+
+        def submit_next():
+            nonlocal offset
+            chunk = next(chunks, None)
+            if chunk is None:
+                return False
+            pending.append((pool.submit(evaluate_chunk, chunk, offset, n_months), len(chunk)))
+            offset += len(chunk)
+            return True
+
+        # 入力を読みすぎないよう、処理中の chunk はワーカー数の 2 倍まで
+        for _ in range(workers * 2):
+            if not submit_next():
+                break
+        while pending:
+            future, n = pending.popleft()
+            position = sink.write(future.result())
+            done += n
+            _save_progress(progress_path, {"rows_done": skip + done, "position": position, **settings})
+            elapsed = time.perf_counter() - start_time
+            print(f"\r{skip + done:,} 行完了（今回 {done:,} 行, {done / elapsed:,.0f} 行/秒）",
+                  end="", file=log, flush=True)
+            submit_next()
+    sink.close()
+    print(file=log)
+    return skip + done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI-CFO 顧問先一括シミュレーション")
+    parser.add_argument("input", help="入力 CSV / JSON Lines")
+    parser.add_argument("-o", "--output", required=True, help="出力先（CSV ファイル、parquet はディレクトリ）")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="出力形式")
+    parser.add_argument("--input-format", choices=["csv", "jsonl"], help="入力形式（省略時は拡張子で判定）")
+    parser.add_argument("--workers", type=int, help="プロセス数（省略時は CPU 数）")
+    parser.add_argument("--chunk-size", type=int, default=10_000, help="1 回に計算する行数")
+    parser.add_argument("--months", type=int, default=engine.N_MONTHS, help="予測期間（月数）")
+    parser.add_argument("--restart", action="store_true", help="前回の続きではなく最初から実行する")
+    args = parser.parse_args(argv)
+
+    if args.format == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("parquet 出力には pyarrow が必要です（pip install pyarrow）")
+
+    run(args.input, args.output, fmt=args.format, input_format=args.input_format,
+        workers=args.workers, chunk_size=args.chunk_size, n_months=args.months,
+        restart=args.restart)
+
+
+if __name__ == "__main__":
+    main()
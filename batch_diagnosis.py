@@ -0,0 +1,284 @@
+"""
+AI-CFO 一括診断（顧問先ごとの AI 診断をまとめて作る）
+=======================================
+batch.py と同じ入力（CSV / JSON Lines）を読み、各行について app.py と同じプロンプト
+（diagnosis.build_prompt）で AI-CFO の診断を作り、JSON Lines に書き出す。
+
+    python batch_diagnosis.py clients.csv -o diagnoses.jsonl --concurrency 8 --rpm 300
+    AI_CFO_LLM_ENDPOINT=http://127.0.0.1:8766 python batch_diagnosis.py clients.csv -o diagnoses.jsonl
+
+- 【データ】を診断キャッシュと同じく量子化したキー（diagnosis_cache.cache_key）が同じ行は、
+  1 回だけ問い合わせて結果を共有する。画面の診断キャッシュにあるものは問い合わせず、
+  新しく作った診断もそこに入れる（--no-cache で使わない）。
+- 問い合わせは asyncio のワーカー（--concurrency 個）が行い、llm_client の流量制御（--rpm）と再試行を通す。
+- 診断ができたキーから順に、そのキーの行をまとめて出力に追記する（行の順番は入力順ではない。"row" が入力の行番号）。
+  止まっても同じコマンドで続きから再開できる（出力にある行は飛ばし、出力にある診断は問い合わせずに使う。
+  --restart で最初から）。問い合わせに失敗した行は出力せず、再実行したときにもう一度問い合わせる。
+- 途中経過と最後の集計で、1 分あたりの診断数（出力した行）と問い合わせ数を表示する。
+
+出力の 1 行: {"row", "id", "key", "source", "text", ルール診断の列}。
+source は llm（問い合わせた）/ shared（同じキーの行と共有）/ cache（診断キャッシュ）/ resume（前回の出力）。
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import batch
+import diagnosis
+import diagnosis_cache
+import engine
+import llm_client
+import rules
+
+logger = logging.getLogger("ai_cfo.batch_diagnosis")
+
+CHUNK_ROWS = 10_000
+PROGRESS_SECONDS = 5.0
+
+
+# ─────────────────────────────────────
+# プロンプト入力
+# ─────────────────────────────────────
+def _inputs_at(diag, i):
+    """evaluate_chunk の "diagnosis_inputs"（列）から i 行目を画面の diag_inputs と同じ形にする。"""
+    out = {}
+    for field in diagnosis.INPUT_FIELDS:
+        value = diag[field]
+        if isinstance(value, np.ndarray):
+            value = value[i].item()
+        elif isinstance(value, list):
+            value = value[i]
+        out[field] = value
+    # 画面ではショートしないとき None（バッチの計算結果は -1）
+    out["short_month"] = int(out["short_month"]) if out["short_month"] >= 0 else None
+    out["horizon"] = int(out["horizon"])
+    return out
+
+
+def plan(input_path, input_format=None, n_months=engine.N_MONTHS, done_rows=(), log=sys.stderr):
+    """入力を計算してキーごとにまとめる。
+
+    戻り値は ({key: {"inputs", "rows": [出力の行（text なし）]}}, 読めなかった行数)。
+    done_rows にある行（前回出力済み）は含めない。
+    """
+    groups = {}
+    bad = 0
+    for index, chunk in enumerate(batch.chunked(batch.read_rows(input_path, input_format), CHUNK_ROWS)):
+        start = index * CHUNK_ROWS
+        cols = batch.evaluate_chunk(chunk, start, n_months)
+        diag = cols["diagnosis_inputs"]
+        for i in range(len(chunk)):
+            row = start + i
+            if cols["error"][i]:
+                bad += 1
+                print(f"{row} 行目（id={cols['id'][i]}）は読めないので飛ばします: {cols['error'][i]}", file=log)
+                continue
+            if row in done_rows:
+                continue
+            inputs = _inputs_at(diag, i)
+            key = diagnosis_cache.cache_key(inputs)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = {"inputs": inputs, "rows": []}
+            record = {"row": row, "id": cols["id"][i], "key": key}
+            for f in rules.LABEL_FIELDS:
+                record[f] = cols[f][i]
+            group["rows"].append(record)
+    return groups, bad
+
+
+# ─────────────────────────────────────
+# 出力（追記・再開）
+# ─────────────────────────────────────
+def load_done(path):
+    """前回の出力から (出力済みの行番号の集合, {key: text}) を読む。
+
+    書きかけの最後の行（改行で終わっていない）は切り捨てる。
+    """
+    rows, texts = set(), {}
+    try:
+        f = open(path, "rb+")
+    except FileNotFoundError:
+        return rows, texts
+    with f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+        for line in data[:end].splitlines():
+            if line.strip():
+                record = json.loads(line)
+                rows.add(record["row"])
+                texts[record["key"]] = record["text"]
+    return rows, texts
+
+
+class Writer:
+    def __init__(self, path):
+        self.f = open(path, "a", encoding="utf-8")
+        self.rows = 0
+
+    def write_group(self, group, text, source):
+        """キーの行をまとめて書く。1 行目だけ source、残りは shared（resume / cache はすべて同じ source）。"""
+        lines = []
+        for n, record in enumerate(group["rows"]):
+            shared = source == "llm" and n > 0
+            lines.append(json.dumps({**record, "source": "shared" if shared else source, "text": text},
+                                    ensure_ascii=False))
+        self.f.write("\n".join(lines) + "\n")
+        self.f.flush()
+        self.rows += len(lines)
+
+    def close(self):
+        self.f.close()
+
+
+# ─────────────────────────────────────
+# 問い合わせ（asyncio のワーカー）
+# ─────────────────────────────────────
+async def diagnose_all(groups, keys, client, writer, cache=None, concurrency=4, log=sys.stderr):
+    """keys のプロンプトを concurrency 個のワーカーで問い合わせ、できたものから書き出す。
+
+    client.generate はブロッキングなので、ワーカー数と同じ大きさのスレッドプールで動かす。
+    戻り値は {"llm", "errors", "llm_seconds"}。
+    """
+    queue = asyncio.Queue()
+    for key in keys:
+        queue.put_nowait(key)
+    stats = {"llm": 0, "errors": 0, "llm_seconds": 0.0}
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    rows_before = writer.rows
+
+    async def worker(pool):
+        while True:
+            try:
+                key = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            group = groups[key]
+            prompt = diagnosis.build_prompt(group["inputs"])
+            t = time.perf_counter()
+            try:
+                text = await loop.run_in_executor(pool, client.generate, prompt)
+                if not text:
+                    raise llm_client.LLMError("empty response")
+            except Exception as e:
+                stats["errors"] += 1
+                ids = ", ".join(str(r["id"]) for r in group["rows"][:5])
+                logger.warning("diagnosis failed for %d rows (id=%s ...): %s", len(group["rows"]), ids, e)
+                continue
+            seconds = time.perf_counter() - t
+            stats["llm"] += 1
+            stats["llm_seconds"] += seconds
+            if cache is not None:
+                cache.put(key, text, seconds)
+            writer.write_group(group, text, "llm")
+
+    async def report():
+        while True:
+            await asyncio.sleep(PROGRESS_SECONDS)
+            minutes = (time.perf_counter() - started) / 60
+            print(f"\r問い合わせ {stats['llm'] + stats['errors']:,}/{len(keys):,}"
+                  f"（失敗 {stats['errors']:,}）・出力 {writer.rows - rows_before:,} 行"
+                  f"・{(writer.rows - rows_before) / minutes:,.0f} 件/分", end="", file=log, flush=True)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="diagnosis") as pool:
+        reporter = asyncio.create_task(report())
+        try:
+            await asyncio.gather(*(worker(pool) for _ in range(concurrency)))
+        finally:
+            reporter.cancel()
+    return stats
+
+
+# ─────────────────────────────────────
+# 実行
+# ─────────────────────────────────────
+def run(input_path, output_path, input_format=None, n_months=engine.N_MONTHS, concurrency=4,
+        rate_per_minute=60, api_key=None, use_cache=True, restart=False, client=None, log=sys.stderr):
+    """一括診断を実行して集計（件数・時間・1 分あたりの件数）を返す。client を渡すとそれを使う（試験用）。"""
+    if restart and os.path.exists(output_path):
+        os.remove(output_path)
+    started = time.perf_counter()
+    done_rows, done_texts = load_done(output_path)
+    groups, bad = plan(input_path, input_format, n_months, done_rows, log)
+    planned = time.perf_counter() - started
+    cache = diagnosis_cache.DiagnosisCache() if use_cache else None
+    if client is None:
+        client = llm_client.LLMClient(llm_client.make_backend(api_key), max_concurrency=concurrency,
+                                      rate_per_minute=rate_per_minute, queue_timeout=None)
+
+    writer = Writer(output_path)
+    summary = {"rows": sum(len(g["rows"]) for g in groups.values()), "skipped_done": len(done_rows),
+               "invalid": bad, "unique": len(groups), "resume": 0, "cache": 0}
+    try:
+        pending = []
+        for key, group in groups.items():
+            if key in done_texts:
+                writer.write_group(group, done_texts[key], "resume")
+                summary["resume"] += 1
+                continue
+            cached = cache.get(key) if cache is not None else None
+            if cached is not None:
+                writer.write_group(group, cached["text"], "cache")
+                summary["cache"] += 1
+                continue
+            pending.append(key)
+        # 行の多いキーから問い合わせる（途中で止めても出力できた行が多くなる）
+        pending.sort(key=lambda k: -len(groups[k]["rows"]))
+        summary.update(asyncio.run(diagnose_all(groups, pending, client, writer, cache, concurrency, log)))
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - started
+    summary.update({
+        "written": writer.rows, "plan_seconds": planned, "seconds": elapsed,
+        "rows_per_minute": writer.rows / elapsed * 60,
+        "llm_per_minute": summary["llm"] / (elapsed - planned) * 60 if elapsed > planned else 0.0,
+    })
+    print(file=log)
+    return summary
+
+
+def format_summary(s):
+    return (f"{s['written']:,} 行を出力（新規のキー {s['unique']:,} 件: 問い合わせ {s['llm']:,}・"
+            f"診断キャッシュ {s['cache']:,}・前回の出力 {s['resume']:,}・失敗 {s['errors']:,}）\n"
+            f"前回までに出力済み {s['skipped_done']:,} 行・読めない行 {s['invalid']:,} 行\n"
+            f"{s['seconds']:.1f}秒（計算とキーの集約 {s['plan_seconds']:.1f}秒）: "
+            f"{s['rows_per_minute']:,.0f} 件/分（問い合わせ {s['llm_per_minute']:,.0f} 件/分）")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI-CFO 顧問先一括診断")
+    parser.add_argument("input", help="入力 CSV / JSON Lines（batch.py と同じ列）")
+    parser.add_argument("-o", "--output", required=True, help="出力先（JSON Lines）")
+    parser.add_argument("--input-format", choices=["csv", "jsonl"], help="入力形式（省略時は拡張子で判定）")
+    parser.add_argument("--months", type=int, default=engine.N_MONTHS, help="予測期間（月数）")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時に問い合わせる数")
+    parser.add_argument("--rpm", type=float, default=60, help="1 分あたりの問い合わせ上限")
+    parser.add_argument("--no-cache", action="store_true", help="画面の診断キャッシュを読み書きしない")
+    parser.add_argument("--restart", action="store_true", help="前回の続きではなく最初から実行する")
+    args = parser.parse_args(argv)
+
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if llm_client.backend_name() == "gemini" and not api_key:
+        parser.error("環境変数 GEMINI_API_KEY を設定してください（スタブは AI_CFO_LLM_BACKEND=stub）")
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    summary = run(args.input, args.output, input_format=args.input_format, n_months=args.months,
+                  concurrency=args.concurrency, rate_per_minute=args.rpm, api_key=api_key,
+                  use_cache=not args.no_cache, restart=args.restart)
+    print(format_summary(summary))
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""
+計算 API の負荷試験
+=======================================
+api.py を別プロセスで起動し、keep-alive の接続を複数張って
+
+- POST /v1/simulate（1 リクエストあたりのシナリオ数を変えて）の リクエスト/秒・シナリオ/秒・p50 / p95
+- POST /v1/batch（JSON Lines を chunked で送り、流れてくる結果を読む）の 行/秒・最初の行までの時間
+
+を測る。サーバーの Server-Timing から engine（計算）にかかった時間の中央値も出す。
+
+    python benchmarks/api_load.py
+    python benchmarks/api_load.py --connections 16 --duration 10 --scenarios 1 100 --batch-rows 1000000
+    python benchmarks/api_load.py --url http://127.0.0.1:8765     # 起動済みのサーバーに対して
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+COMPANY = {"revenue": 5_000_000, "cogs": 2_000_000, "fixed_cost": 2_500_000,
+           "cash": 3_000_000, "receivables": 7_500_000, "payables": 2_000_000}
+
+
+def start_server():
+    proc = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, "api.py"), "--port", "0"],
+                            stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline()
+    return proc, line.strip().split()[-1]
+
+
+def _scenarios(n):
+    return [{"sales_change": -25 + i % 51, "cost_cut": (i % 9) - 4, "invest": 100_000 * (i % 11),
+             "ramp_months": 1 + i % 6} for i in range(n)]
+
+
+async def _read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    headers = {}
+    for line in head.decode("latin-1").split("\r\n")[1:]:
+        if ":" in line:
+            k, v = line.split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+    body = await reader.readexactly(int(headers["content-length"]))
+    return headers, body
+
+
+def _engine_ms(server_timing):
+    for part in server_timing.split(","):
+        name, _, dur = part.strip().partition(";dur=")
+        if name == "engine":
+            return float(dur)
+    return 0.0
+
+
+async def bench_simulate(host, port, connections, duration, n_scenarios, n_months=12):
+    body = json.dumps({"company": COMPANY, "scenarios": _scenarios(n_scenarios), "n_months": n_months}).encode()
+    request = (f"POST /v1/simulate HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n"
+               f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+    latencies, engine_ms = [], []
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        reader, writer = await asyncio.open_connection(host, port)
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            writer.write(request)
+            headers, _ = await _read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            engine_ms.append(_engine_ms(headers.get("server-timing", "")))
+        writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    n = len(latencies)
+    return {
+        "req_per_s": n / elapsed, "scenarios_per_s": n * n_scenarios / elapsed,
+        "p50_ms": latencies[n // 2] * 1000, "p95_ms": latencies[int(n * 0.95)] * 1000,
+        "engine_p50_ms": statistics.median(engine_ms),
+    }
+
+
+async def bench_batch(host, port, rows, n_months=12):
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write((f"POST /v1/batch?n_months={n_months} HTTP/1.1\r\nHost: {host}\r\n"
+                  "Content-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n").encode())
+    scenarios = _scenarios(1000)
+
+    async def send():
+        block = []
+        for i in range(rows):
+            block.append(json.dumps({**COMPANY, **scenarios[i % 1000], "id": i}))
+            if len(block) == 5000 or i == rows - 1:
+                data = ("\n".join(block) + "\n").encode()
+                writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                await writer.drain()
+                block = []
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    started = time.perf_counter()
+    sender = asyncio.create_task(send())
+    await reader.readuntil(b"\r\n\r\n")
+    first_line, received, trailers = None, 0, ""
+    while True:
+        size = int((await reader.readuntil(b"\r\n")).strip(), 16)
+        if size == 0:
+            trailers = (await reader.readuntil(b"\r\n\r\n")).decode()
+            break
+        data = await reader.readexactly(size + 2)
+        if first_line is None:
+            first_line = time.perf_counter() - started
+        received += data.count(b"\n") - 1
+    elapsed = time.perf_counter() - started
+    await sender
+    writer.close()
+    timing = next((line.split(":", 1)[1] for line in trailers.split("\r\n") if line.startswith("Server-Timing")), "")
+    return {"rows": received, "rows_per_s": received / elapsed, "first_line_ms": first_line * 1000,
+            "seconds": elapsed, "server_timing": timing.strip()}
+
+
+async def main(args):
+    proc = None
+    url = args.url
+    if url is None:
+        proc, url = start_server()
+    parts = urlsplit(url)
+    try:
+        print(f"{'シナリオ/件':>10} {'接続':>5} {'リクエスト/秒':>14} {'シナリオ/秒':>13} {'p50':>9} {'p95':>9} {'うち計算':>9}")
+        for n in args.scenarios:
+            r = await bench_simulate(parts.hostname, parts.port, args.connections, args.duration, n)
+            print(f"{n:>10} {args.connections:>5} {r['req_per_s']:12,.0f} {r['scenarios_per_s']:13,.0f} "
+                  f"{r['p50_ms']:7.2f}ms {r['p95_ms']:7.2f}ms {r['engine_p50_ms']:7.2f}ms")
+        if args.batch_rows:
+            r = await bench_batch(parts.hostname, parts.port, args.batch_rows)
+            print(f"\n/v1/batch {r['rows']:,} 行: {r['seconds']:.2f}s（{r['rows_per_s']:,.0f} 行/秒、"
+                  f"最初の行まで {r['first_line_ms']:.0f}ms）")
+            print(f"  Server-Timing: {r['server_timing']}")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="起動済みのサーバー（省略時はこのスクリプトが api.py を起動する）")
+    parser.add_argument("--connections", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5.0, help="各計測の秒数")
+    parser.add_argument("--scenarios", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--batch-rows", type=int, default=100_000)
+    asyncio.run(main(parser.parse_args()))
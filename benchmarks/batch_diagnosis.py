@@ -0,0 +1,128 @@
+"""
+一括診断の通し試験と速度
+=======================================
+ローカルの Gemini スタブサーバー（stub_llm_server.py）を立て、AI_CFO_LLM_ENDPOINT で Gemini SDK ごと
+そこに向けて batch_diagnosis を動かし、
+
+- 同時実行数ごとの 診断/分（出力した行）・問い合わせ/分・スタブが受けた件数と同時処理数の最大値
+- 途中で止めて（プロセスを kill）再実行したときに、全行がそろい、問い合わせが重複しないこと
+
+を確かめる。入力は同じ決算数値の顧問先が混ざるポートフォリオ（端数だけ違う行はキーが同じになる）。
+
+    python benchmarks/batch_diagnosis.py
+    python benchmarks/batch_diagnosis.py --rows 5000 --profiles 800 --latency 1.5 --concurrency 8 32 64
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+# このファイルと同名の batch_diagnosis はリポジトリ直下のものを読む
+sys.path.insert(0, REPO_DIR)
+
+import batch_diagnosis  # noqa: E402
+import llm_client  # noqa: E402
+import stub_llm_server  # noqa: E402
+
+INDUSTRIES = ("製造業", "建設業", "IT・サービス業", "飲食業", "小売業", "卸売業", "医療・福祉", "その他")
+
+
+def write_clients(path, rows, profiles, seed=0):
+    """profiles 通りの決算数値を rows 行に散らす（同じ数値の行は端数だけ変える）。"""
+    rng = np.random.default_rng(seed)
+    revenue = rng.integers(100, 3000, profiles) * 10_000
+    pick = np.minimum(rng.zipf(1.3, rows) - 1, profiles - 1)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        out = csv.writer(f)
+        out.writerow(["id", "industry", "revenue", "cogs", "fixed_cost", "cash", "receivables", "payables",
+                      "invest", "sales_change"])
+        for i, p in enumerate(pick):
+            rev = int(revenue[p])
+            out.writerow([f"C{i:06d}", INDUSTRIES[p % len(INDUSTRIES)], rev + int(rng.integers(0, 50)),
+                          rev * (30 + p % 50) // 100, rev * (20 + p % 40) // 100, rev * (1 + p % 4),
+                          rev * (p % 3), rev * (p % 2) // 2, (p % 5) * 100_000, (p % 7) * 5 - 10])
+
+
+def _stats(url):
+    with urllib.request.urlopen(url + "/stats") as r:
+        return json.load(r)
+
+
+def bench(path, latency, concurrency, rows):
+    server, state, url = stub_llm_server.start(latency=latency)
+    os.environ["AI_CFO_LLM_ENDPOINT"] = url
+    out = os.path.join(tempfile.mkdtemp(), "diagnoses.jsonl")
+    try:
+        client = llm_client.LLMClient(llm_client.make_backend("stub-key"), max_concurrency=concurrency,
+                                      rate_per_minute=60_000, queue_timeout=None)
+        s = batch_diagnosis.run(path, out, concurrency=concurrency, use_cache=False, client=client,
+                                log=open(os.devnull, "w"))
+        stub = _stats(url)
+    finally:
+        server.shutdown()
+    ok = s["written"] == rows and stub["requests"] == s["unique"] and stub["max_inflight"] <= concurrency
+    print(f"{concurrency:>6} {s['written']:>8,} {s['unique']:>8,} {stub['requests']:>9,} {stub['max_inflight']:>8}"
+          f" {s['seconds']:8.1f}s {s['rows_per_minute']:10,.0f} {s['llm_per_minute']:10,.0f}  {'OK' if ok else 'NG'}")
+    return ok
+
+
+def resume_check(path, latency, concurrency, rows, kill_after):
+    """別プロセスで実行して途中で kill し、再実行で続きから終わることを確かめる。"""
+    server, state, url = stub_llm_server.start(latency=latency)
+    out = os.path.join(tempfile.mkdtemp(), "diagnoses.jsonl")
+    env = {**os.environ, "AI_CFO_LLM_ENDPOINT": url, "GEMINI_API_KEY": "stub-key", "AI_CFO_LLM_BACKEND": "gemini"}
+    cmd = [sys.executable, os.path.join(REPO_DIR, "batch_diagnosis.py"), path, "-o", out, "--no-cache",
+           "--concurrency", str(concurrency), "--rpm", "60000"]
+    try:
+        proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(kill_after)
+        proc.kill()
+        proc.wait()
+        with open(out, encoding="utf-8") as f:
+            first = sum(1 for _ in f)
+        requests_first = _stats(url)["requests"]
+        subprocess.run(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        with open(out, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        stub = _stats(url)
+    finally:
+        server.shutdown()
+    unique = len({r["key"] for r in records})
+    complete = sorted(r["row"] for r in records) == list(range(rows))
+    # kill の時点で問い合わせ中だったもの（最大で同時実行数）だけは、再実行でもう一度問い合わせる
+    ok = complete and stub["requests"] <= unique + concurrency
+    print(f"\n再開: {kill_after:.0f}秒で kill → {first:,} 行（問い合わせ {requests_first:,}）、"
+          f"再実行後 {len(records):,} 行・キー {unique:,} 件に対して問い合わせ {stub['requests']:,} 件  "
+          f"{'OK' if ok else 'NG'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--profiles", type=int, default=400, help="決算数値の種類数")
+    parser.add_argument("--latency", type=float, default=0.8, help="スタブの 1 件あたりの応答秒数")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--kill-after", type=float, default=6.0, help="再開の確認で kill するまでの秒数")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "clients.csv")
+    write_clients(path, args.rows, args.profiles)
+    print(f"{'同時数':>6} {'出力行':>8} {'キー':>8} {'問い合わせ':>7} {'最大同時':>6} {'時間':>9} {'診断/分':>9} {'問合せ/分':>8}")
+    ok = all([bench(path, args.latency, c, args.rows) for c in args.concurrency])
+    ok = resume_check(path, args.latency, min(args.concurrency), args.rows, args.kill_after) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+資金イベント（賞与・税金・設備投資）の当てはめの速度
+=======================================
+予定の件数を変えて、
+
+- cash_events.apply（月ごとの累計ベクトルを 1 回足す）と、予定を 1 回ずつ残高行列に足すやり方の時間
+  （結果が一致することも確かめる）
+- engine.project（レバーグリッドと同じ規模のシナリオ数）に対する apply の上乗せ
+- モンテカルロ・日次の資金繰りで、予定なしとの時間の差
+
+を測る。予定の件数が増えても、apply・モンテカルロの時間がほとんど変わらないことを見る。
+
+    python benchmarks/cash_events.py
+    python benchmarks/cash_events.py --scenarios 200000 --months 60 --events 0 10 50 200
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+# このファイルと同名の cash_events はリポジトリ直下のものを読む
+sys.path.insert(0, REPO_DIR)
+
+import cash_events  # noqa: E402
+import daily  # noqa: E402
+import engine  # noqa: E402
+import montecarlo  # noqa: E402
+
+START = np.datetime64("2026-11")
+BASE = dict(revenue=5_000_000, cogs=3_000_000, fixed_cost=1_500_000, cash=20_000_000,
+            receivables=5_000_000, payables=3_000_000)
+
+
+def make_events(n, seed=0):
+    """賞与・税金に、毎年・1 回だけの予定を混ぜて n 件にする。"""
+    rng = np.random.default_rng(seed)
+    fixed = cash_events.combine(cash_events.bonus(1_000_000, START),
+                                cash_events.taxes(2_000_000, 1_000_000, 3, START, interim=True))
+    rows = [(START + int(m), int(d), -float(a), int(e), cash_events.OTHER)
+            for m, d, a, e in zip(rng.integers(-12, 48, n), rng.integers(1, 32, n),
+                                  rng.integers(1, 50, n) * 10_000, rng.choice([0, 3, 12], n))]
+    return cash_events.combine(fixed, cash_events.schedule(rows))[:n]
+
+
+def naive(cash, events, n_months):
+    """予定を 1 回ずつ、その月以降の全シナリオの残高から引く（比較用）。"""
+    out = cash.copy()
+    occ = cash_events.occurrences(events, START, n_months)
+    for month, amount in zip(occ["month"], occ["amount"]):
+        out[:, month:] += amount
+    return out
+
+
+def best(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", type=int, default=100_000, help="apply を試すシナリオ数")
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--events", type=int, nargs="+", default=[0, 10, 50, 200])
+    parser.add_argument("--paths", type=int, default=100_000, help="モンテカルロのパス数")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    k = args.scenarios
+    levers = dict(sales_change=rng.uniform(-30, 30, k), cost_cut=rng.uniform(-10, 10, k),
+                  invest=rng.uniform(-500_000, 500_000, k), ramp_months=rng.integers(1, 7, k))
+    t_project = best(lambda: engine.project(**BASE, **levers, n_months=args.months))
+    result = engine.project(**BASE, **levers, n_months=args.months)
+    t_mc0 = best(lambda: montecarlo.run(**BASE, n_months=24, n_paths=args.paths, seed=0), 1)
+    t_day0 = best(lambda: daily.project_daily(**BASE, n_months=24, start=START,
+                                              sales_change=levers["sales_change"][:1000]), 1)
+
+    print(f"engine.project {k:,} シナリオ × {args.months}ヶ月: {t_project * 1000:.0f}ms"
+          f" / モンテカルロ {args.paths:,} パス: {t_mc0 * 1000:.0f}ms / 日次 1,000 シナリオ: {t_day0 * 1000:.0f}ms（予定なし）")
+    print(f"{'予定':>5} {'展開後':>6} {'apply':>9} {'1件ずつ':>9} {'project比':>9} {'MC 差':>9} {'日次 差':>9}")
+    ok = True
+    for n in args.events:
+        events = make_events(n)
+        n_occ = len(cash_events.occurrences(events, START, args.months)["month"])
+        t_apply = best(lambda: cash_events.apply(result, events, START))
+        t_naive = best(lambda: naive(result["cash"], events, args.months), 1)
+        same = np.allclose(cash_events.apply(result, events, START)["cash"], naive(result["cash"], events, args.months))
+        t_mc = best(lambda: montecarlo.run(**BASE, n_months=24, n_paths=args.paths, seed=0,
+                                           events=events, start=START), 1)
+        t_day = best(lambda: daily.project_daily(**BASE, n_months=24, start=START, events=events,
+                                                 sales_change=levers["sales_change"][:1000]), 1)
+        ok &= same
+        print(f"{n:>6} {n_occ:>8} {t_apply * 1000:7.1f}ms {t_naive * 1000:7.1f}ms {t_apply / t_project:8.0%}"
+              f" {(t_mc - t_mc0) * 1000:+7.0f}ms {(t_day - t_day0) * 1000:+7.0f}ms  {'OK' if same else 'NG'}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
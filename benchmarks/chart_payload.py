@@ -0,0 +1,82 @@
+"""
+結果グラフの組み立て時間と送信量
+=======================================
+charts.py のひな形方式と、以前の「毎回 go.Figure を組み立てる」方式で、
+資金繰り予測グラフ 1 枚あたりの
+
+- 組み立て＋JSON 化の時間（st.plotly_chart が行う to_dict / to_json を含む）
+- ブラウザへ送るグラフ定義（JSON）のバイト数
+
+を比べる。長い期間（日次相当）や多数シナリオの重ね描きも測る。
+
+    python benchmarks/chart_payload.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import charts  # noqa: E402
+from formatting import jp_format  # noqa: E402
+
+
+def _from_scratch(cf_line, months_label, unit_str):
+    """以前の app.py と同じ組み立て方。"""
+    divider = charts.UNITS[unit_str]
+    y_cf_scaled = [v / divider for v in cf_line]
+    fig = go.Figure()
+    min_y_scaled = min(min(y_cf_scaled), -100) if min(y_cf_scaled) < 0 else 0
+    fig.add_hrect(y0=min_y_scaled, y1=0, fillcolor="#FEF2F2", opacity=0.8, layer="below", line_width=0)
+    fig.add_hline(y=0, line_dash="dash", line_color="#EF4444", annotation_text="0", annotation_position="bottom right")
+    fig.add_trace(go.Scatter(
+        x=months_label, y=y_cf_scaled, mode='lines+markers',
+        line=dict(color='#1A365D', width=3),
+        marker=dict(size=8, color=['#EF4444' if x < 0 else '#1A365D' for x in cf_line]),
+        name="現預金推移",
+        text=[jp_format(v) for v in cf_line], hovertemplate='%{x}<br>残高: %{text}<extra></extra>'
+    ))
+    fig.update_layout(
+        xaxis_title="", yaxis_title=f"現預金残高 ({unit_str})",
+        height=300, margin=dict(l=10, r=10, t=10, b=10),
+        plot_bgcolor='white', paper_bgcolor='white',
+    )
+    return fig
+
+
+def _measure(build, repeat):
+    build()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fig = build()
+        fig.to_dict()
+        spec = pio.to_json(fig, validate=False)
+    return (time.perf_counter() - started) / repeat * 1000, len(spec.encode("utf-8"))
+
+
+def main():
+    rng = np.random.default_rng(0)
+    cases = [("6ヶ月・1本", 7, 1), ("60ヶ月・1本", 61, 1), ("1,800日・1本", 1801, 1),
+             ("60ヶ月・8本", 61, 8), ("1,800日・100本", 1801, 100)]
+    print(f"{'ケース':<14} {'方式':<8} {'時間':>9} {'送信量':>11}  トレース")
+    for name, n_points, n_lines in cases:
+        cash = 3e6 + np.cumsum(rng.normal(0, 2e5, (n_lines, n_points)), axis=1)
+        labels = [f"{i}ヶ月" for i in range(n_points)]
+        repeat = 5 if n_points * n_lines > 10_000 else 20
+
+        if n_lines == 1:
+            ms, size = _measure(lambda: _from_scratch(cash[0].tolist(), labels, "万円"), repeat)
+            print(f"{name:<14} {'毎回組立':<8} {ms:7.1f}ms {size:>10,}B")
+        ms, size = _measure(lambda: charts.cash_chart(cash, labels, "万円"), repeat)
+        fig = charts.cash_chart(cash, labels, "万円")
+        traces = ", ".join(sorted({f"{t.type}" for t in fig.data}))
+        print(f"{name:<14} {'ひな形':<8} {ms:7.1f}ms {size:>10,}B  {len(fig.data)}（{traces}）")
+
+
+if __name__ == "__main__":
+    main()
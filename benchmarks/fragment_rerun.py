@@ -0,0 +1,59 @@
+"""
+スライダー 1 回分の再実行コスト（全体再実行 vs フラグメント再実行）
+=======================================
+app.py を Streamlit のテスト用ハーネス（AppTest）でヘッドレスに動かし、
+STEP 2 の「固定費の増減」スライダーを動かしたときの
+
+- スクリプト（またはフラグメント）の実行時間（AppTest の待ち合わせは含まない）
+- ブラウザへ送るデルタ（ForwardMsg）のバイト数と件数
+
+を、ページ全体を再実行した場合と scenario_section フラグメントだけを
+再実行した場合（実際のブラウザ操作と同じ）で比べる。
+
+    python benchmarks/fragment_rerun.py --ticks 20
+
+計測の仕組みは harness.py を参照。
+"""
+
+import argparse
+import statistics
+
+from harness import AppDriver
+
+
+def run(ticks=20):
+    driver = AppDriver()
+    driver.start()
+
+    results = {"全体再実行": [], "フラグメント再実行": []}
+    for i in range(ticks):
+        value = (i % 10 + 1) * 100_000
+        results["全体再実行"].append(driver.set_slider(value, key="invest_slider", fragment=False))
+        results["フラグメント再実行"].append(driver.set_slider(-value, key="invest_slider"))
+
+    summary = {}
+    for name, rows in results.items():
+        seconds, sizes, counts = zip(*rows)
+        summary[name] = {
+            "median_ms": statistics.median(seconds) * 1000,
+            "bytes": statistics.median(sizes),
+            "deltas": statistics.median(counts),
+        }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="スライダー操作 1 回分の再実行コストを測る")
+    parser.add_argument("--ticks", type=int, default=20, help="スライダーを動かす回数（方式ごと）")
+    args = parser.parse_args(argv)
+
+    summary = run(args.ticks)
+    for name, s in summary.items():
+        print(f"{name:<12} {s['median_ms']:7.1f} ms  {s['bytes']:>9,.0f} B  デルタ {s['deltas']:.0f} 件")
+    full, frag = summary["全体再実行"], summary["フラグメント再実行"]
+    print(f"比率          時間 {full['median_ms'] / frag['median_ms']:.2f}x  "
+          f"送信量 {full['bytes'] / frag['bytes']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+ベンチマーク用の app.py 駆動ハーネス
+=======================================
+Streamlit のテスト用ハーネス（AppTest）で app.py をヘッドレスに動かし、
+1 回の操作ごとに次を記録する。
+
+- スクリプト（またはフラグメント）の実行時間（AppTest の待ち合わせは含まない）
+- ブラウザへ送るデルタ（ForwardMsg）のバイト数と件数
+
+本番サーバーとの違いを埋めるため、次の 2 点を差し替える。
+- AppTest は実行のたびにスクリプトをコンパイルし直すので、コンパイル結果（ScriptCache）を使い回す。
+- AppTest は常にページ全体を再実行するので、フラグメント内のウィジェット操作は
+  再実行要求（RerunData）にフラグメント ID を載せて、ブラウザと同じくフラグメントだけを再実行する。
+"""
+
+import functools
+import os
+import time
+
+from streamlit.runtime.forward_msg_queue import ForwardMsgQueue
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.runtime.scriptrunner.script_runner import ScriptRunner
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import local_script_runner
+
+APP_PATH = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "app.py"))
+
+_delta_sizes = []
+_run_seconds = []
+_run_hooks = []
+_instrumented = False
+
+
+def instrument():
+    """デルタのバイト数と、スクリプト本体の実行時間を記録するようにする（何度呼んでもよい）。"""
+    global _instrumented
+    if _instrumented:
+        return
+    enqueue = ForwardMsgQueue.enqueue
+    run_script = ScriptRunner._run_script
+
+    def counting_enqueue(self, msg):
+        if msg.HasField("delta"):
+            _delta_sizes.append(msg.ByteSize())
+        return enqueue(self, msg)
+
+    def timed_run_script(self, rerun_data):
+        for hook in _run_hooks:
+            hook(True)
+        started = time.perf_counter()
+        try:
+            return run_script(self, rerun_data)
+        finally:
+            _run_seconds.append(time.perf_counter() - started)
+            for hook in _run_hooks:
+                hook(False)
+
+    ForwardMsgQueue.enqueue = counting_enqueue
+    ScriptRunner._run_script = timed_run_script
+    script_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+    _instrumented = True
+
+
+def add_run_hook(hook):
+    """スクリプト実行の前後に hook(True) / hook(False) を呼ぶ（実行スレッド内で呼ばれる）。"""
+    _run_hooks.append(hook)
+
+
+def remove_run_hook(hook):
+    _run_hooks.remove(hook)
+
+
+class AppDriver:
+    """app.py を 1 セッション分動かす。各操作は (秒, バイト数, デルタ件数) を返す。"""
+
+    def __init__(self, path=APP_PATH, timeout=60):
+        instrument()
+        self.at = AppTest.from_file(path, default_timeout=timeout)
+        self.fragment_ids = []
+
+    def start(self):
+        """初回表示（ページ全体の実行）。"""
+        result = self._run(self.at.run)
+        self.fragment_ids = list(self.at._fragment_storage._fragments)
+        return result
+
+    def click(self, key):
+        """サイドバーなどフラグメント外のボタン（ページ全体を再実行）。"""
+        return self._run(self.at.button(key=key).click().run)
+
+    def set_slider(self, value, key=None, label=None, fragment=True):
+        """スライダーを動かす。fragment=True ならフラグメントだけを再実行する。"""
+        widget = self._find(self.at.slider, key, label)
+        return self._run(widget.set_value(value).run, fragment)
+
+    def _find(self, widgets, key, label):
+        if key is not None:
+            return widgets(key=key)
+        return next(w for w in widgets if w.label == label)
+
+    def _run(self, run, fragment=False):
+        _delta_sizes.clear()
+        _run_seconds.clear()
+        rerun_data = local_script_runner.RerunData
+        if fragment and self.fragment_ids:
+            local_script_runner.RerunData = functools.partial(rerun_data, fragment_id_queue=list(self.fragment_ids))
+        try:
+            run()
+        finally:
+            local_script_runner.RerunData = rerun_data
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].value)
+        return sum(_run_seconds), sum(_delta_sizes), len(_delta_sizes)
@@ -0,0 +1,110 @@
+"""
+会計データ取り込みの速度
+=======================================
+仕訳帳 CSV（Shift-JIS、3 年分）を行数を変えて作り、ledger_import で
+
+- 初回の取り込み（SHA-256 の計算 + チャンク読み + 集計）
+- 同じファイルの再アップロード（集計表のキャッシュから）
+- 科目の割り当てを変えたときの出し直し（summarize だけ）
+
+の時間と、初回の取り込みを新しいプロセスで行ったときの最大常駐メモリ（RSS。括弧内は import 直後）を測る。
+
+    python benchmarks/ledger_import.py
+    python benchmarks/ledger_import.py --rows 5000000
+"""
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, os.pardir))
+
+import ledger_import  # noqa: E402
+
+ACCOUNTS = ("普通預金", "現金", "売掛金", "買掛金", "売上高", "仕入高", "外注費", "給料手当", "地代家賃",
+            "水道光熱費", "通信費", "旅費交通費", "消耗品費", "支払手数料", "雑費", "未払金", "預り金")
+
+
+def write_journal(path, rows, years=3, seed=0):
+    """freee 風の見出しを持つ仕訳帳を cp932 で書く。"""
+    rng = np.random.default_rng(seed)
+    days = pd.date_range("2023-04-01", periods=365 * years, freq="D").strftime("%Y/%m/%d").to_numpy()
+    accounts = np.array(ACCOUNTS, dtype=object)
+    with open(path, "w", encoding="cp932", newline="") as f:
+        f.write("取引日,伝票番号,借方勘定科目,借方補助科目,借方金額(円),貸方勘定科目,貸方補助科目,貸方金額(円),摘要\n")
+        for start in range(0, rows, 500_000):
+            n = min(500_000, rows - start)
+            amount = rng.integers(1_000, 2_000_000, n)
+            pd.DataFrame({
+                "date": np.sort(days[rng.integers(0, len(days), n)]),
+                "no": np.arange(start, start + n),
+                "debit": accounts[rng.integers(0, len(accounts), n)], "debit_sub": "",
+                "debit_amount": amount,
+                "credit": accounts[rng.integers(0, len(accounts), n)], "credit_sub": "",
+                "credit_amount": amount, "memo": "テスト取引",
+            }).to_csv(f, header=False, index=False)
+
+
+_COLD_CODE = """
+import json, sys, time
+import ledger_import
+
+def peak_mb():
+    # ru_maxrss は fork 元の値を引き継ぐので、exec 後のプロセスだけの最大値（VmHWM）を読む
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) / 1024
+
+rss = peak_mb()
+with open(sys.argv[1], "rb") as f:
+    started = time.perf_counter()
+    ledger_import.AggregateCache(sys.argv[2]).load(f)
+    seconds = time.perf_counter() - started
+print(json.dumps({"seconds": seconds, "rss_mb": peak_mb(), "import_rss_mb": rss}))
+"""
+
+
+def _cold(path, db):
+    out = subprocess.run([sys.executable, "-c", _COLD_CODE, path, db], capture_output=True, text=True, check=True,
+                         env={**os.environ, "PYTHONPATH": os.path.join(BENCH_DIR, os.pardir)})
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def bench(rows):
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "journal.csv")
+    write_journal(path, rows)
+    size_mb = os.path.getsize(path) / 1e6
+    db = os.path.join(tmp, "ledger.sqlite3")
+    cold = _cold(path, db)
+    cache = ledger_import.AggregateCache(db)
+
+    with open(path, "rb") as f:
+        data = io.BytesIO(f.read())    # アップロードされたファイルと同じくメモリ上から読む
+    started = time.perf_counter()
+    agg = cache.load(data)
+    warm = time.perf_counter() - started
+
+    started = time.perf_counter()
+    summary = ledger_import.summarize(agg, months=12)
+    remap = time.perf_counter() - started
+    print(f"{rows:>10,} {size_mb:7.0f}MB {cold['seconds']:8.2f}s {warm * 1000:9.0f}ms {remap * 1000:8.1f}ms"
+          f" {cold['rss_mb']:6.0f}MB ({cold['import_rss_mb']:.0f}MB)"
+          f"  ({summary['period'][0]}〜{summary['period'][1]}, 科目 {len(agg['accounts'])})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000, 3_000_000])
+    args = parser.parse_args()
+    print(f"{'仕訳行数':>10} {'サイズ':>9} {'初回':>9} {'再アップ':>10} {'割当変更':>9} {'最大RSS':>16}")
+    for rows in args.rows:
+        bench(rows)
@@ -0,0 +1,83 @@
+"""
+保存シナリオの比較速度
+=======================================
+scenario_store.ResultMemo で、保存シナリオ N 本を比べるときの
+
+- 初回（全本数を計算）
+- 2 回目以降（全本数がメモにある）
+- 1 本だけ編集した直後（その 1 本だけ計算）
+
+の時間と、app.py で保存シナリオを 0 本 / 50 本重ねたときのスライダー操作 1 回の時間を測る。
+
+    python benchmarks/scenario_compare.py
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, os.pardir))
+os.environ.setdefault("AI_CFO_SCENARIO_DB", os.path.join(tempfile.mkdtemp(), "scenarios.sqlite3"))
+
+import scenario_store  # noqa: E402
+from harness import AppDriver  # noqa: E402
+
+BASE = {"revenue": 5_000_000, "cogs": 2_000_000, "fixed_cost": 2_500_000,
+        "cash": 3_000_000, "receivables": 7_500_000, "payables": 2_000_000}
+
+
+def _scenarios(n, offset=0.0):
+    return [{"sales_change": -25 + i, "cost_cut": (i % 9) - 4 + offset,
+             "invest": 100_000 * (i % 11), "ramp_months": 1 + i % 6} for i in range(n)]
+
+
+def _ms(fn, repeat=20):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times) * 1000
+
+
+def bench_memo():
+    print(f"{'本数':>6} {'初回':>9} {'2回目以降':>10} {'1本編集':>9}")
+    for n in (1, 10, 50, 200):
+        scenarios = _scenarios(n)
+        cold = _ms(lambda: scenario_store.ResultMemo().compare(BASE, scenarios, n_months=36))
+        memo = scenario_store.ResultMemo()
+        memo.compare(BASE, scenarios, n_months=36)
+        warm = _ms(lambda: memo.compare(BASE, scenarios, n_months=36))
+
+        edits = iter(range(1, 10_000))
+
+        def edit_one():
+            scenarios[0] = {**scenarios[0], "invest": 10_000 * next(edits)}
+            memo.compare(BASE, scenarios, n_months=36)
+
+        edited = _ms(edit_one)
+        print(f"{n:>6} {cold:7.2f}ms {warm:8.2f}ms {edited:7.2f}ms")
+
+
+def bench_app(repeat=5):
+    print(f"\n{'重ねる本数':>10} {'スライダー 1 回':>14} {'送信量':>10}")
+    store = scenario_store.ScenarioStore()
+    for n in (0, 50):
+        owner = f"bench{n}"
+        for i, levers in enumerate(_scenarios(n)):
+            store.save(owner, f"案{i + 1}", levers)
+        driver = AppDriver()
+        driver.at.query_params["ws"] = owner
+        driver.start()
+        results = [driver.set_slider(v, key="invest_slider") for v in range(0, 100_000 * repeat * 2, 100_000)]
+        ms = statistics.median(r[0] for r in results[1:]) * 1000
+        size = statistics.median(r[1] for r in results[1:])
+        print(f"{n:>10} {ms:12.1f}ms {size:>9,.0f}B")
+
+
+if __name__ == "__main__":
+    bench_memo()
+    bench_app()
@@ -0,0 +1,94 @@
+"""
+起動時間ベンチマーク
+=======================================
+コンテナの起動直後（コールドスタート）にかかる時間を、毎回新しい Python プロセスで測る。
+
+    python benchmarks/startup.py
+    python benchmarks/suite.py --only startup     # ベースラインと比較
+
+各項目について次を出す。
+    import_<名前> : そのモジュールを（依存ごと）初めて import するのにかかる時間
+    first_paint  : AppTest で app.py を初めて表示し終えるまでの時間（Streamlit 自体の import は除く）
+    prewarm      : 初回表示のあと、裏のスレッドで Gemini SDK を読み込み終えるまでの時間
+
+first_paint の sdk_loaded が 1 のときは、初回表示の時点で Gemini SDK が読み込まれている
+（診断を押していないのに import している）ことを示し、suite.py では悪化として扱う。
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+MODULES = ("engine", "charts", "llm_client", "metrics", "google.generativeai", "streamlit")
+
+_IMPORT_CODE = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+_APP_CODE = """
+import json, os, sys, time
+from harness import AppDriver
+driver = AppDriver()
+started = time.perf_counter()
+driver.start()
+first_paint = time.perf_counter() - started
+sdk_loaded = "google.generativeai" in sys.modules
+import llm_client
+os.environ["AI_CFO_PREWARM"] = "1"
+started = time.perf_counter()
+thread = llm_client.prewarm()
+if thread is not None:
+    thread.join()
+prewarm = time.perf_counter() - started if thread is not None else None
+print(json.dumps({"first_paint": first_paint, "sdk_loaded": sdk_loaded, "prewarm": prewarm}))
+"""
+
+
+def _child(code, env=None):
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join([REPO_DIR, BENCH_DIR]), **(env or {})},
+    )
+    return out.stdout.strip().splitlines()[-1]
+
+
+def run(repeat=3):
+    """各項目を repeat 回ずつ新しいプロセスで測り、中央値を返す。"""
+    results = {}
+    for module in MODULES:
+        try:
+            times = [float(_child(_IMPORT_CODE.format(module=module))) for _ in range(repeat)]
+        except subprocess.CalledProcessError:
+            continue  # 入っていないモジュールは飛ばす
+        results[f"import_{module}"] = {"cold_ms": statistics.median(times) * 1000}
+
+    # 初回表示の計測中に裏の読み込みが走らないよう、prewarm は表示のあとで明示的に呼ぶ
+    runs = [json.loads(_child(_APP_CODE, {"AI_CFO_PREWARM": "0", "AI_CFO_LLM_BACKEND": "gemini"}))
+            for _ in range(repeat)]
+    results["first_paint"] = {
+        "cold_ms": statistics.median(r["first_paint"] for r in runs) * 1000,
+        "sdk_loaded": int(any(r["sdk_loaded"] for r in runs)),
+    }
+    prewarm = [r["prewarm"] for r in runs if r["prewarm"] is not None]
+    if prewarm:
+        results["prewarm"] = {"cold_ms": statistics.median(prewarm) * 1000}
+    return results
+
+
+def print_results(results):
+    print(f"{'起動時間':<28} {'時間':>10}")
+    for name, r in results.items():
+        note = "  ※ Gemini SDK を読み込み済み" if r.get("sdk_loaded") else ""
+        print(f"{name:<28} {r['cold_ms']:8.0f}ms{note}")
+
+
+if __name__ == "__main__":
+    print_results(run())
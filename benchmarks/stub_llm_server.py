@@ -0,0 +1,183 @@
+"""
+Gemini API のスタブサーバー
+=======================================
+Gemini の REST API（generateContent / streamGenerateContent）と同じ形で、決まった形の回答を
+遅延をつけて返すローカルサーバー。AI_CFO_LLM_ENDPOINT をここに向けると、Gemini SDK を含めて
+app.py・batch_diagnosis.py の診断を API キーなし・課金なしで通しで動かせる。
+
+    python benchmarks/stub_llm_server.py --port 8766 --latency 0.8 --rpm 600
+    AI_CFO_LLM_ENDPOINT=http://127.0.0.1:8766 GEMINI_API_KEY=stub python batch_diagnosis.py clients.csv -o out.jsonl
+
+- 回答の文面は llm_client.StubBackend と同じ（プロンプトの SHA-256 の先頭が入る）。
+- --rpm を超えた分は 429、--fail-rate の割合で 503 を返す（再試行・流量制御の確認用）。
+- GET /stats で受けた件数・プロンプトの種類数・同時処理数の最大値などを返す。
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+import llm_client  # noqa: E402
+
+
+class StubState:
+    def __init__(self, latency=0.8, jitter=0.2, chunk_delay=0.02, rpm=None, fail_rate=0.0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.chunk_delay = chunk_delay
+        self.rpm = rpm
+        self.fail_rate = fail_rate
+        self.text = llm_client.StubBackend(latency=0, chunk_delay=0)
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent = deque()
+        self.requests = 0
+        self.rejected = 0
+        self.failed = 0
+        self.inflight = 0
+        self.max_inflight = 0
+        self.prompts = set()
+
+    def admit(self):
+        """受け付けるなら None、断るなら HTTP ステータスを返す。"""
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            while self._recent and self._recent[0] < now - 60:
+                self._recent.popleft()
+            if self.rpm and len(self._recent) >= self.rpm:
+                self.rejected += 1
+                return 429
+            self._recent.append(now)
+            if self._random.random() < self.fail_rate:
+                self.failed += 1
+                return 503
+            self.inflight += 1
+            self.max_inflight = max(self.max_inflight, self.inflight)
+            return None
+
+    def done(self, prompt):
+        with self._lock:
+            self.inflight -= 1
+            self.prompts.add(prompt)
+
+    def delay(self):
+        with self._lock:
+            return max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "unique_prompts": len(self.prompts), "rejected": self.rejected,
+                    "failed": self.failed, "inflight": self.inflight, "max_inflight": self.max_inflight}
+
+
+def _candidate(text, last):
+    out = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "index": 0}]}
+    if last:
+        out["candidates"][0]["finishReason"] = 1      # STOP（SDK は enum を数値で受け取る）
+    return out
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _json(self, status, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._json(200, self.state.stats())
+        else:
+            self._json(404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        path = self.path.split("?", 1)[0]
+        if not path.endswith((":generateContent", ":streamGenerateContent")):
+            self._json(404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+            return
+        status = self.state.admit()
+        if status == 429:
+            self._json(429, {"error": {"code": 429, "message": "stub: rate limit", "status": "RESOURCE_EXHAUSTED"}})
+            return
+        if status == 503:
+            self._json(503, {"error": {"code": 503, "message": "stub: overloaded", "status": "UNAVAILABLE"}})
+            return
+        prompt = "".join(part.get("text", "") for content in json.loads(body).get("contents", [])
+                         for part in content.get("parts", []))
+        try:
+            time.sleep(self.state.delay())
+            pieces = list(self.state.text.stream(prompt))
+            if path.endswith(":generateContent"):
+                self._json(200, _candidate("".join(pieces), last=True))
+                return
+            # streamGenerateContent（alt=json）は JSON 配列を少しずつ返す
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, piece in enumerate(pieces):
+                if i:
+                    time.sleep(self.state.chunk_delay)
+                data = (("[" if i == 0 else ",\r\n")
+                        + json.dumps(_candidate(piece, last=i == len(pieces) - 1), ensure_ascii=False)).encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"1\r\n]\r\n0\r\n\r\n")
+        finally:
+            self.state.done(prompt)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 呼び出し側が途中で止まった（kill された）ときの切断は想定内なので黙って捨てる
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def start(host="127.0.0.1", port=0, **options):
+    """裏のスレッドでサーバーを起動し、(server, state, "http://host:port") を返す。"""
+    state = StubState(**options)
+    handler = type("StubHandler", (Handler,), {"state": state})
+    server = StubServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="stub-llm", daemon=True).start()
+    return server, state, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.8, help="1 件の回答までの秒数")
+    parser.add_argument("--rpm", type=int, help="1 分あたりの上限（超えたら 429）")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="503 を返す割合")
+    args = parser.parse_args(argv)
+    server, _, url = start(args.host, args.port, latency=args.latency, rpm=args.rpm, fail_rate=args.fail_rate)
+    print(f"stub Gemini API: {url}", flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+"""
+応答速度ベンチマーク・スイート
+=======================================
+app.py をヘッドレスに動かす操作シナリオと、計算エンジン単体のマイクロベンチマークをまとめて測り、
+保存済みのベースライン（baseline.json）と比べて遅くなっていないかを判定する。
+
+    python benchmarks/suite.py                      # 計測してベースラインと比較
+    python benchmarks/suite.py --update-baseline    # 今回の結果をベースラインとして保存
+    python benchmarks/suite.py --only engine        # エンジンだけ
+    python benchmarks/suite.py --only startup       # 起動時間だけ（startup.py）
+
+操作シナリオ（サイドバーのボタンはページ全体、STEP 2 のスライダーはフラグメントを再実行）:
+    demo_presets : デモデータ 3 業種を順に読み込む
+    stress_test  : 「売上 -30% を検証」ボタン
+    invest_sweep : 固定費の増減スライダーを -100万〜+100万円まで動かす
+    sales_sweep  : 売上目標スライダーを -50%〜+50% まで動かす
+    ramp_months  : 目標達成期間を 1〜6ヶ月まで動かす
+
+各シナリオについて次を出す。
+    p50 / p95  : 1 操作あたりのスクリプト実行時間（harness.py 参照）
+    peak       : 1 周の間に Python が確保したメモリのピーク（tracemalloc）
+    内訳       : app.py から呼んだ処理ごとの時間の割合（cProfile で 1 周だけ測り、p50 に按分）
+
+エンジンは engine.project を 1 / 1,000 / 1,000,000 シナリオで、
+日次エンジン（daily.project_daily、5 年）を 1 / 1,000 / 5,000 シナリオで測る。
+起動時間（import・初回表示・SDK の事前読み込み）は startup.py で新しいプロセスを立てて測る。
+ベースラインより --threshold（既定 25%）以上遅い・大きい項目があれば終了コード 1 で終わる。
+"""
+
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import resource
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import startup
+from harness import APP_PATH, AppDriver, add_run_hook, remove_run_hook
+
+sys.path.insert(0, os.path.dirname(APP_PATH))
+
+import daily  # noqa: E402
+import engine  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+REPO_DIR = os.path.dirname(APP_PATH)
+
+SCRIPTS = {
+    "demo_presets": lambda d: [d.click(f"demo_{k}") for k in ("construction", "it_service", "restaurant")],
+    "stress_test": lambda d: [d.click("stress_test")],
+    "invest_sweep": lambda d: [d.set_slider(v, key="invest_slider") for v in range(-1_000_000, 1_000_001, 100_000)],
+    "sales_sweep": lambda d: [d.set_slider(v, key="sales_slider") for v in range(-50, 51, 5)],
+    "ramp_months": lambda d: [d.set_slider(m, label="label_ramp") for m in (2, 3, 4, 5, 6, 1)],
+}
+ENGINE_SIZES = (1, 1_000, 1_000_000)
+DAILY_SIZES = (1, 1_000, 5_000)
+
+
+# ─────────────────────────────────────
+# app.py の操作シナリオ
+# ─────────────────────────────────────
+def _phase_of(func, callers):
+    """app.py から直接呼ばれた関数を、内訳の区分名にする（対象外は None）。"""
+    filename, _, name = func
+    if filename.startswith(REPO_DIR) and os.path.dirname(filename) == REPO_DIR and filename != APP_PATH:
+        if any(c[0] == APP_PATH for c in callers):
+            return os.path.splitext(os.path.basename(filename))[0]
+    # st.xxx は metrics_util の wrapper 経由で呼ばれるので、その先の要素関数で数える
+    if f"streamlit{os.sep}elements{os.sep}" in filename:
+        if any(c[2] == "wrapped_func" for c in callers):
+            return f"st.{name}"
+    return None
+
+
+def _profile_phases(driver, script):
+    profile = cProfile.Profile()
+
+    def hook(start):
+        profile.enable() if start else profile.disable()
+
+    add_run_hook(hook)
+    try:
+        steps = script(driver)
+    finally:
+        remove_run_hook(hook)
+    total = sum(s[0] for s in steps)
+
+    phases = {}
+    for func, (_, _, _, cumtime, callers) in pstats.Stats(profile).stats.items():
+        phase = _phase_of(func, callers)
+        if phase:
+            phases[phase] = phases.get(phase, 0.0) + cumtime
+    phases["その他"] = max(total - sum(phases.values()), 0.0)
+    return {k: v / total for k, v in phases.items()} if total else {}
+
+
+def run_script(name, repeat):
+    script = SCRIPTS[name]
+    driver = AppDriver()
+    driver.start()
+    script(driver)  # 1 周目はキャッシュの準備として捨てる
+
+    seconds, sizes = [], []
+    for _ in range(repeat):
+        for elapsed, size, _ in script(driver):
+            seconds.append(elapsed)
+            sizes.append(size)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    script(driver)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    shares = _profile_phases(driver, script)
+    p50 = statistics.median(seconds) * 1000
+    return {
+        "steps": len(seconds),
+        "p50_ms": p50,
+        "p95_ms": float(np.percentile(seconds, 95) * 1000),
+        "bytes_p50": statistics.median(sizes),
+        "peak_kb": peak / 1024,
+        "phases_ms": {k: v * p50 for k, v in sorted(shares.items(), key=lambda kv: -kv[1])},
+    }
+
+
+# ─────────────────────────────────────
+# エンジンのマイクロベンチマーク
+# ─────────────────────────────────────
+def run_engine(n, n_months=engine.N_MONTHS, project=engine.project, cost=100):
+    """project を n シナリオで測る。cost は 1 シナリオあたりの重さの目安（繰り返し回数を決める）。"""
+    rng = np.random.default_rng(0)
+    args = dict(
+        sales_change=rng.uniform(-50, 50, n), cost_cut=rng.uniform(-20, 20, n),
+        invest=rng.uniform(-5e6, 5e6, n), ramp_months=rng.integers(1, 7, n).astype(float),
+    )
+    base = (5_000_000, 2_000_000, 2_500_000, 3_000_000, 7_500_000, 2_000_000)
+    repeat = max(3, min(200, 2_000_000 // (n * cost)))
+
+    project(*base, **args, n_months=n_months)
+    times = []
+    tracemalloc.start()
+    for _ in range(repeat):
+        started = time.perf_counter()
+        project(*base, **args, n_months=n_months)
+        times.append(time.perf_counter() - started)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    ms = statistics.median(times) * 1000
+    return {"ms": ms, "scenarios_per_s": n / (ms / 1000), "peak_kb": peak / 1024}
+
+
+# ─────────────────────────────────────
+# ベースライン比較
+# ─────────────────────────────────────
+# 比べる指標と、ばらつきとして無視する差（小さな値の割合だけで悪化と判定しないため）
+COMPARED = {"p50_ms": 1.0, "p95_ms": 2.0, "peak_kb": 256.0, "ms": 0.5, "cold_ms": 50.0}
+
+
+def compare(results, baseline, threshold):
+    """ベースラインより threshold 以上悪化した項目を (区分, 名前, 指標, 基準, 今回) で返す。"""
+    regressions = []
+    for section, entries in results.items():
+        for name, metrics in entries.items():
+            base = baseline.get(section, {}).get(name, {})
+            if metrics.get("sdk_loaded") and not base.get("sdk_loaded"):
+                regressions.append((section, name, "sdk_loaded", 0, 1))
+            for key, noise in COMPARED.items():
+                if key not in metrics or key not in base:
+                    continue
+                if metrics[key] > base[key] * (1 + threshold) and metrics[key] - base[key] > noise:
+                    regressions.append((section, name, key, base[key], metrics[key]))
+    return regressions
+
+
+def _print_results(results):
+    if "app" in results:
+        print(f"{'シナリオ':<14} {'操作':>4} {'p50':>8} {'p95':>8} {'送信量':>9} {'peak':>9}  内訳（p50 に按分）")
+        for name, r in results["app"].items():
+            phases = ", ".join(f"{k} {v:.1f}" for k, v in list(r["phases_ms"].items())[:5])
+            print(f"{name:<14} {r['steps']:>4} {r['p50_ms']:6.1f}ms {r['p95_ms']:6.1f}ms "
+                  f"{r['bytes_p50']:>8,.0f}B {r['peak_kb']:>7,.0f}KB  {phases}")
+    if "engine" in results:
+        print(f"\n{'engine.project':<14} {'時間':>10} {'シナリオ/秒':>14} {'peak':>10}")
+        for n, r in results["engine"].items():
+            print(f"{int(n):>12,}件 {r['ms']:8.2f}ms {r['scenarios_per_s']:>14,.0f} {r['peak_kb']:>8,.0f}KB")
+    if "daily" in results:
+        print(f"\n{'日次（5 年）':<14} {'時間':>10} {'シナリオ/秒':>14} {'peak':>10}")
+        for n, r in results["daily"].items():
+            print(f"{int(n):>12,}件 {r['ms']:8.2f}ms {r['scenarios_per_s']:>14,.0f} {r['peak_kb']:>8,.0f}KB")
+    if "startup" in results:
+        print()
+        startup.print_results(results["startup"])
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\nプロセスの最大常駐メモリ: {rss:,.0f}MB")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AI-CFO 応答速度ベンチマーク")
+    parser.add_argument("--only", choices=["app", "engine", "startup"], help="1 区分だけ測る")
+    parser.add_argument("--scripts", nargs="+", choices=list(SCRIPTS), help="測る操作シナリオ")
+    parser.add_argument("--repeat", type=int, default=3, help="各シナリオを何周するか")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="ベースラインの JSON")
+    parser.add_argument("--threshold", type=float, default=0.25, help="悪化とみなす割合")
+    parser.add_argument("--update-baseline", action="store_true", help="今回の結果をベースラインとして保存")
+    parser.add_argument("--json", help="結果を JSON で書き出す先")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if args.only in (None, "app"):
+        results["app"] = {name: run_script(name, args.repeat) for name in (args.scripts or SCRIPTS)}
+    if args.only in (None, "engine"):
+        results["engine"] = {str(n): run_engine(n) for n in ENGINE_SIZES}
+        results["daily"] = {str(n): run_engine(n, 60, daily.project_daily, cost=20_000) for n in DAILY_SIZES}
+    if args.only in (None, "startup"):
+        results["startup"] = startup.run(args.repeat)
+    _print_results(results)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.update_baseline:
+        # --only で測らなかった区分は、保存済みの値を残す
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                saved = json.load(f)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**saved, **results}, f, ensure_ascii=False, indent=2)
+        print(f"ベースラインを更新しました: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("ベースラインがありません（--update-baseline で作成）")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for section, name, key, base, now in regressions:
+        ratio = f"（+{now / base - 1:.0%}）" if base else ""
+        print(f"悪化: {section}/{name} {key} {base:,.1f} → {now:,.1f}{ratio}")
+    if not regressions:
+        print(f"ベースラインから {args.threshold:.0%} 以上の悪化はありません")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,198 @@
+"""
+予定された資金イベント（賞与・税金・設備投資）
+=======================================
+engine.py の月次予測は毎月同じように出入りするお金しか見ないため、夏・冬の賞与、決算後の
+法人税・消費税の納付、設備投資の一括払いのような「まとまった出金」で残高が落ち込む月が見えない。
+
+このモジュールは予定を (年月, 日, 金額, 繰り返し月数, 種類) の構造化配列（1 件 1 行の疎な表）で持ち、
+予測期間に展開したうえで、月ごと（日次なら日ごと）に 1 回の scatter-add（np.bincount）で足し合わせる。
+
+- 予定は全シナリオ共通なので、月ごとの累計（長さ n_months + 1 のベクトル）を作ってから
+  (シナリオ数, n_months + 1) の残高行列に 1 回足すだけで済む。予定を何十件増やしても、
+  レバーグリッド・モンテカルロで増える計算はベクトル 1 本ぶん（予定数 × シナリオ数にはならない）。
+- 金額はマイナスが支払い、プラスが入金（補助金など）。
+- apply() は project()・レバーグリッドの結果に当てはめ、残高まわりの KPI を出し直す
+  （engine.apply_financing と同じ後処理。借入・当座貸越より先に当てはめる）。
+"""
+
+import re
+
+import numpy as np
+
+import engine
+
+# 種類の番号 → 表示名（番号は配列に入れるためのもの。並びを変えない）
+KINDS = ("その他", "賞与", "法人税等", "消費税", "設備投資")
+OTHER, BONUS, CORPORATE_TAX, CONSUMPTION_TAX, CAPEX = range(len(KINDS))
+
+# month: 最初の支払月、day: 支払日（31 は月末）、every: 繰り返しの月数（0 は 1 回だけ）
+EVENT_DTYPE = np.dtype([("month", "datetime64[M]"), ("day", "i1"), ("amount", "f8"),
+                        ("every", "i2"), ("kind", "i1")])
+
+# 賞与の支給月と支給日（夏・冬）
+BONUS_MONTHS = (7, 12)
+BONUS_DAY = 10
+# 法人税・消費税の確定申告の納期限は決算月の 2ヶ月後の月末、中間申告はその 6ヶ月後
+TAX_DELAY = 2
+INTERIM_DELAY = 8
+
+
+def default_start():
+    """期首の月の既定値（来月。daily.project_daily と同じ）。"""
+    return np.datetime64("today", "M") + 1
+
+
+def _month_number(month):
+    """datetime64[M] の暦の月（1〜12）。"""
+    return int(np.datetime64(month, "M").astype(int)) % 12 + 1
+
+
+def next_month(month_of_year, start):
+    """start 以降で最初に来る month_of_year 月。"""
+    start = np.datetime64(start, "M")
+    return start + (month_of_year - _month_number(start)) % 12
+
+
+def schedule(rows):
+    """(month, day, amount, every, kind) の並びを EVENT_DTYPE の配列にする（金額 0 の行は除く）。"""
+    out = np.array([tuple(r) for r in rows], dtype=EVENT_DTYPE)
+    return out[out["amount"] != 0]
+
+
+def empty():
+    return np.zeros(0, dtype=EVENT_DTYPE)
+
+
+# ─────────────────────────────────────
+# よくある予定
+# ─────────────────────────────────────
+def bonus(amount, start, months=BONUS_MONTHS, day=BONUS_DAY):
+    """賞与（1 回あたり amount 円）を毎年 months の各月に払う。"""
+    return schedule((next_month(m, start), day, -amount, 12, BONUS) for m in months)
+
+
+def taxes(corporate, consumption, fiscal_end, start, interim=False):
+    """法人税等・消費税（年額）を決算月 fiscal_end の 2ヶ月後の月末に毎年払う。
+
+    interim=True なら前年の半分を中間申告で先に払い、確定申告では残りの半分を払う。
+    """
+    final = next_month((fiscal_end + TAX_DELAY - 1) % 12 + 1, start)
+    rows = []
+    for amount, kind in ((corporate, CORPORATE_TAX), (consumption, CONSUMPTION_TAX)):
+        if interim:
+            half = amount / 2
+            rows.append((final, 31, -(amount - half), 12, kind))
+            rows.append((next_month((fiscal_end + INTERIM_DELAY - 1) % 12 + 1, start), 31, -half, 12, kind))
+        else:
+            rows.append((final, 31, -amount, 12, kind))
+    return schedule(rows)
+
+
+def capex(amount, start, months_ahead=1, day=31):
+    """設備投資の一括払い（期首から months_ahead ヶ月目、1 回だけ）。"""
+    return schedule([(np.datetime64(start, "M") + months_ahead - 1, day, -amount, 0, CAPEX)])
+
+
+def parse(text):
+    """貼り付けた予定（1 行に 1 件: 「年月[-日] 金額 [繰り返し月数]」）を配列にする。
+
+    区切りは空白・「、」・「, 」。年月は 2027-03 / 2027/3 / 2027-03-15 など（日を省くと月末）、
+    金額はマイナスが支払い（「-1,234,567」の桁区切りも読む）。
+    繰り返しは 12 なら毎年、省略か 0 なら 1 回だけ。読めない行があれば ValueError。
+    """
+    rows = []
+    for n, line in enumerate(text.strip().splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        # 「, 」（カンマと空白）・空白・「、」で区切る（金額の中の桁区切りのカンマは区切りにしない）
+        fields = [f for f in re.split(r",?[\s、]+", line.rstrip(",")) if f]
+        date = re.fullmatch(r"(\d{4})[-/](\d{1,2})(?:[-/](\d{1,2}))?", fields[0]) if fields else None
+        try:
+            if date is None or len(fields) not in (2, 3) or not 1 <= int(date.group(2)) <= 12:
+                raise ValueError
+            month = np.datetime64(f"{date.group(1)}-{int(date.group(2)):02d}", "M")
+            day = int(date.group(3) or 31)
+            amount = float(fields[1].replace(",", "").replace("円", ""))
+            every = int(fields[2]) if len(fields) == 3 else 0
+            if every < 0 or not 1 <= day <= 31:
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"{n} 行目が読めません（例: 2027-07-10, -3,000,000, 12）: {line}") from None
+        rows.append((month, day, amount, every, OTHER))
+    return schedule(rows) if rows else empty()
+
+
+def combine(*schedules):
+    return np.concatenate([empty(), *schedules])
+
+
+# ─────────────────────────────────────
+# 予測期間への展開と当てはめ
+# ─────────────────────────────────────
+def occurrences(events, start, n_months=engine.N_MONTHS):
+    """予定を予測期間に展開し、(何ヶ月目 1..n_months, 日, 金額, 種類) の配列の dict で返す。
+
+    繰り返しは 1 件ずつ回さず、件数を割り算で求めてから np.repeat でまとめて展開する。
+    期首より前に始まった繰り返しは、期首以降の最初の回から数える。
+    """
+    events = np.asarray(events, dtype=EVENT_DTYPE)
+    offset = (events["month"] - np.datetime64(start, "M")).astype(np.int64)
+    every = events["every"].astype(np.int64)
+    repeating = every > 0
+    step = np.maximum(every, 1)
+    # 期首より前の繰り返しは期首以降の最初の回まで進める
+    skip = np.where(repeating & (offset < 0), -(offset // step), 0)
+    first = offset + skip * step
+    count = np.where(repeating, -(-(n_months - first) // step), 1)
+    count = np.where((first >= 0) & (first < n_months), count, 0)
+
+    which = np.repeat(np.arange(len(events)), count)
+    k = np.arange(len(which)) - np.repeat(np.cumsum(count) - count, count)
+    return {
+        "month": first[which] + k * step[which] + 1,
+        "day": events["day"][which],
+        "amount": events["amount"][which],
+        "kind": events["kind"][which],
+    }
+
+
+def monthly(events, start, n_months=engine.N_MONTHS):
+    """月ごとの予定の合計 (n_months + 1,)。列 0（現在）は 0。"""
+    occ = occurrences(events, start, n_months)
+    return np.bincount(occ["month"], weights=occ["amount"], minlength=n_months + 1)
+
+
+def cumulative(events, start, n_months=engine.N_MONTHS):
+    """月末残高に足す予定の累計 (n_months + 1,)。"""
+    return np.cumsum(monthly(events, start, n_months))
+
+
+def shift(cash, events, start):
+    """残高行列 (シナリオ数, n_months + 1) に予定の累計を足した新しい行列。"""
+    cash = np.atleast_2d(np.asarray(cash, dtype=float))
+    return cash + cumulative(events, start, cash.shape[1] - 1)
+
+
+def apply(result, events, start):
+    """project()（またはレバーグリッドの lookup）の結果に予定を当てはめ、KPI を出し直す。
+
+    残高まわりの KPI（cash, min_cash, short_month, months_sales_ratio）を置き換え、
+    "event_flows"（月ごとの予定の合計）を足した新しい dict を返す。
+    """
+    n_months = result["cash"].shape[1] - 1
+    flows = monthly(events, start, n_months)
+    out = engine.with_cash(result, result["cash"] + np.cumsum(flows))
+    out["event_flows"] = flows
+    return out
+
+
+def summary(events, start, n_months=engine.N_MONTHS):
+    """予測期間の予定を [(年月, 種類, 金額), ...]（月順・同じ月の同じ種類はまとめる）にする。"""
+    occ = occurrences(events, start, n_months)
+    key = occ["month"] * len(KINDS) + occ["kind"]
+    keys, inverse = np.unique(key, return_inverse=True)
+    totals = np.bincount(inverse, weights=occ["amount"])
+    start = np.datetime64(start, "M")
+    return [(str(start + int(k // len(KINDS)) - 1), KINDS[k % len(KINDS)], float(t))
+            for k, t in zip(keys, totals)]
@@ -0,0 +1,332 @@
+"""
+結果グラフ（Plotly）
+=======================================
+「資金繰り予測」と「損益分岐点」のグラフを、単位（万円／億円）ごとに 1 回だけ組み立てた
+ひな形から作る。再実行のたびに差し替えるのはデータ配列・マーカー色・図形の座標だけで、
+go.Figure の組み立てで最も重い Plotly の検証はひな形を作るときの 1 回で済む。
+
+送信量を抑える工夫:
+- Plotly 既定テンプレートのうち、使わないグラフ種別・座標系（3D・地図・極座標など）の設定は送らない。
+- 金額は表示単位で小数 4 桁に丸めて送る（ホバー表示は円単位の文字列）。
+
+長い期間・多数のシナリオを重ねる場合:
+- 1 系列が MAX_POINTS 点を超えたら、区間ごとの最小・最大だけを残して間引く（資金の谷は落とさない）。
+- 重ねるシナリオが MAX_LINES 本を超えたら、個別の線の代わりに最小〜最大の帯で描く。
+- 送る点の合計が GL_POINTS を超えたら WebGL（Scattergl）に切り替える。
+
+Plotly は import charts では読み込まず、最初にグラフを作るとき（_plotly()）に読み込む。
+"""
+
+import logging
+from functools import lru_cache
+
+import numpy as np
+
+from formatting import jp_format
+
+logger = logging.getLogger("ai_cfo.charts")
+
+UNITS = {"万円": 10_000, "億円": 100_000_000}
+MAX_POINTS = 500
+MAX_LINES = 12
+GL_POINTS = 2_000
+MARKER_POINTS = 120
+
+# 既定テンプレートから省く設定（このアプリでは使わない）
+_UNUSED_LAYOUT = {"polar", "ternary", "scene", "geo", "coloraxis", "colorscale"}
+_USED_TRACES = {"scatter", "scattergl", "bar"}
+_OVERLAY_COLORS = ("#3182CE", "#DD6B20", "#38A169", "#805AD5", "#D69E2E", "#319795")
+
+
+# ─────────────────────────────────────
+# 共通
+# ─────────────────────────────────────
+def choose_unit(values):
+    """金額の最大絶対値から表示単位を決める。"""
+    return "億円" if np.abs(values).max() >= 100_000_000 else "万円"
+
+
+@lru_cache(maxsize=1)
+def _plotly():
+    """(plotly.graph_objects, plotly.io)。読み込みに時間がかかるので、最初に使うときに import する。"""
+    import plotly.graph_objects as go
+    import plotly.io as pio
+    return go, pio
+
+
+@lru_cache(maxsize=1)
+def _base_template():
+    _, pio = _plotly()
+    template = pio.templates[pio.templates.default].to_plotly_json()
+    return {
+        "layout": {k: v for k, v in template["layout"].items() if k not in _UNUSED_LAYOUT},
+        "data": {k: v for k, v in template["data"].items() if k in _USED_TRACES},
+    }
+
+
+def _figure(template, data, layout=None):
+    """検証済みのひな形に差し替え分を載せて Figure にする（再検証はしない）。"""
+    go, _ = _plotly()
+    spec = {"data": data, "layout": {**template["layout"], **(layout or {})}}
+    fig = go.Figure(spec, _validate=False)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("chart payload %d bytes, %d traces", payload_bytes(fig), len(data))
+    return fig
+
+
+def payload_bytes(fig):
+    """ブラウザへ送られるグラフ定義（JSON）のバイト数。"""
+    _, pio = _plotly()
+    return len(pio.to_json(fig, validate=False).encode("utf-8"))
+
+
+def minmax_index(values, max_points=MAX_POINTS):
+    """区間ごとの最小・最大の位置だけを残す間引き。両端は必ず残す。"""
+    n = len(values)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(1, (max_points - 2) // 2)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = values
+    padded = padded.reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    valid = ~np.isnan(padded).all(axis=1)
+    lows = np.nanargmin(np.where(valid[:, None], padded, 0.0), axis=1) + offsets
+    highs = np.nanargmax(np.where(valid[:, None], padded, 0.0), axis=1) + offsets
+    return np.unique(np.concatenate([[0, n - 1], lows[valid], highs[valid]]))
+
+
+def _scaled(values, divider):
+    return np.round(np.asarray(values, dtype=float) / divider, 4).tolist()
+
+
+# ─────────────────────────────────────
+# 資金繰り予測
+# ─────────────────────────────────────
+@lru_cache(maxsize=None)
+def _cash_template(unit, webgl):
+    go, _ = _plotly()
+    trace_type = go.Scattergl if webgl else go.Scatter
+    fig = go.Figure()
+    fig.add_hrect(y0=-100, y1=0, fillcolor="#FEF2F2", opacity=0.8, layer="below", line_width=0)
+    fig.add_hline(y=0, line_dash="dash", line_color="#EF4444", annotation_text="0", annotation_position="bottom right")
+    fig.add_trace(trace_type(
+        x=[], y=[], mode='lines+markers',
+        line=dict(color='#1A365D', width=3),
+        marker=dict(size=8, color=[]),
+        name="現預金推移",
+        text=[], hovertemplate='%{x}<br>残高: %{text}<extra></extra>'
+    ))
+    fig.update_layout(
+        xaxis_title="", yaxis_title=f"現預金残高 ({unit})",
+        height=300, margin=dict(l=10, r=10, t=10, b=10),
+        plot_bgcolor='white', paper_bgcolor='white',
+    )
+    fig.layout.template = _base_template()
+    spec = fig.to_dict()
+    # 重ねるシナリオの線と、多数シナリオの帯（上端・下端）
+    spec["overlay"] = trace_type(
+        x=[], y=[], mode="lines", line=dict(width=2), name="",
+        text=[], hovertemplate='%{x}<br>%{fullData.name}: %{text}<extra></extra>',
+    ).to_plotly_json()
+    spec["band"] = [
+        trace_type(x=[], y=[], mode="lines", line=dict(width=0), hoverinfo="skip", showlegend=False).to_plotly_json(),
+        trace_type(x=[], y=[], mode="lines", line=dict(width=0), fill="tonexty",
+                   fillcolor="rgba(49,130,206,0.15)", name="", hoverinfo="skip").to_plotly_json(),
+    ]
+    return spec
+
+
+def cash_chart(cash, labels, unit, names=None):
+    """現預金推移のグラフ。
+
+    cash  : 円単位の (月数 + 1,) か (シナリオ数, 月数 + 1) の配列。先頭行が今のシナリオ
+    labels: 横軸のラベル（月数 + 1 個）
+    names : 2 行目以降のシナリオ名（凡例・ホバー用）
+    """
+    cash = np.atleast_2d(np.asarray(cash, dtype=float))
+    labels = np.asarray(labels)
+    divider = UNITS[unit]
+    main = cash[0]
+    others = cash[1:]
+    band = len(others) > MAX_LINES
+
+    idx = minmax_index(main)
+    n_points = len(idx) * (1 + (2 if band else len(others)))
+    webgl = n_points > GL_POINTS
+    template = _cash_template(unit, webgl)
+
+    data = []
+    if band:
+        upper, lower = others.max(axis=0), others.min(axis=0)
+        keep = np.union1d(minmax_index(upper), minmax_index(lower))
+        for proto, values in zip(template["band"], (upper, lower)):
+            data.append({**proto, "x": labels[keep].tolist(), "y": _scaled(values[keep], divider)})
+        data[1]["name"] = f"他の{len(others)}シナリオの幅"
+    else:
+        for i, row in enumerate(others):
+            keep = minmax_index(row)
+            data.append({
+                **template["overlay"],
+                "x": labels[keep].tolist(), "y": _scaled(row[keep], divider),
+                "line": {"width": 2, "color": _OVERLAY_COLORS[i % len(_OVERLAY_COLORS)]},
+                "name": names[i] if names is not None else f"シナリオ{i + 2}",
+                "text": [jp_format(v) for v in row[keep]],
+            })
+
+    values = main[idx]
+    trace = dict(template["data"][0])
+    trace.update(
+        x=labels[idx].tolist(), y=_scaled(values, divider),
+        text=[jp_format(v) for v in values],
+        marker={**trace["marker"], "color": np.where(values < 0, '#EF4444', '#1A365D').tolist()},
+    )
+    if len(idx) > MARKER_POINTS:
+        trace["mode"] = "lines"
+    data.append(trace)
+
+    # 軸の最小値調整（ショート時）
+    y_min = float(cash.min()) / divider
+    min_y_scaled = min(y_min, -100) if y_min < 0 else 0
+    shapes = [dict(s) for s in template["layout"]["shapes"]]
+    shapes[0]["y0"] = min_y_scaled
+    layout = {"shapes": shapes}
+    if len(data) > 1:
+        layout.update(showlegend=True, legend={"orientation": "h", "y": 1.12})
+    return _figure(template, data, layout)
+
+
+# ─────────────────────────────────────
+# 損益分岐点
+# ─────────────────────────────────────
+@lru_cache(maxsize=None)
+def _bep_template(unit):
+    go, _ = _plotly()
+    fig = go.Figure()
+    fig.add_shape(type="rect", x0=0, x1=1, y0=0, y1=1, xref="x", yref="paper",
+                  fillcolor="#FFE4E6", line_width=0, opacity=0.5)
+    fig.add_shape(type="rect", x0=1, x1=2, y0=0, y1=1, xref="x", yref="paper",
+                  fillcolor="#D1FAE5", line_width=0, opacity=0.5)
+    fig.add_trace(go.Bar(
+        x=[0], y=["売上"], orientation='h',
+        marker_color="#1A365D", width=0.5,
+        name="目標売上", text="", textposition='auto'
+    ))
+    fig.add_vline(x=1, line_width=3, line_color="#EF4444", line_dash="dash")
+    fig.add_annotation(x=1, y=1.05, xref="x", yref="paper",
+                       text="", showarrow=False,
+                       font=dict(color="#EF4444", size=12), xanchor="left")
+    fig.update_layout(
+        xaxis=dict(range=[0, 2], visible=False),
+        yaxis=dict(visible=False),
+        height=250, margin=dict(l=10, r=10, t=30, b=10),
+        plot_bgcolor='white',
+        showlegend=False,
+    )
+    fig.layout.template = _base_template()
+    return fig.to_dict()
+
+
+def bep_chart(target_rev, bep_rev, unit):
+    """目標売上と損益分岐点売上高の距離を示す横棒グラフ。"""
+    template = _bep_template(unit)
+    divider = UNITS[unit]
+    max_range_scaled = max(target_rev, bep_rev) * 1.3 / divider
+    bep_rev_scaled = bep_rev / divider
+
+    bar = dict(template["data"][0])
+    bar.update(x=[target_rev / divider], text=jp_format(target_rev))
+
+    layout = template["layout"]
+    pink, green, vline = (dict(s) for s in layout["shapes"])
+    pink["x1"] = bep_rev_scaled
+    green.update(x0=bep_rev_scaled, x1=max_range_scaled)
+    vline.update(x0=bep_rev_scaled, x1=bep_rev_scaled)
+    annotation = dict(layout["annotations"][0])
+    annotation.update(x=bep_rev_scaled, text=f"損益分岐点\n{jp_format(bep_rev)}")
+    return _figure(template, [bar], {
+        "shapes": [pink, green, vline],
+        "annotations": [annotation],
+        "xaxis": {**layout["xaxis"], "range": [0, max_range_scaled]},
+    })
+
+
+# ─────────────────────────────────────
+# 感度分析（トルネード）
+# ─────────────────────────────────────
+@lru_cache(maxsize=None)
+def _tornado_template(unit):
+    go, _ = _plotly()
+    fig = go.Figure()
+    for name, color in (("下げたとき", "#3182CE"), ("上げたとき", "#DD6B20")):
+        fig.add_trace(go.Bar(
+            x=[], y=[], base=[], orientation="h", name=name, marker_color=color,
+            text=[], hovertemplate="%{y}<br>" + name + ": %{text}<extra></extra>",
+        ))
+    fig.add_vline(x=0, line_width=2, line_color="#1A365D")
+    fig.update_layout(
+        barmode="overlay", xaxis_title=f"({unit})", yaxis=dict(autorange="reversed"),
+        height=360, margin=dict(l=10, r=10, t=10, b=10),
+        plot_bgcolor="white", paper_bgcolor="white",
+        legend=dict(orientation="h", y=1.08),
+    )
+    fig.layout.template = _base_template()
+    return fig.to_dict()
+
+
+def tornado_chart(labels, base, low, high, unit):
+    """入力ごとに「下げたとき」「上げたとき」の出力を基準値からの棒で示す。
+
+    labels・low・high は上に出す順（振れ幅の大きい順）にそろえて渡す。
+    """
+    template = _tornado_template(unit)
+    divider = UNITS[unit]
+    data = []
+    for proto, values in zip(template["data"], (low, high)):
+        values = np.asarray(values, dtype=float)
+        data.append({
+            **proto, "y": list(labels),
+            "x": _scaled(values - base, divider), "base": [round(base / divider, 4)] * len(values),
+            "text": [jp_format(v) for v in values],
+        })
+    vline = dict(template["layout"]["shapes"][0])
+    vline.update(x0=base / divider, x1=base / divider)
+    return _figure(template, data, {"shapes": [vline]})
+
+
+# ─────────────────────────────────────
+# 確率モード（モンテカルロ）
+# ─────────────────────────────────────
+def fan_chart(mc, labels, unit):
+    """montecarlo.run の結果から、P5〜P95 の帯・中央値・月別ショート確率のグラフを作る。"""
+    go, _ = _plotly()
+    divider = UNITS[unit]
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(
+        x=labels, y=mc["bands"][95] / divider, mode="lines",
+        line=dict(width=0), hoverinfo="skip", showlegend=False,
+    ))
+    fig.add_trace(go.Scatter(
+        x=labels, y=mc["bands"][5] / divider, mode="lines",
+        line=dict(width=0), fill="tonexty", fillcolor="rgba(26,54,93,0.15)",
+        name="P5〜P95", hoverinfo="skip",
+    ))
+    fig.add_trace(go.Scatter(
+        x=labels, y=mc["bands"][50] / divider, mode="lines",
+        line=dict(color="#1A365D", width=3), name="中央値",
+        text=[jp_format(v) for v in mc["bands"][50]], hovertemplate="%{x}<br>中央値: %{text}<extra></extra>",
+    ))
+    fig.add_trace(go.Bar(
+        x=labels, y=mc["p_short"] * 100, yaxis="y2", name="ショート確率",
+        marker_color="#EF4444", opacity=0.35, hovertemplate="%{x}<br>%{y:.1f}%<extra></extra>",
+    ))
+    fig.add_hline(y=0, line_dash="dash", line_color="#EF4444")
+    fig.update_layout(
+        xaxis_title="", yaxis_title=f"現預金残高 ({unit})",
+        yaxis2=dict(title="ショート確率 (%)", overlaying="y", side="right", range=[0, 100], showgrid=False),
+        height=320, margin=dict(l=10, r=10, t=10, b=10),
+        plot_bgcolor="white", paper_bgcolor="white",
+        legend=dict(orientation="h", y=1.1),
+    )
+    return fig
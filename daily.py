@@ -0,0 +1,297 @@
+"""
+日次の資金繰りエンジン
+=======================================
+engine.py は売掛金・買掛金を「月末残高 = 月商 × 回転月数」で扱うため、
+月の途中で一時的に資金が底をつく動き（月末締め翌々月末払いの入金を待つ間に
+25 日の給与が出ていく、など）が見えない。
+
+このモジュールは売上・原価の発生を日に割り振り、締め日・支払日のルールで
+入金日・支払日を決め、給与日・家賃などの固定費の支払日と合わせて日ごとの残高を求める。
+
+- 金額はすべて int64 の円。月額を日数で割った端数は月末日に寄せるので、月の合計は月額と一致する。
+- 残高が動くのは入金日・支払日だけなので、その日（と各月 1 日）の入出金だけを
+  (動きのある日数, シナリオ数) の配列に集めて累積和を取る。日ごとの Python ループはなく、
+  5 年 × 数千シナリオでも配列数枚で済む。日次の残高が必要なときだけ全日分に展開する。
+  内部の配列は日（月）を行にしておき、日の並べ替え・集約を行単位の連続したコピーで済ませる。
+- 期首の売掛金・買掛金は、期首より前の売上・原価を同じルールで並べ、
+  期首以降に入金（支払）される分を貸借対照表の残高に合わせて按分する。
+- 入金日が土日・祝日なら翌営業日、支払日なら前営業日にずらす（資金繰り上、厳しい側に寄せる）。
+  祝日は bank_holidays() の銀行休業日（国民の祝日・振替休日・年末年始 12/31〜1/3）を使う。
+"""
+
+import datetime
+from functools import lru_cache
+
+import numpy as np
+
+import cash_events
+import engine
+
+# 締め日・支払条件: (締め日, 何ヶ月後に払うか, 支払日)。31 は月末
+TERMS = {
+    "月末締め翌月末払い": (31, 1, 31),
+    "月末締め翌々月末払い": (31, 2, 31),
+    "月末締め翌月10日払い": (31, 1, 10),
+    "20日締め翌月末払い": (20, 1, 31),
+    "20日締め翌月10日払い": (20, 1, 10),
+    "15日締め当月末払い": (15, 0, 31),
+    "25日締め翌月25日払い": (25, 1, 25),
+}
+DEFAULT_SALES_TERMS = "月末締め翌月末払い"
+DEFAULT_COST_TERMS = "月末締め翌月末払い"
+# 固定費の支払日と割合: ((日, 割合), ...)。既定は 25 日の給与が 6 割、月末の家賃ほかが 4 割
+FIXED_SCHEDULE = ((25, 0.6), (31, 0.4))
+
+
+# ─────────────────────────────────────
+# カレンダー
+# ─────────────────────────────────────
+def _nth_monday(year, month, n):
+    first = datetime.date(year, month, 1)
+    return first + datetime.timedelta(days=(7 - first.weekday()) % 7 + 7 * (n - 1))
+
+
+@lru_cache(maxsize=16)
+def bank_holidays(first_year, last_year):
+    """銀行休業日（土日を除く）の日付の配列。
+
+    国民の祝日（春分・秋分は 1980〜2099 年の近似式）、振替休日、年末年始（12/31〜1/3）。
+    前後を祝日に挟まれた「国民の休日」は扱わない。
+    """
+    days = set()
+    for y in range(first_year, last_year + 1):
+        n = y - 1980
+        holidays = [
+            datetime.date(y, 1, 1), _nth_monday(y, 1, 2), datetime.date(y, 2, 11), datetime.date(y, 2, 23),
+            datetime.date(y, 3, int(20.8431 + 0.242194 * n - n // 4)),
+            datetime.date(y, 4, 29), datetime.date(y, 5, 3), datetime.date(y, 5, 4), datetime.date(y, 5, 5),
+            _nth_monday(y, 7, 3), datetime.date(y, 8, 11), _nth_monday(y, 9, 3),
+            datetime.date(y, 9, int(23.2488 + 0.242194 * n - n // 4)),
+            _nth_monday(y, 10, 2), datetime.date(y, 11, 3), datetime.date(y, 11, 23),
+        ]
+        # 日曜の祝日は、次の祝日でない日が振替休日
+        for day in sorted(holidays):
+            days.add(day)
+            if day.weekday() == 6:
+                sub = day + datetime.timedelta(days=1)
+                while sub in holidays:
+                    sub += datetime.timedelta(days=1)
+                days.add(sub)
+        days.update([datetime.date(y, 1, 2), datetime.date(y, 1, 3), datetime.date(y, 12, 31)])
+    out = np.array(sorted(days), dtype="datetime64[D]")
+    out.flags.writeable = False
+    return out
+
+
+def _days_in(months):
+    return ((months + 1).astype("datetime64[D]") - months.astype("datetime64[D]")).astype(np.int64)
+
+
+def _day_of(months, day):
+    """各月の day 日（月の日数を超えたら月末）の日付。"""
+    return months.astype("datetime64[D]") + (np.minimum(day, _days_in(months)) - 1)
+
+
+class Calendar:
+    """期首の lookback ヶ月前から予測期間の終わりまでの日付と、各日が何月の何日目かを持つ。"""
+
+    def __init__(self, start, n_months, lookback, holidays=None):
+        self.start_month = np.datetime64(start, "M")
+        self.lookback = lookback
+        self.n_months = n_months
+        self.months = self.start_month - lookback + np.arange(lookback + n_months)
+        self.month_days = _days_in(self.months)
+        self.first_day = self.months[0].astype("datetime64[D]")
+        self.month_first = np.concatenate([[0], np.cumsum(self.month_days)])
+        self.n_days = int(self.month_first[-1])
+        self.start = int(self.month_first[lookback])
+        if holidays is None:
+            years = self.months.astype("datetime64[Y]").astype(int) + 1970
+            holidays = bank_holidays(int(years[0]), int(years[-1]) + 1)
+        self.holidays = np.asarray(holidays, dtype="datetime64[D]")
+
+    def index_of(self, dates):
+        return (dates - self.first_day).astype(np.int64)
+
+    def roll(self, dates, roll):
+        return np.busday_offset(dates, 0, roll=roll, holidays=self.holidays)
+
+    @property
+    def dates(self):
+        """期首から予測期間の終わりまでの日付。"""
+        return self.first_day + np.arange(self.start, self.n_days)
+
+
+# ─────────────────────────────────────
+# 日割りと締め
+# ─────────────────────────────────────
+def _cumulative(amounts, cal, day_idx):
+    """月額 amounts (月数, シナリオ数) を日割りしたときの、day_idx 日目までの累計（その日を含む）。
+
+    戻り値は (len(day_idx), シナリオ数)。day_idx < 0 は 0。端数は月末日に寄せる。
+    """
+    month_days = cal.month_days[:, None]
+    rate = amounts // month_days
+    rest = amounts - rate * month_days
+    cum = np.concatenate([np.zeros((1, amounts.shape[1]), dtype=np.int64), np.cumsum(amounts, axis=0)])
+
+    valid = day_idx >= 0
+    d = np.where(valid, day_idx, 0)
+    m = np.searchsorted(cal.month_first, d, side="right") - 1
+    k = (d - cal.month_first[m] + 1)[:, None]
+    out = cum[m] + rate[m] * k + rest[m] * (k == month_days[m])
+    return np.where(valid[:, None], out, 0)
+
+
+def _settlements(pre, post, terms, cal, roll):
+    """締め日ごとの金額と、その入金（支払）日。
+
+    pre は期首より前の月額、post は期首以降の月額（どちらも全月分で、対象外の月は 0）。
+    戻り値は (日の添字, 期首前の分, 期首以降の分)。期首より前・期間外に決済されるものは除く。
+    """
+    close, after, pay_day = terms
+    period_end = cal.index_of(_day_of(cal.months, close))
+    prev_end = np.concatenate([[-1], period_end[:-1]])
+    pay = cal.index_of(cal.roll(_day_of(cal.months + after, pay_day), roll))
+    keep = (pay >= cal.start) & (pay < cal.n_days)
+    pay, period_end, prev_end = pay[keep], period_end[keep], prev_end[keep]
+    return pay, _period_sums(pre, cal, period_end, prev_end, prev_end < cal.start), \
+        _period_sums(post, cal, period_end, prev_end, period_end >= cal.start)
+
+
+def _period_sums(amounts, cal, period_end, prev_end, mask):
+    """(prev_end, period_end] の合計 (締めの数, シナリオ数)。mask が偽の締めは 0 とみなして計算を省く。"""
+    out = np.zeros((len(period_end), amounts.shape[1]), dtype=np.int64)
+    k = int(mask.sum())
+    if k:
+        cum = _cumulative(amounts, cal, np.concatenate([period_end[mask], prev_end[mask]]))
+        out[mask] = cum[:k] - cum[k:]
+    return out
+
+
+def _scaled_opening(opening, pre_amounts):
+    """期首前の分を、期首の残高（売掛金・買掛金）に合うように按分する。"""
+    implied = pre_amounts.sum(axis=0)
+    scale = np.divide(opening, implied, out=np.zeros(len(implied)), where=implied > 0)
+    return np.rint(pre_amounts * scale).astype(np.int64)
+
+
+def _split(base, path, cal):
+    """期首前の月額（今の水準が続いていたとする）と期首以降の月額を、(全月数, シナリオ数) の int64 配列にする。"""
+    pre = np.zeros((len(cal.months), len(path)), dtype=np.int64)
+    post = np.zeros_like(pre)
+    pre[:cal.lookback] = np.rint(base)
+    post[cal.lookback:] = np.rint(path.T)
+    return pre, post
+
+
+# ─────────────────────────────────────
+# 日次の資金繰り（バッチ）
+# ─────────────────────────────────────
+def project_daily(revenue, cogs, fixed_cost, cash, receivables, payables,
+                  sales_change=0, cost_cut=0.0, invest=0, ramp_months=1,
+                  n_months=engine.N_MONTHS, start=None,
+                  sales_terms=DEFAULT_SALES_TERMS, cost_terms=DEFAULT_COST_TERMS,
+                  fixed_schedule=FIXED_SCHEDULE, holidays=None, daily=False, events=None,
+                  revenue_base=None):
+    """全シナリオの日次の資金繰りをまとめて計算する。
+
+    引数は engine.project と同じ（スカラーか同じ長さに broadcast できる配列）。
+    start は期首の月（"2026-11" など。None なら来月）、sales_terms / cost_terms は TERMS の名前か
+    (締め日, 何ヶ月後, 支払日)、holidays は休日の日付の並び（None なら bank_holidays()、土日は常に休み）。
+    events は cash_events の予定の配列（賞与・税金など。支払は前営業日、入金は翌営業日にずらす）。
+    revenue_base は engine.project と同じ（季節性のある基準売上。期首より前の月は revenue のまま）。
+
+    戻り値は配列の dict:
+        min_cash        : 期間中の日次の最低残高（円、int64）
+        min_day         : 最低残高になった日の期首からの日数
+        short_day       : 最初に残高がマイナスになった日（ならなければ -1）
+        month_end_cash  : (シナリオ数, n_months + 1) の月末残高。列 0 は期首の残高
+        month_min_cash  : (シナリオ数, n_months) の各月の月中最低残高
+        dates           : 期首から期末までの日付（datetime64[D]）
+        cash            : daily=True のときだけ (シナリオ数, 日数) の日次残高
+    """
+    if revenue_base is not None:
+        revenue_base = np.asarray(revenue_base, dtype=float).reshape(-1, n_months)
+    # 基準売上だけが社数分の行を持つ場合も、他の入力をその行数にそろえる（engine.monthly_flows と同じ）
+    (rev, cgs, fxd, csh, rec, pay,
+     sales_change, cost_cut, invest, ramp_months, _) = engine._as_float_arrays(
+        revenue, cogs, fixed_cost, cash, receivables, payables,
+        sales_change, cost_cut, invest, ramp_months,
+        0.0 if revenue_base is None else revenue_base[:, 0])
+    sales_terms = TERMS.get(sales_terms, sales_terms)
+    cost_terms = TERMS.get(cost_terms, cost_terms)
+    if start is None:
+        start = np.datetime64("today", "M") + 1
+    cal = Calendar(start, n_months, max(sales_terms[1], cost_terms[1]) + 1, holidays)
+
+    v_rate = engine._safe_div(cgs, rev)
+    sim_v_rate = v_rate * (1 + cost_cut / 100)
+    month_rev = np.broadcast_to(
+        engine.scenario_revenue(rev, sales_change, ramp_months, n_months, revenue_base), (len(rev), n_months))
+    month_cgs = month_rev * sim_v_rate[:, None]
+
+    # 入金（売上）と支払（原価）
+    pre, post = _split(rev, month_rev, cal)
+    in_day, in_pre, in_post = _settlements(pre, post, sales_terms, cal, "following")
+    pre, post = _split(cgs, month_cgs, cal)
+    out_day, out_pre, out_post = _settlements(pre, post, cost_terms, cal, "preceding")
+    collections = _scaled_opening(rec, in_pre) + in_post
+    payments = _scaled_opening(pay, out_pre) + out_post
+
+    # 固定費（端数は最後の支払日に寄せる）
+    months = cal.months[cal.lookback:]
+    fixed_total = np.rint(fxd + invest).astype(np.int64)
+    shares = np.array([s for _, s in fixed_schedule])
+    parts = np.floor(fixed_total[None, :] * shares[:, None]).astype(np.int64)
+    parts[-1] = fixed_total - parts[:-1].sum(axis=0)
+    fixed_day = np.concatenate([cal.index_of(cal.roll(_day_of(months, d), "preceding")) for d, _ in fixed_schedule])
+    fixed_amounts = np.repeat(-parts, n_months, axis=0)
+
+    # 予定された資金イベントは全シナリオ共通なので、同じ日の分を先に合計して 1 日 1 行にする
+    # （行数は動きのある日数で決まり、予定の件数 × シナリオ数にはならない）
+    sched_day = np.zeros(0, dtype=np.int64)
+    sched_amounts = np.zeros(0, dtype=np.int64)
+    if events is not None and len(events):
+        occ = cash_events.occurrences(events, cal.start_month, n_months)
+        dates = _day_of(months[occ["month"] - 1], occ["day"])
+        dates = np.where(occ["amount"] < 0, cal.roll(dates, "preceding"), cal.roll(dates, "following"))
+        idx = np.maximum(cal.index_of(dates), cal.start)
+        keep = idx < cal.n_days
+        sched_day, inverse = np.unique(idx[keep], return_inverse=True)
+        sched_amounts = np.rint(np.bincount(inverse, weights=occ["amount"][keep])).astype(np.int64)
+
+    # 各月 1 日に 0 円の動きを置き、月ごとの区切りにする
+    month_day = cal.month_first[cal.lookback:-1]
+    n = len(rev)
+    days = np.concatenate([month_day, in_day, out_day, fixed_day, sched_day])
+    amounts = np.concatenate([np.zeros((len(month_day), n), dtype=np.int64),
+                              collections, -payments, fixed_amounts,
+                              np.broadcast_to(sched_amounts[:, None], (len(sched_day), n))])
+    order = np.argsort(days, kind="stable")
+    days, amounts = days[order], amounts[order]
+    # 同じ日の動きは、その日の最後の行の累計がその日の残高になる
+    last = np.flatnonzero(np.diff(days, append=days[-1] + 1))
+    event_day = days[last]
+    opening = np.rint(csh).astype(np.int64)
+    balance = (opening + np.cumsum(amounts, axis=0))[last]
+
+    # 残高は動きのある日の間は一定なので、月中の最低残高はその月の動きのある日の最小値
+    month_first_event = np.searchsorted(event_day, month_day)
+    month_min = np.minimum.reduceat(balance, month_first_event, axis=0)
+    month_last_event = np.concatenate([month_first_event[1:], [len(event_day)]]) - 1
+    month_end = np.concatenate([opening[None, :], balance[month_last_event]])
+
+    is_short = balance < 0
+    out = {
+        "min_cash": np.minimum(balance.min(axis=0), opening),
+        "min_day": event_day[balance.argmin(axis=0)] - cal.start,
+        "short_day": np.where(is_short.any(axis=0), event_day[is_short.argmax(axis=0)] - cal.start, -1),
+        "month_end_cash": month_end.T,
+        "month_min_cash": month_min.T,
+        "dates": cal.dates,
+    }
+    if daily:
+        idx = np.searchsorted(event_day, np.arange(cal.start, cal.n_days), side="right") - 1
+        out["cash"] = balance[idx].T
+    return out
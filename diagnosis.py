@@ -0,0 +1,66 @@
+"""
+AI-CFO 診断プロンプト
+=======================================
+シミュレーション結果から Gemini に渡すプロンプトを組み立てる。
+画面（app.py）とバッチで同じプロンプトを使うため、ここにまとめている。
+"""
+
+import logging
+
+from formatting import jp_format
+
+logger = logging.getLogger("ai_cfo.diagnosis")
+
+MODEL_NAME = "gemini-2.5-flash"
+
+# プロンプトの文面を変えたら上げる（診断キャッシュのキーに含まれる）
+PROMPT_VERSION = 1
+
+# プロンプトの【データ】に使う項目
+INPUT_FIELDS = (
+    "industry", "rev", "target_rev", "sales_change", "sim_v_rate", "invest", "bep_rev",
+    "min_cash", "final_cash", "short_month", "months_sales_ratio", "m_rec", "m_pay",
+    "safety_margin_ratio", "horizon",
+)
+
+
+def build_prompt(data):
+    """INPUT_FIELDS をキーに持つ dict からプロンプト文字列を作る。"""
+    ind = data["industry"]
+    horizon = data["horizon"]
+    return f"""以下の中小企業（業種: {ind}）のシミュレーション結果を分析し、貴社に向けたアドバイスを作成してください。
+なお、ユーザーの役職を特定せず、「社長」などの呼びかけは避け、「貴社」という表現を使用してください。
+
+※厳守事項：利益、不足額、回収日数などの数値は絶対にAI自身で計算・推測しないでください。必ず上記【データ】セクションで渡された数値をそのまま引用して解説してください。
+
+※【超重要】カタカナ語（アップセル、リードタイム、アライアンス、コンセンサスなど）は使用厳禁です。
+必ず現場の従業員や中学生でも直感的にわかる、泥臭く平易な日本語（例：お金の回り、ついで買い、待ち時間、最悪の事態）に翻訳して話してください。
+ただし、日常的に使われる言葉（リスク、コスト、システムなど）は許容しますが、コンサル用語は徹底して排除してください。
+
+※【超重要】全方位の一般的なコストカット提案（あれもこれもやれ）は絶対にやめてください。
+渡されたデータ（特に『固定費増(投資)』や『変動費率』）を見て、利益を圧迫している【最大の要因1つ】を特定し、そこだけをピンポイントで厳しく指摘・メスを入れてください。
+（例：投資額が重すぎるなら、その投資計画自体の撤回や延期を強く迫ること、原価が高すぎるなら仕入れの見直しのみを迫ること）
+
+### ① 資金繰りリスクの評価
+- 資金推移（{horizon}ヶ月間で最も現金が減った時の残高: {jp_format(data["min_cash"])}）を分析し、資金ショートのリスクがあれば警告してください。
+- 現預金月商倍率（最低時）が{data["months_sales_ratio"]:.1f}ヶ月分あることが、どの程度の安全性（または危険性）を示すのか評価してください。
+- ショートや減少の原因が「売上急増による運転資金の増加（黒字倒産リスク）」なのか、「赤字垂れ流しによる資金枯渇」なのかを明確に区別して指摘してください。
+- 業界（{ind}）の平均的な回収サイクルと比べて、貴社のサイト（入金{data["m_rec"]:.1f}ヶ月、出金{data["m_pay"]:.1f}ヶ月）が適正かも一言触れてください。
+
+### ② 財務の健康診断と潜在リスク
+- 「変動費率（原価の重さ）」や「固定費の重さ」など、なぜそのような利益構造になっているのかという【根本原因】を分析してください。
+- 安全余裕率は「{data["safety_margin_ratio"]:.1f}%」です。{ind}としてこの数値が安全圏か評価してください。
+
+### ③ 明日からやるべき具体的戦術
+- 精神論禁止。最大の要因を解決するための具体的アクションを3つ提示してください。
+
+【データ】
+- 業種: {ind}
+- 売上: {jp_format(data["rev"])} -> {jp_format(data["target_rev"])} ({int(data["sales_change"]):+d}%)
+- 変動費率（原価率）: {data["sim_v_rate"]:.1%}
+- 固定費増（社長の決断した投資額）: {jp_format(data["invest"])}
+- 損益分岐点売上高: {jp_format(data["bep_rev"])}
+- {horizon}ヶ月後残高: {jp_format(data["final_cash"])}
+- 資金ショート: {"あり（黒字倒産リスク）" if data["short_month"] else "なし"}
+- 現預金月商倍率（最低時）: {data["months_sales_ratio"]:.1f}ヶ月
+"""
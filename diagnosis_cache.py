@@ -0,0 +1,144 @@
+"""
+AI-CFO 診断キャッシュ
+=======================================
+同じ【データ】に対する Gemini の診断結果をローカルの SQLite に保存し、
+デモデータの再クリックなどで同じ問い合わせが来たら即座に返す。
+
+- キーはプロンプト入力を量子化（金額は 1 万円、比率は表示桁）した上での正規化 JSON の SHA-256。
+  モデル名とプロンプトのバージョンもキーに含める。
+- SQLite（WAL モード）なので、同じサーバー上の複数セッション・複数プロセスで共有される。
+- 有効期限（TTL）を過ぎたものは使わず、合計サイズが上限を超えたら最終参照が古い順に消す。
+- ヒット率と節約できた生成時間は logging（"ai_cfo.diagnosis_cache"）に出す。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import diagnosis
+
+logger = logging.getLogger("ai_cfo.diagnosis_cache")
+
+DEFAULT_PATH = os.environ.get(
+    "AI_CFO_DIAGNOSIS_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "diagnosis.sqlite3"),
+)
+
+# 量子化の刻み（プロンプトに表示される桁に合わせる）
+QUANTUM = {
+    "rev": 10_000, "target_rev": 10_000, "invest": 10_000, "bep_rev": 10_000,
+    "min_cash": 10_000, "final_cash": 10_000,
+    "sim_v_rate": 0.001, "safety_margin_ratio": 0.1, "months_sales_ratio": 0.1,
+    "m_rec": 0.1, "m_pay": 0.1, "sales_change": 1,
+}
+
+
+def cache_key(data, quantize=True):
+    """プロンプト入力から正規化したキャッシュキーを作る。"""
+    canonical = {}
+    for field in diagnosis.INPUT_FIELDS:
+        value = data[field]
+        if field == "short_month":
+            # プロンプトでは「あり／なし」しか使わない
+            value = bool(value)
+        elif field in QUANTUM and quantize:
+            value = int(round(float(value) / QUANTUM[field]))
+        elif isinstance(value, float):
+            value = repr(value)
+        canonical[field] = value
+    payload = json.dumps(
+        {"model": diagnosis.MODEL_NAME, "prompt_version": diagnosis.PROMPT_VERSION,
+         "quantized": quantize, "data": canonical},
+        ensure_ascii=False, sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DiagnosisCache:
+    def __init__(self, path=DEFAULT_PATH, ttl_seconds=7 * 24 * 3600, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS diagnoses ("
+                " key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL,"
+                " gen_seconds REAL NOT NULL, created REAL NOT NULL, last_access REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS diagnoses_last_access ON diagnoses(last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        """有効なエントリがあれば {"text", "gen_seconds"} を返す。なければ None。"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT text, gen_seconds FROM diagnoses WHERE key = ? AND created >= ?",
+                (key, now - self.ttl_seconds)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE diagnoses SET last_access = ? WHERE key = ?", (now, key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.saved_seconds += row[1]
+            hits, total, saved = self.hits, self.hits + self.misses, self.saved_seconds
+        logger.info(
+            "diagnosis cache %s key=%s hit_rate=%.1f%% (%d/%d) saved_total=%.1fs",
+            "hit" if row else "miss", key[:12], hits / total * 100, hits, total, saved)
+        if row is None:
+            return None
+        return {"text": row[0], "gen_seconds": row[1]}
+
+    def put(self, key, text, gen_seconds):
+        now = time.time()
+        size = len(text.encode("utf-8"))
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO diagnoses (key, text, size, gen_seconds, created, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)", (key, text, size, gen_seconds, now, now))
+            self._evict(conn, now)
+
+    def _evict(self, conn, now):
+        conn.execute("DELETE FROM diagnoses WHERE created < ?", (now - self.ttl_seconds,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM diagnoses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 最終参照が古い順に、上限の 9 割まで減らす
+        excess = total - int(self.max_bytes * 0.9)
+        removed = 0
+        for key, size in conn.execute("SELECT key, size FROM diagnoses ORDER BY last_access").fetchall():
+            if removed >= excess:
+                break
+            conn.execute("DELETE FROM diagnoses WHERE key = ?", (key,))
+            removed += size
+        logger.info("diagnosis cache evicted %d bytes", removed)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "saved_seconds": self.saved_seconds,
+            }
@@ -0,0 +1,358 @@
+"""
+AI-CFO 計算エンジン
+=======================================
+app.py の資金繰り予測ロジックを NumPy でベクトル化したもの。
+レバー（売上変化・原価率変動・固定費増減・目標達成期間）の組み合わせを
+(シナリオ数,) の配列で受け取り、全シナリオを 1 回の呼び出しで計算する。
+"""
+
+import numpy as np
+
+# 予測期間（月数）。現預金の推移は 0ヶ月目（現在）を含めて N_MONTHS + 1 点になる。
+N_MONTHS = 6
+
+
+# ─────────────────────────────────────
+# 内部ヘルパー
+# ─────────────────────────────────────
+def _as_float_arrays(*values):
+    """スカラー／配列を同じ長さの 1 次元 float 配列にそろえる。"""
+    arrays = np.broadcast_arrays(*[np.asarray(v, dtype=float) for v in values])
+    return [a.reshape(-1) for a in arrays]
+
+
+def _safe_div(num, den):
+    """den > 0 のときだけ割り算し、それ以外は 0.0 を返す（app.py の条件式と同じ扱い）。"""
+    out = np.zeros(np.broadcast(num, den).shape)
+    np.divide(num, den, out=out, where=den > 0)
+    return out
+
+
+# ─────────────────────────────────────
+# 資金繰り予測（バッチ）
+# ─────────────────────────────────────
+def revenue_path(revenue, target_rev, ramp_months, n_months=N_MONTHS):
+    """月次売上の推移 (シナリオ数, n_months)。ramp_months かけて目標売上まで直線的に近づく。"""
+    rev, target_rev, ramp_months = _as_float_arrays(revenue, target_rev, ramp_months)
+    # 行 = シナリオ, 列 = 1..n_months
+    month_idx = np.arange(1, n_months + 1, dtype=float)[None, :]
+    progress = np.minimum(month_idx / np.maximum(ramp_months, 1.0)[:, None], 1.0)
+    return np.where(
+        (ramp_months <= 1)[:, None],
+        target_rev[:, None],
+        rev[:, None] + (target_rev - rev)[:, None] * progress,
+    )
+
+
+def scenario_revenue(revenue, sales_change, ramp_months, n_months=N_MONTHS, revenue_base=None):
+    """シナリオの月次売上 (シナリオ数, n_months)。
+
+    revenue_base がなければ revenue から目標売上まで revenue_path() で近づける。
+    あれば伸び率（1 → 1 + 売上変化）を目標達成期間かけて基準売上に掛ける
+    （monthly_flows・モンテカルロ・日次の資金繰りで同じ売上になるよう、ここにまとめる）。
+    """
+    rev, sales_change, ramp_months = _as_float_arrays(revenue, sales_change, ramp_months)
+    if revenue_base is None:
+        return revenue_path(rev, rev * (1 + sales_change / 100), ramp_months, n_months)
+    revenue_base = np.asarray(revenue_base, dtype=float).reshape(-1, n_months)
+    growth = revenue_path(np.ones_like(rev), 1 + sales_change / 100, ramp_months, n_months)
+    return revenue_base * growth
+
+
+def monthly_flows(revenue, cogs, receivables, payables,
+                  sales_change=0, cost_cut=0.0, ramp_months=1, n_months=N_MONTHS,
+                  revenue_base=None):
+    """固定費と現預金に依存しない月次の中間値を計算する。
+
+    固定費の増減（invest）は毎月の営業利益から一律に引かれるだけなので、
+    ここで求めた値に finalize() で後から当てはめられる。
+    レバーグリッドのキャッシュはこの中間値を保持している。
+
+    revenue_base（(シナリオ数 または 1, n_months)、seasonal.baseline の戻り値など）を渡すと、
+    一定の revenue の代わりにこの基準売上を使い、売上変化は「基準売上 × 伸び率」として効く。
+    """
+    if revenue_base is not None:
+        revenue_base = np.asarray(revenue_base, dtype=float).reshape(-1, n_months)
+    # 基準売上だけが社数分の行を持つ場合も、他の入力をその行数にそろえる
+    (rev, cgs, rec, pay, sales_change, cost_cut, ramp_months, _) = _as_float_arrays(
+        revenue, cogs, receivables, payables, sales_change, cost_cut, ramp_months,
+        0.0 if revenue_base is None else revenue_base[:, 0])
+
+    v_rate = _safe_div(cgs, rev)
+    m_rec  = _safe_div(rec, rev)
+    m_pay  = _safe_div(pay, cgs)
+
+    target_rev = rev * (1 + sales_change / 100)
+    sim_v_rate = v_rate * (1 + cost_cut / 100)
+
+    month_rev = scenario_revenue(rev, sales_change, ramp_months, n_months, revenue_base)
+    month_cgs = month_rev * sim_v_rate[:, None]
+
+    ar_balance = month_rev * m_rec[:, None]
+    ap_balance = month_cgs * m_pay[:, None]
+    prev_ar = np.concatenate([rec[:, None], ar_balance[:, :-1]], axis=1)
+    prev_ap = np.concatenate([pay[:, None], ap_balance[:, :-1]], axis=1)
+
+    return {
+        "target_rev": target_rev,
+        "sim_v_rate": sim_v_rate,
+        "m_rec": m_rec,
+        "m_pay": m_pay,
+        "gross": month_rev - month_cgs,
+        "delta_ar": ar_balance - prev_ar,
+        "delta_ap": ap_balance - prev_ap,
+    }
+
+
+def finalize(flows, fixed_cost, cash, invest=0):
+    """monthly_flows() の結果に固定費・投資額・現預金を当てはめ、KPI を求める。"""
+    target_rev = flows["target_rev"]
+    fxd, csh, invest, _ = _as_float_arrays(fixed_cost, cash, invest, target_rev)
+    sim_v_rate = flows["sim_v_rate"]
+    sim_fxd    = fxd + invest
+
+    mg_rate  = np.maximum(1.0 - sim_v_rate, 0.001)
+    bep_rev  = sim_fxd / mg_rate
+    bep_diff = target_rev - bep_rev
+
+    target_op_profit = target_rev - (target_rev * sim_v_rate) - sim_fxd
+    safety_margin_ratio = _safe_div(bep_diff, target_rev) * 100
+    invest_payback_sales = np.where(invest > 0, invest / mg_rate, 0.0)
+
+    month_op_profit = flows["gross"] - sim_fxd[:, None]
+    month_cash_flow = month_op_profit - flows["delta_ar"] + flows["delta_ap"]
+
+    # np.cumsum は先頭から順に足し込むので、ループでの逐次加算と同じ値になる
+    cash_matrix = np.cumsum(
+        np.concatenate([csh[:, None], month_cash_flow], axis=1), axis=1)
+
+    min_cash = cash_matrix.min(axis=1)
+    is_short = cash_matrix < 0
+    short_month = np.where(is_short.any(axis=1), is_short.argmax(axis=1), -1)
+    months_sales_ratio = _safe_div(min_cash, target_rev)
+
+    return {
+        "cash": cash_matrix,
+        "min_cash": min_cash,
+        "short_month": short_month,
+        "bep_rev": bep_rev,
+        "safety_margin_ratio": safety_margin_ratio,
+        "target_rev": target_rev,
+        "sim_v_rate": sim_v_rate,
+        "target_op_profit": target_op_profit,
+        "invest_payback_sales": invest_payback_sales,
+        "months_sales_ratio": months_sales_ratio,
+        "m_rec": flows["m_rec"],
+        "m_pay": flows["m_pay"],
+    }
+
+
+def project(revenue, cogs, fixed_cost, cash, receivables, payables,
+            sales_change=0, cost_cut=0.0, invest=0, ramp_months=1,
+            n_months=N_MONTHS, revenue_base=None):
+    """全シナリオの資金繰りと KPI をまとめて計算する。
+
+    引数はすべてスカラーまたは同じ長さに broadcast できる配列。
+    STEP 1 の数値（revenue〜payables）も配列で渡せるので、
+    複数企業 × 複数シナリオを一度に評価できる。
+
+    戻り値は配列の dict。"cash" は (シナリオ数, n_months + 1) の行列で、
+    列 0 が現在の残高（app.py の cf_line と同じ並び）。
+    "short_month" は最初に残高がマイナスになる月で、ショートしない場合は -1。
+    revenue_base は monthly_flows() を参照（KPI の目標売上・損益分岐点は revenue の月平均のまま）。
+    """
+    (revenue, cogs, fixed_cost, cash, receivables, payables,
+     sales_change, cost_cut, invest, ramp_months) = _as_float_arrays(
+        revenue, cogs, fixed_cost, cash, receivables, payables,
+        sales_change, cost_cut, invest, ramp_months)
+    flows = monthly_flows(revenue, cogs, receivables, payables,
+                          sales_change, cost_cut, ramp_months, n_months, revenue_base)
+    return finalize(flows, fixed_cost, cash, invest)
+
+
+# ─────────────────────────────────────
+# 借入金の返済・当座貸越
+# ─────────────────────────────────────
+# 借入・当座貸越の引数の既定値（すべて 0 なら何もしない）
+FINANCING_DEFAULTS = {
+    "loan_balance": 0.0, "loan_principal": 0.0, "loan_rate": 0.0,
+    "credit_line": 0.0, "overdraft_rate": 0.0, "cash_floor": 0.0,
+}
+
+
+def loan_schedule(loan_balance, loan_principal, loan_rate, n_months=N_MONTHS):
+    """元金均等返済の毎月の支払い。
+
+    loan_principal は毎月の元金返済額、loan_rate は年利（%）。利息は前月末の残高 × 年利 / 12。
+    戻り値は (支払額 = 元金 + 利息 (k, n_months), 月末残高 (k, n_months + 1), 利息 (k, n_months))。
+    """
+    balance, principal, rate = _as_float_arrays(loan_balance, loan_principal, loan_rate)
+    months = np.arange(n_months + 1, dtype=float)[None, :]
+    remaining = np.maximum(balance[:, None] - principal[:, None] * months, 0.0)
+    interest = remaining[:, :-1] * (rate / 1200)[:, None]
+    return remaining[:, :-1] - remaining[:, 1:] + interest, remaining, interest
+
+
+def finance(cash, loan_balance=0.0, loan_principal=0.0, loan_rate=0.0,
+            credit_line=0.0, overdraft_rate=0.0, cash_floor=0.0):
+    """現預金の推移 (シナリオ数, n_months + 1) に借入金の返済と当座貸越を当てはめる。
+
+    - 借入金の返済（元金 + 利息）は全シナリオ共通なので、累計を列ごとに引くだけ。
+    - 当座貸越は、残高が cash_floor を下回る月に credit_line まで自動で借り、残高が戻れば自動で返す。
+      貸越の利息（前月末の貸越残高 × 年利 / 12）は翌月に払う。利息が次の月の不足額を変えるので
+      月の方向だけは順に回すが、各月の計算は全シナリオまとめて行う。
+    credit_line=np.inf なら枠の制限なしで、"overdraft" の最大値が必要な貸越枠の下限になる。
+
+    戻り値は配列の dict:
+        cash               : 返済・貸越を反映した残高 (シナリオ数, n_months + 1)
+        overdraft          : 月末の貸越残高 (シナリオ数, n_months + 1)
+        loan_balance       : 借入金の月末残高 (1 または シナリオ数, n_months + 1)
+        peak_overdraft     : 貸越残高の最大値
+        overdraft_interest : 期間中の貸越利息の合計
+        loan_interest      : 期間中の借入利息の合計
+    """
+    cash = np.atleast_2d(np.asarray(cash, dtype=float))
+    k, points = cash.shape
+    payments, remaining, loan_interest = loan_schedule(loan_balance, loan_principal, loan_rate, points - 1)
+    base = cash.copy()
+    base[:, 1:] -= np.cumsum(payments, axis=1)
+
+    line = np.broadcast_to(np.asarray(credit_line, dtype=float), (k,))
+    rate = np.broadcast_to(np.asarray(overdraft_rate, dtype=float) / 1200, (k,))
+    floor = np.broadcast_to(np.asarray(cash_floor, dtype=float), (k,))
+    paid = np.zeros(k)
+    if np.any(rate > 0):
+        # 月ごとに全シナリオを処理するので、(月, シナリオ) の並びにして 1 行ずつ連続したメモリで回す
+        by_month = np.ascontiguousarray(base.T)
+        overdraft = np.empty_like(by_month)
+        np.clip(floor - by_month[0], 0.0, line, out=overdraft[0])
+        for t in range(1, points):
+            paid += overdraft[t - 1] * rate
+            by_month[t] -= paid
+            np.clip(floor - by_month[t], 0.0, line, out=overdraft[t])
+        base, overdraft = by_month.T, overdraft.T
+    else:
+        # 金利 0 なら利息が次の月に響かないので、全月まとめて求まる
+        overdraft = np.clip(floor[:, None] - base, 0.0, line[:, None])
+    return {
+        "cash": base + overdraft,
+        "overdraft": overdraft,
+        "loan_balance": remaining,
+        "peak_overdraft": overdraft.max(axis=1),
+        "overdraft_interest": paid,
+        "loan_interest": np.broadcast_to(loan_interest.sum(axis=1), (k,)),
+    }
+
+
+def apply_financing(result, **financing):
+    """project()（またはレバーグリッドの lookup）の結果に finance() を当てはめ、KPI を出し直す。
+
+    financing は FINANCING_DEFAULTS のキー。残高まわりの KPI（cash, min_cash, short_month,
+    months_sales_ratio）を置き換え、finance() の他の値を足した新しい dict を返す。
+    """
+    fin = finance(result["cash"], **financing)
+    return with_cash(dict(result, **fin), fin["cash"])
+
+
+def with_cash(result, cash):
+    """結果の残高を cash に置き換え、残高から決まる KPI（min_cash, short_month,
+    months_sales_ratio）を出し直した新しい dict を返す（後から残高を動かす処理の共通部分）。"""
+    min_cash = cash.min(axis=1)
+    is_short = cash < 0
+    out = dict(result, cash=cash, min_cash=min_cash)
+    out["short_month"] = np.where(is_short.any(axis=1), is_short.argmax(axis=1), -1)
+    out["months_sales_ratio"] = _safe_div(min_cash, result["target_rev"])
+    return out
+
+
+# ─────────────────────────────────────
+# 月次ジェネレーター（早期打ち切り用）
+# ─────────────────────────────────────
+def iter_projection(revenue, cogs, fixed_cost, cash, receivables, payables,
+                    sales_change=0, cost_cut=0.0, invest=0, ramp_months=1,
+                    n_months=None):
+    """月ごとの状態を 1 ヶ月ずつ返すジェネレーター（全シナリオ分の配列）。
+
+    n_months=None なら終わりなく続くので、呼び出し側が必要なところで止める。
+    各要素は dict: month, revenue, ar, ap, op_profit, cash_flow, cash。
+    計算順序は project() と同じなので、同じ月の cash は完全に一致する。
+    """
+    (rev, cgs, fxd, csh, rec, pay,
+     sales_change, cost_cut, invest, ramp_months) = _as_float_arrays(
+        revenue, cogs, fixed_cost, cash, receivables, payables,
+        sales_change, cost_cut, invest, ramp_months)
+
+    v_rate = _safe_div(cgs, rev)
+    m_rec  = _safe_div(rec, rev)
+    m_pay  = _safe_div(pay, cgs)
+
+    target_rev = rev * (1 + sales_change / 100)
+    sim_v_rate = v_rate * (1 + cost_cut / 100)
+    sim_fxd    = fxd + invest
+    ramp_safe  = np.maximum(ramp_months, 1.0)
+
+    current_cash = csh
+    prev_ar, prev_ap = rec, pay
+    i = 0
+    while n_months is None or i < n_months:
+        i += 1
+        progress = np.minimum(i / ramp_safe, 1.0)
+        month_rev = np.where(ramp_months <= 1, target_rev, rev + (target_rev - rev) * progress)
+        month_cgs = month_rev * sim_v_rate
+        op_profit = month_rev - month_cgs - sim_fxd
+
+        ar = month_rev * m_rec
+        ap = month_cgs * m_pay
+        cash_flow = op_profit - (ar - prev_ar) + (ap - prev_ap)
+        current_cash = current_cash + cash_flow
+
+        yield {
+            "month": i,
+            "revenue": month_rev,
+            "ar": ar,
+            "ap": ap,
+            "op_profit": op_profit,
+            "cash_flow": cash_flow,
+            "cash": current_cash,
+        }
+        prev_ar, prev_ap = ar, ap
+
+
+def first_shortfall(revenue, cogs, fixed_cost, cash, receivables, payables,
+                    sales_change=0, cost_cut=0.0, invest=0, ramp_months=1,
+                    n_months=60):
+    """n_months 以内に最初に残高がマイナスになる月（ならなければ -1）を返す。
+
+    目標達成期間を過ぎると売上・売掛金・買掛金が一定になり、毎月の収支は営業利益で
+    一定になる。そこから先は
+      - 収支がプラスで残高もプラス → 以後ショートしない
+      - 収支がマイナス → 何ヶ月でマイナスになるかを割り算で求める
+    と確定できるので、ジェネレーターは最長でも ramp_months + 1 ヶ月分しか回さない。
+    5 年（60ヶ月）の判定でも、計算量は目標達成期間ぶんで済む。
+    """
+    (revenue, cogs, fixed_cost, cash, receivables, payables,
+     sales_change, cost_cut, invest, ramp_months) = _as_float_arrays(
+        revenue, cogs, fixed_cost, cash, receivables, payables,
+        sales_change, cost_cut, invest, ramp_months)
+
+    result = np.where(cash < 0, 0, -1)
+    open_ = result < 0
+    for state in iter_projection(revenue, cogs, fixed_cost, cash, receivables, payables,
+                                 sales_change, cost_cut, invest, ramp_months, n_months):
+        i, bal, flow = state["month"], state["cash"], state["cash_flow"]
+        hit = open_ & (bal < 0)
+        result[hit] = i
+        open_ &= ~hit
+
+        # 1ヶ月目は期首の売掛金・買掛金からの一度きりの増減を含むので、収支が一定になるのは
+        # 目標達成期間（最低 1ヶ月）を過ぎた月から
+        steady = open_ & (i > np.maximum(np.ceil(ramp_months), 1))
+        declining = steady & (flow < 0)
+        if declining.any():
+            months_left = np.floor(bal[declining] / -flow[declining]) + 1
+            month = i + months_left
+            result[declining] = np.where(month <= n_months, month, -1)
+        open_ &= ~steady
+        if not open_.any():
+            break
+    return result
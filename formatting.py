@@ -0,0 +1,15 @@
+"""
+表示用フォーマット
+=======================================
+金額の「万円／億円」表記など、画面・AI プロンプト・バッチ出力で共通に使う整形関数。
+"""
+
+
+def jp_format(val):
+    abs_val = abs(val)
+    if abs_val >= 100_000_000:
+        return f"{val/100_000_000:.1f}億円"
+    elif abs_val >= 10_000:
+        return f"{val/10_000:.0f}万円"
+    else:
+        return f"{val:,.0f}円"
@@ -0,0 +1,148 @@
+"""
+レバーグリッド・キャッシュ
+=======================================
+STEP 1 の数値が決まったら、STEP 2 のスライダーが取りうる全組み合わせを
+バックグラウンドで一括計算して保持し、スライダー操作を配列の参照だけにする。
+
+- 原価率変動 −20〜+20%（0.5 刻み）× 売上変化 −50〜+50%（1 刻み）× 目標達成期間 1〜6ヶ月
+  の月次中間値（engine.monthly_flows）をグリッドとして保持する。
+- 固定費の増減（invest）は毎月一律に効くだけなので、参照時に engine.finalize で当てはめる。
+  そのため −5M〜5M のどの刻み（slider_invest_step）の値でも、数値入力欄の任意の値でも
+  グリッド 1 枚で引ける。結果は engine.project と完全に一致する。
+- 保持するグリッドの合計バイト数に上限を設け、古い入力セットから LRU で追い出す。
+"""
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import engine
+
+COST_VALUES  = np.arange(-20.0, 20.0 + 0.25, 0.5)
+SALES_VALUES = np.arange(-50, 50 + 1)
+RAMP_VALUES  = np.arange(1, 6 + 1)
+
+BASE_FIELDS = ("revenue", "cogs", "fixed_cost", "cash", "receivables", "payables")
+
+
+# ─────────────────────────────────────
+# グリッド 1 枚（入力セット 1 つ分）
+# ─────────────────────────────────────
+class LeverGrid:
+    def __init__(self, base, n_months=engine.N_MONTHS):
+        self.base = dict(base)
+        self.n_months = n_months
+
+        cost, sales, ramp = np.meshgrid(COST_VALUES, SALES_VALUES, RAMP_VALUES, indexing="ij")
+        self.flows = engine.monthly_flows(
+            base["revenue"], base["cogs"], base["receivables"], base["payables"],
+            sales_change=sales.ravel(), cost_cut=cost.ravel(), ramp_months=ramp.ravel(),
+            n_months=n_months,
+        )
+
+    @property
+    def nbytes(self):
+        return sum(v.nbytes for v in self.flows.values())
+
+    def index_of(self, cost_cut, sales_change, ramp_months):
+        """グリッド上の行番号。グリッド外の値なら None。"""
+        ci = (cost_cut - COST_VALUES[0]) * 2
+        si = sales_change - SALES_VALUES[0]
+        ri = ramp_months - RAMP_VALUES[0]
+        if not (ci == int(ci) and si == int(si) and ri == int(ri)):
+            return None
+        ci, si, ri = int(ci), int(si), int(ri)
+        if not (0 <= ci < len(COST_VALUES) and 0 <= si < len(SALES_VALUES) and 0 <= ri < len(RAMP_VALUES)):
+            return None
+        return (ci * len(SALES_VALUES) + si) * len(RAMP_VALUES) + ri
+
+    def lookup(self, invest, cost_cut, sales_change, ramp_months):
+        """engine.project と同じ形（長さ 1）の結果を返す。グリッド外なら None。"""
+        row = self.index_of(cost_cut, sales_change, ramp_months)
+        if row is None:
+            return None
+        flows = {k: v[row:row + 1] for k, v in self.flows.items()}
+        return engine.finalize(flows, self.base["fixed_cost"], self.base["cash"], invest)
+
+
+# ─────────────────────────────────────
+# 入力セットごとの LRU キャッシュ
+# ─────────────────────────────────────
+class LeverGridCache:
+    """入力セット → LeverGrid の LRU キャッシュ（プロセス内で共有、スレッドセーフ）。
+
+    get() が未計算の入力セットを 2 回続けて受け取ったら「入力が落ち着いた」とみなし、
+    バックグラウンドでグリッドを計算する。計算が終わるまでは None を返すので、
+    呼び出し側は engine.project で直接計算する。
+    """
+
+    def __init__(self, max_bytes=128 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._grids = OrderedDict()
+        self._pending = set()
+        self._last_miss = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lever-grid")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_of(base, n_months=engine.N_MONTHS):
+        return tuple(int(base[f]) for f in BASE_FIELDS) + (int(n_months),)
+
+    def get(self, base, n_months=engine.N_MONTHS):
+        key = self.key_of(base, n_months)
+        with self._lock:
+            grid = self._grids.get(key)
+            if grid is not None:
+                self._grids.move_to_end(key)
+                return grid
+            stable = key == self._last_miss
+            self._last_miss = key
+            if stable and key not in self._pending:
+                self._pending.add(key)
+                self._executor.submit(self._build, key, dict(base), n_months)
+        return None
+
+    def lookup(self, base, invest, cost_cut, sales_change, ramp_months, n_months=engine.N_MONTHS):
+        """キャッシュから KPI と資金推移を引く。ヒットしなければ None。"""
+        grid = self.get(base, n_months)
+        result = grid.lookup(invest, cost_cut, sales_change, ramp_months) if grid is not None else None
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def _build(self, key, base, n_months):
+        try:
+            grid = LeverGrid(base, n_months)
+            with self._lock:
+                if grid.nbytes <= self.max_bytes:
+                    self._grids[key] = grid
+                    self._evict()
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    def _evict(self):
+        total = sum(g.nbytes for g in self._grids.values())
+        while total > self.max_bytes and self._grids:
+            _, old = self._grids.popitem(last=False)
+            total -= old.nbytes
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._grids),
+                "bytes": sum(g.nbytes for g in self._grids.values()),
+                "pending": len(self._pending),
+            }
@@ -0,0 +1,526 @@
+"""
+会計データの取り込み（仕訳帳・試算表 CSV）
+=======================================
+会計ソフトから書き出した仕訳帳・試算表の CSV（Shift-JIS / UTF-8、複数年分でもよい）を読み、
+STEP 1 の 6 項目（売上高・変動費・固定費の月平均と、現預金・売掛金・買掛金の現在残高）を求める。
+
+- 文字コードは先頭を読んで判定する（UTF-8 として読めなければ cp932）。
+- 見出し行は先頭 30 行から探す（列名は freee・マネーフォワード・弥生などの書き出しに合わせた別名で照合）。
+  見出しのない「弥生インポート形式」の仕訳は列の位置で読む。
+- 本文は pandas で CHUNK_ROWS 行ずつ読み、使う列だけを「月 × 勘定科目」の借方・貸方合計に畳み込む。
+  数百万行でもメモリに載るのは 1 チャンク分と集計表（月数 × 科目数）だけ。
+- 集計表はファイルの SHA-256 ごとに SQLite に保存する。同じファイルの再アップロードや、
+  科目の割り当て（mapping）を変えたときは CSV を読み直さず、集計表から 6 項目を出し直す。
+
+科目 → 6 項目の割り当ては DEFAULT_MAPPING（科目名・科目コードの fnmatch パターン）。
+環境変数 AI_CFO_ACCOUNT_MAP に JSON ファイルを指定すると既定を置き換えられる。
+
+残高の求め方:
+    仕訳帳 : 入っている全期間の借方 − 貸方の累計（期首残高・開始仕訳を含む書き出しを前提とする）
+    試算表 : 各科目の最新月の残高列
+"""
+
+import codecs
+import csv
+import fnmatch
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_PATH = os.environ.get(
+    "AI_CFO_LEDGER_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "ledger.sqlite3"),
+)
+
+FIELDS = ("revenue", "cogs", "fixed_cost", "cash", "receivables", "payables")
+FLOW_FIELDS = ("revenue", "cogs", "fixed_cost")
+# 借方 − 貸方 に掛ける符号（売上・買掛金は貸方が増える側）
+SIGN = {"revenue": -1, "cogs": 1, "fixed_cost": 1, "cash": 1, "receivables": 1, "payables": -1}
+FIELD_LABELS = {
+    "revenue": "月間売上高", "cogs": "変動費", "fixed_cost": "固定費",
+    "cash": "現預金残高", "receivables": "売掛金残高", "payables": "買掛金残高",
+}
+
+DEFAULT_MAPPING = {
+    "revenue": ("売上高", "売上", "*売上高", "*売上", "完成工事高", "役務収益"),
+    "cogs": ("売上原価", "*売上原価", "仕入高", "*仕入高", "材料費", "*材料費", "外注費", "外注加工費",
+             "完成工事原価", "期首商品棚卸高", "期末商品棚卸高"),
+    "fixed_cost": ("役員報酬", "給料手当", "給与手当", "給料", "賞与", "雑給", "法定福利費", "福利厚生費",
+                   "地代家賃", "賃借料", "リース料", "減価償却費", "水道光熱費", "通信費", "旅費交通費",
+                   "広告宣伝費", "販売促進費", "接待交際費", "会議費", "消耗品費", "事務用品費", "修繕費",
+                   "保険料", "租税公課", "支払手数料", "支払報酬", "支払報酬料", "車両費", "荷造運賃",
+                   "新聞図書費", "研修費", "諸会費", "雑費"),
+    "cash": ("現金", "小口現金", "普通預金", "当座預金", "定期預金", "通知預金", "*預金"),
+    "receivables": ("売掛金", "受取手形", "電子記録債権", "完成工事未収入金"),
+    "payables": ("買掛金", "支払手形", "電子記録債務", "工事未払金"),
+}
+
+CHUNK_ROWS = 200_000
+HEADER_SCAN_LINES = 30
+UNDATED = 0           # 期間の列がない試算表（1 期間分）の月番号
+_ACCOUNT_BITS = 20    # 集計キー = 月番号 << _ACCOUNT_BITS | 科目番号
+
+# 列名の別名（NFKC 正規化・空白除去のあとで照合する）
+COLUMNS = {
+    "date": ("日付", "取引日", "伝票日付", "取引日付", "仕訳日", "計上日", "発生日", "年月日"),
+    "month": ("年月", "月度", "対象月", "会計月", "期間"),
+    "debit_account": ("借方勘定科目", "借方科目", "借方勘定科目名", "借方科目名"),
+    "debit_code": ("借方勘定科目コード", "借方科目コード", "借方コード"),
+    "debit_amount": ("借方金額", "借方金額(円)", "借方本体金額"),
+    "credit_account": ("貸方勘定科目", "貸方科目", "貸方勘定科目名", "貸方科目名"),
+    "credit_code": ("貸方勘定科目コード", "貸方科目コード", "貸方コード"),
+    "credit_amount": ("貸方金額", "貸方金額(円)", "貸方本体金額"),
+    "account": ("勘定科目", "科目", "勘定科目名", "科目名"),
+    "code": ("勘定科目コード", "科目コード", "コード"),
+    "debit": ("借方", "借方金額", "借方発生額", "当月借方", "当期借方"),
+    "credit": ("貸方", "貸方金額", "貸方発生額", "当月貸方", "当期貸方"),
+    "balance": ("期末残高", "残高", "当月残高", "次月繰越", "翌月繰越"),
+}
+
+TEXT_ROLES = ("date", "debit_account", "debit_code", "credit_account", "credit_code", "account", "code")
+
+# 見出しのない「弥生インポート形式」（先頭列が識別フラグ）の列位置
+YAYOI_FLAGS = {"2000", "2100", "2101", "2110", "2111"}
+YAYOI_COLUMNS = {"date": 3, "debit_account": 4, "debit_amount": 8, "credit_account": 10, "credit_amount": 14}
+
+
+def _normalize(text):
+    return re.sub(r"\s", "", unicodedata.normalize("NFKC", str(text)))
+
+
+# ─────────────────────────────────────
+# 科目の割り当て
+# ─────────────────────────────────────
+def load_mapping(path=None):
+    """AI_CFO_ACCOUNT_MAP（{"revenue": ["売上高", "4*"], ...} の JSON）があれば読み、なければ既定を返す。"""
+    path = path or os.environ.get("AI_CFO_ACCOUNT_MAP")
+    if not path:
+        return DEFAULT_MAPPING
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {field: tuple(data.get(field, ())) for field in FIELDS}
+
+
+def parse_mapping(text):
+    """画面で編集する「項目 = パターン, パターン」の行を mapping に直す。知らない項目名は ValueError。"""
+    mapping = {field: () for field in FIELDS}
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        field, _, patterns = line.partition("=")
+        field = field.strip()
+        if field not in mapping:
+            raise ValueError(f"項目名が正しくありません: {field}（{', '.join(FIELDS)} のいずれか）")
+        mapping[field] = tuple(p.strip() for p in re.split(r"[,、]", patterns) if p.strip())
+    return mapping
+
+
+def format_mapping(mapping):
+    return "\n".join(f"{field} = {', '.join(mapping.get(field, ()))}" for field in FIELDS)
+
+
+def field_of(code, name, mapping):
+    """科目（コード・名前）が当たる項目名。どれにも当たらなければ None。"""
+    for field in FIELDS:
+        for pattern in mapping.get(field, ()):
+            if (name and fnmatch.fnmatchcase(name, pattern)) or (code and fnmatch.fnmatchcase(code, pattern)):
+                return field
+    return None
+
+
+# ─────────────────────────────────────
+# 書式の判定
+# ─────────────────────────────────────
+def detect_encoding(head):
+    """先頭のバイト列が UTF-8 として読めれば utf-8-sig、読めなければ cp932。"""
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        return "utf-8-sig"
+    except UnicodeDecodeError:
+        return "cp932"
+
+
+def _match_columns(header):
+    names = [_normalize(h) for h in header]
+    found = {}
+    for role, aliases in COLUMNS.items():
+        for alias in aliases:
+            if alias in names:
+                found[role] = names.index(alias)
+                break
+    return found
+
+
+def detect_layout(head_text):
+    """先頭の数十行から書式を判定する。
+
+    戻り値は {"kind": "journal" / "trial_balance", "header_row": 見出し行の番号（なければ None）,
+    "columns": {役割: 列番号}}。どれにも当たらなければ ValueError。
+    """
+    rows = list(csv.reader(io.StringIO(head_text)))[:HEADER_SCAN_LINES]
+    for i, row in enumerate(rows):
+        found = _match_columns(row)
+        has_side = lambda side: (f"{side}_account" in found or f"{side}_code" in found) and f"{side}_amount" in found
+        if has_side("debit") and has_side("credit") and "date" in found:
+            # 試算表の「借方」「貸方」と取り違えないよう、仕訳帳の列は同じ名前でも役割を絞る
+            return {"kind": "journal", "header_row": i, "columns": {
+                k: v for k, v in found.items()
+                if k in ("date", "debit_account", "debit_code", "debit_amount",
+                         "credit_account", "credit_code", "credit_amount")}}
+        if ("account" in found or "code" in found) and ("balance" in found or "debit" in found):
+            columns = {k: v for k, v in found.items()
+                       if k in ("date", "month", "account", "code", "debit", "credit", "balance")}
+            if "month" in columns:
+                columns["date"] = columns.pop("month")
+            return {"kind": "trial_balance", "header_row": i, "columns": columns}
+    if rows and rows[0] and rows[0][0].strip() in YAYOI_FLAGS and len(rows[0]) > max(YAYOI_COLUMNS.values()):
+        return {"kind": "journal", "header_row": None, "columns": dict(YAYOI_COLUMNS)}
+    raise ValueError("仕訳帳・試算表の見出し（日付・勘定科目・借方金額・貸方金額・残高など）が見つかりません。")
+
+
+# ─────────────────────────────────────
+# 値の読み替え
+# ─────────────────────────────────────
+_WESTERN = re.compile(r"^(\d{4})[/\-.年](\d{1,2})")
+_COMPACT = re.compile(r"^(\d{4})(\d{2})(\d{2})?$")
+_ERA = re.compile(r"^(令和|平成|昭和|[RHS])(\d{1,2}|元)[/\-.年](\d{1,2})", re.IGNORECASE)
+_ERA_START = {"令和": 2018, "R": 2018, "平成": 1988, "H": 1988, "昭和": 1925, "S": 1925}
+
+
+def month_number(text):
+    """日付・年月の文字列を月番号（年 × 12 + 月 − 1）に直す。読めなければ −1。
+
+    2024/04/01・2024-04・20240401・202404・2024年4月・R6.4.1・令和元年5月 などを読む。
+    """
+    text = unicodedata.normalize("NFKC", str(text)).strip()
+    m = _WESTERN.match(text) or _COMPACT.match(text)
+    if m:
+        year, month = int(m.group(1)), int(m.group(2))
+    else:
+        m = _ERA.match(text)
+        if not m:
+            return -1
+        era, year = m.group(1).upper() if len(m.group(1)) == 1 else m.group(1), m.group(2)
+        year, month = _ERA_START[era] + (1 if year == "元" else int(year)), int(m.group(3))
+    return year * 12 + month - 1 if 1 <= month <= 12 else -1
+
+
+def month_label(number):
+    return f"{number // 12}-{number % 12 + 1:02d}"
+
+
+def _amounts(column, missing=0.0):
+    """金額の列を float に直す（「1,234」「△1,234」「¥1,234」、空欄は missing）。
+
+    数字だけの列は read_csv がそのまま数値で読むので、文字列の置き換えは記号の混じるチャンクだけで行う。
+    """
+    if column.dtype.kind not in "iuf":
+        text = column.astype("string").str.replace(r"[,\s円¥￥]", "", regex=True)
+        column = pd.to_numeric(text.str.replace(r"^[△▲]", "-", regex=True), errors="coerce")
+    return column.to_numpy(dtype=float, na_value=missing)
+
+
+# ─────────────────────────────────────
+# 集計（チャンクごと）
+# ─────────────────────────────────────
+class _Accumulator:
+    """「月 × 科目」ごとの借方合計・貸方合計・最新残高を溜める。"""
+
+    def __init__(self):
+        self.index = {}       # 科目の名前（なければコード） → 科目番号
+        self.accounts = []    # 科目番号 → [コード, 名前]
+        self.months = {}      # 日付の文字列 → 月番号（チャンクをまたいで使い回す）
+        self.cells = {}       # 集計キー → [借方, 貸方, 残高]
+        self.rows = 0
+        self.skipped = 0
+
+    def month_ids(self, column):
+        if column is None:
+            return None
+        codes, uniques = pd.factorize(column)
+        lut = np.empty(len(uniques) + 1, dtype=np.int64)
+        for j, value in enumerate(uniques):
+            number = self.months.get(value)
+            if number is None:
+                number = self.months[value] = month_number(value)
+            lut[j] = number
+        lut[-1] = -1          # 空欄（factorize の −1）
+        return lut[codes]
+
+    def account_ids(self, names, codes):
+        key = names if names is not None else codes
+        ids, uniques = pd.factorize(key)
+        first = None
+        lut = np.empty(len(uniques) + 1, dtype=np.int64)
+        for j, value in enumerate(uniques):
+            label = _normalize(value)
+            if not label:
+                lut[j] = -1
+                continue
+            number = self.index.get(label)
+            if number is None:
+                number = self.index[label] = len(self.accounts)
+                code = ""
+                if codes is not None and names is not None:
+                    # コードと名前の両方があるときは、名前ごとに最初に出てきた行のコードを控える
+                    if first is None:
+                        first = pd.Series(np.arange(len(ids))).groupby(ids).first().to_dict()
+                    code = _normalize(codes.iloc[first[j]])
+                self.accounts.append([code, label] if names is not None else [label, ""])
+            lut[j] = number
+        lut[-1] = -1
+        return lut[ids]
+
+    def add(self, months, accounts, values, slot):
+        """slot 0 = 借方合計、1 = 貸方合計、2 = 残高（同じ月・科目に複数あれば後の行）。"""
+        ok = (months >= 0) & (accounts >= 0)
+        if slot == 2:
+            ok &= ~np.isnan(values)
+        else:
+            ok &= values != 0
+        months, accounts, values = months[ok], accounts[ok], values[ok]
+        if not len(months):
+            return
+        # チャンク内の「月 × 科目」の密な表に bincount で積む（並べ替えなし）
+        first = months.min()
+        width = len(self.accounts)
+        cell = (months - first) * width + accounts
+        size = (months.max() - first + 1) * width
+        if slot == 2:
+            last = np.full(size, -1, dtype=np.int64)
+            np.maximum.at(last, cell, np.arange(len(cell)))
+            used = np.flatnonzero(last >= 0)
+            sums = values[last[used]]
+        else:
+            used = np.flatnonzero(np.bincount(cell, minlength=size))
+            sums = np.bincount(cell, weights=values, minlength=size)[used]
+        keys = ((used // width + first) << _ACCOUNT_BITS) | (used % width)
+        for key, value in zip(keys.tolist(), sums.tolist()):
+            cell = self.cells.get(key)
+            if cell is None:
+                cell = self.cells[key] = [0.0, 0.0, np.nan]
+            if slot == 2:
+                cell[2] = value
+            else:
+                cell[slot] += value
+
+    def result(self, kind, encoding, has_movements, has_balance):
+        months = sorted({key >> _ACCOUNT_BITS for key in self.cells})
+        row_of = {m: i for i, m in enumerate(months)}
+        mask = (1 << _ACCOUNT_BITS) - 1
+        shape = (len(months), len(self.accounts))
+        debit, credit, balance = np.zeros(shape), np.zeros(shape), np.full(shape, np.nan)
+        for key, (d, c, b) in self.cells.items():
+            i, j = row_of[key >> _ACCOUNT_BITS], key & mask
+            debit[i, j], credit[i, j], balance[i, j] = d, c, b
+        return {
+            "kind": kind, "encoding": encoding, "rows": self.rows, "skipped": self.skipped,
+            "has_movements": has_movements, "has_balance": has_balance,
+            "months": months, "accounts": self.accounts,
+            "debit": debit, "credit": credit, "balance": balance,
+        }
+
+
+def _read_chunks(f, encoding, layout, chunk_rows):
+    columns = layout["columns"]
+    positions = sorted(set(columns.values()))
+    header = layout["header_row"]
+    # 日付・科目は文字列のまま、金額は read_csv に数値として読ませる（「1,234」も可）
+    text_columns = {columns[role] for role in columns if role in TEXT_ROLES}
+    reader = pd.read_csv(
+        f, encoding=encoding, header=None, skiprows=(header + 1) if header is not None else 0,
+        usecols=positions, dtype={pos: object for pos in text_columns}, chunksize=chunk_rows, thousands=",",
+        keep_default_na=False, na_values=[""], skip_blank_lines=True, on_bad_lines="skip",
+    )
+    for chunk in reader:
+        yield {role: chunk[pos] for role, pos in columns.items()}
+
+
+def parse(f, chunk_rows=CHUNK_ROWS):
+    """CSV（バイナリのファイルオブジェクト）を読み、「月 × 科目」の集計表を返す。"""
+    head = f.read(64 * 1024)
+    f.seek(0)
+    encoding = detect_encoding(head)
+    layout = detect_layout(head.decode(encoding, errors="ignore"))
+    columns = layout["columns"]
+    acc = _Accumulator()
+    for chunk in _read_chunks(f, encoding, layout, chunk_rows):
+        n = len(next(iter(chunk.values())))
+        acc.rows += n
+        if "date" in chunk:
+            months = acc.month_ids(chunk["date"])
+            acc.skipped += int(np.count_nonzero(months < 0))
+        else:
+            months = np.full(n, UNDATED, dtype=np.int64)
+        if layout["kind"] == "journal":
+            for side, slot in (("debit", 0), ("credit", 1)):
+                accounts = acc.account_ids(chunk.get(f"{side}_account"), chunk.get(f"{side}_code"))
+                acc.add(months, accounts, _amounts(chunk[f"{side}_amount"]), slot)
+        else:
+            accounts = acc.account_ids(chunk.get("account"), chunk.get("code"))
+            for role, slot in (("debit", 0), ("credit", 1)):
+                if role in chunk:
+                    acc.add(months, accounts, _amounts(chunk[role]), slot)
+            if "balance" in chunk:
+                acc.add(months, accounts, _amounts(chunk["balance"], missing=np.nan), 2)
+    has_movements = layout["kind"] == "journal" or "debit" in columns
+    return acc.result(layout["kind"], encoding, has_movements, "balance" in columns)
+
+
+# ─────────────────────────────────────
+# 6 項目への割り当て
+# ─────────────────────────────────────
+def summarize(agg, mapping=None, months=12, period_months=12):
+    """集計表から STEP 1 の 6 項目を求める。
+
+    売上・変動費・固定費は最新月から遡って months ヶ月（入っている期間が短ければその月数）の平均。
+    期間の列がない試算表は、全体を period_months ヶ月分として割る。
+    戻り値は 6 項目（円・0 以上の整数）に加え、"months"（平均した月数）、"period"（最初と最後の月）、
+    "accounts"（項目ごとの科目名）、"unmapped"（どれにも当たらなかった科目を金額の大きい順に）、
+    "monthly"（月ごとの売上・変動費・固定費）。
+    """
+    mapping = mapping or DEFAULT_MAPPING
+    assigned = [field_of(code, name, mapping) for code, name in agg["accounts"]]
+    net = agg["debit"] - agg["credit"]
+    month_keys = list(agg["months"])
+    dated = bool(month_keys) and month_keys[0] != UNDATED
+    out = {"accounts": {f: [] for f in FIELDS}}
+    for j, field in enumerate(assigned):
+        if field:
+            out["accounts"][field].append(agg["accounts"][j][1] or agg["accounts"][j][0])
+    activity = np.abs(net).sum(axis=0) + np.nan_to_num(np.abs(agg["balance"])).sum(axis=0)
+    out["unmapped"] = [agg["accounts"][j][1] or agg["accounts"][j][0]
+                       for j in np.argsort(-activity, kind="stable") if assigned[j] is None and activity[j] > 0]
+
+    columns = {f: np.array([a == f for a in assigned], dtype=bool) for f in FIELDS}
+    if dated:
+        first, last = month_keys[0], month_keys[-1]
+        span = np.arange(first, last + 1)
+        dense = np.zeros((len(span), net.shape[1]))
+        dense[np.asarray(month_keys) - first] = net
+        window = min(months, len(span))
+        out["months"] = window
+        out["period"] = (month_label(first), month_label(last))
+        out["monthly"] = {"labels": [month_label(m) for m in span]}
+        for f in FLOW_FIELDS:
+            series = SIGN[f] * dense[:, columns[f]].sum(axis=1)
+            out["monthly"][f] = series
+            out[f] = series[-window:].sum() / window
+    else:
+        out["months"] = period_months
+        out["period"] = None
+        out["monthly"] = None
+        for f in FLOW_FIELDS:
+            if agg["has_movements"]:
+                total = SIGN[f] * net[:, columns[f]].sum()
+            else:
+                # 発生額の列がない試算表は、損益科目の残高（期間の累計）を使う
+                total = np.nansum(agg["balance"][:, columns[f]])
+            out[f] = total / period_months
+
+    for f in ("cash", "receivables", "payables"):
+        if agg["kind"] == "trial_balance" and agg["has_balance"]:
+            # 各科目の最新の残高（試算表は科目の本来の側をプラスで出すので符号は掛けない）
+            latest = pd.DataFrame(agg["balance"][:, columns[f]]).ffill().iloc[-1:].to_numpy()
+            value = float(np.nansum(latest))
+            # 貸方残高をマイナスで出す会計ソフトもあるので、買掛金は絶対値にする
+            out[f] = abs(value) if f == "payables" else value
+        else:
+            out[f] = SIGN[f] * net[:, columns[f]].sum()
+    for f in FIELDS:
+        out[f] = max(int(round(float(out[f]))), 0)
+    return out
+
+
+# ─────────────────────────────────────
+# 集計表のキャッシュ（ファイルの SHA-256 ごと）
+# ─────────────────────────────────────
+def file_digest(f, block=1 << 20):
+    digest = hashlib.sha256()
+    for data in iter(lambda: f.read(block), b""):
+        digest.update(data)
+    f.seek(0)
+    return digest.hexdigest()
+
+
+def _encode(agg):
+    payload = {k: v for k, v in agg.items() if k not in ("debit", "credit", "balance")}
+    for k in ("debit", "credit", "balance"):
+        payload[k] = np.where(np.isnan(agg[k]), None, agg[k]).tolist()
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+def _decode(text):
+    agg = json.loads(text)
+    n_accounts = len(agg["accounts"])
+    for k in ("debit", "credit", "balance"):
+        agg[k] = np.array(agg[k], dtype=float).reshape(len(agg["months"]), n_accounts)
+    return agg
+
+
+class AggregateCache:
+    """ファイルの SHA-256 → 集計表。SQLite（WAL）に保存し、件数が上限を超えたら古い順に消す。"""
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=200):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS aggregates ("
+                " digest TEXT PRIMARY KEY, payload TEXT NOT NULL, seconds REAL NOT NULL,"
+                " created REAL NOT NULL, last_used REAL NOT NULL)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def load(self, f, chunk_rows=CHUNK_ROWS):
+        """ファイルを集計する。同じ中身を集計済みなら CSV は読まずに返す。"""
+        digest = file_digest(f)
+        with self._connect() as conn:
+            row = conn.execute("SELECT payload FROM aggregates WHERE digest = ?", (digest,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE aggregates SET last_used = ? WHERE digest = ?", (time.time(), digest))
+        if row is not None:
+            with self._lock:
+                self.hits += 1
+            return _decode(row[0])
+        started = time.perf_counter()
+        agg = parse(f, chunk_rows)
+        seconds = time.perf_counter() - started
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO aggregates (digest, payload, seconds, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?)", (digest, _encode(agg), seconds, now, now))
+            conn.execute(
+                "DELETE FROM aggregates WHERE digest NOT IN"
+                " (SELECT digest FROM aggregates ORDER BY last_used DESC LIMIT ?)", (self.max_entries,))
+        with self._lock:
+            self.misses += 1
+        return agg
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
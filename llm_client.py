@@ -0,0 +1,271 @@
+"""
+AI-CFO 用 LLM クライアント
+=======================================
+全セッションで共有する、プロセスに 1 つだけの LLM クライアント。
+
+- バックエンドは差し替え可能（Gemini / ネットワーク不要のスタブ）。
+  環境変数 AI_CFO_LLM_BACKEND=stub でスタブになり、API キーなしで診断の負荷試験ができる。
+- トークンバケットで 1 分あたりの呼び出し数を、セマフォで同時実行数を制限する。
+  同時実行の空き待ちが queue_timeout 秒を超えたら LLMBusyError。
+- 一時的なエラー（上限超過・サーバー混雑・タイムアウトなど）は、最初のチャンクが届く前なら
+  指数バックオフ（ジッター付き）で再試行する。
+- 利用者には生の例外ではなく、LLMError.user_message の日本語メッセージを見せる。
+- Gemini SDK（google.generativeai）は import に約 1 秒かかるので、最初の診断まで読み込まない。
+  prewarm() を初回表示のあとに呼ぶと、裏のスレッドで先に読み込んでおく（AI_CFO_PREWARM=0 で無効）。
+"""
+
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+
+import diagnosis
+
+logger = logging.getLogger("ai_cfo.llm_client")
+
+# google.api_core.exceptions の一時的なエラー（SDK を import せずにクラス名で判定する）
+TRANSIENT_ERROR_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+    "InternalServerError", "Aborted", "GatewayTimeout",
+}
+
+
+# ─────────────────────────────────────
+# 例外
+# ─────────────────────────────────────
+class LLMError(Exception):
+    user_message = "AI診断中にエラーが発生しました。しばらく待ってから再試行してください。"
+
+
+class LLMBusyError(LLMError):
+    user_message = "AI-CFOが混み合っています。少し時間をおいて再試行してください。"
+
+
+class LLMQuotaError(LLMError):
+    user_message = "AIの利用上限に達しました。しばらく待ってから再試行してください。"
+
+
+class TransientError(Exception):
+    """バックエンドが「再試行すれば通るかもしれない」ことを示すための例外。"""
+
+
+def is_transient(exc):
+    return (isinstance(exc, (TransientError, ConnectionError, TimeoutError))
+            or type(exc).__name__ in TRANSIENT_ERROR_NAMES)
+
+
+# ─────────────────────────────────────
+# バックエンド
+# ─────────────────────────────────────
+class Backend:
+    """LLM バックエンドの共通インターフェース。stream() で回答をテキスト片ごとに返す。"""
+
+    name = "base"
+
+    def stream(self, prompt):
+        raise NotImplementedError
+
+
+class GeminiBackend(Backend):
+    name = "gemini"
+
+    def __init__(self, api_key, model_name=diagnosis.MODEL_NAME, endpoint=None):
+        import google.generativeai as genai
+        if endpoint:
+            # REST で別の API エンドポイント（ローカルのスタブサーバーなど）に送る
+            genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": endpoint})
+        else:
+            genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    def stream(self, prompt):
+        for chunk in self.model.generate_content(prompt, stream=True):
+            if chunk.candidates and chunk.candidates[0].content.parts:
+                yield chunk.text
+
+
+class StubBackend(Backend):
+    """ネットワークを使わないスタブ。決まった形の回答を、遅延をつけて少しずつ返す。
+
+    latency     : 最初のチャンクまでの秒数
+    chunk_delay : チャンク間の秒数
+    fail_rate   : 最初のチャンクの前に TransientError を出す確率（再試行の確認用）
+    """
+
+    name = "stub"
+
+    def __init__(self, latency=0.3, chunk_delay=0.05, n_chunks=8, fail_rate=0.0, seed=None):
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.n_chunks = n_chunks
+        self.fail_rate = fail_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def stream(self, prompt):
+        time.sleep(self.latency)
+        with self._lock:
+            fail = self._random.random() < self.fail_rate
+        if fail:
+            raise TransientError("stub: simulated transient failure")
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8]
+        text = (
+            f"### ① 資金繰りリスクの評価\n（スタブ回答 {digest}）資金の動きを確認しました。\n\n"
+            "### ② 財務の健康診断と潜在リスク\n利益の構造を確認しました。\n\n"
+            "### ③ 明日からやるべき具体的戦術\n1. 入金を早める\n2. 支払条件を見直す\n3. 投資時期を再検討する\n"
+        )
+        size = -(-len(text) // self.n_chunks)
+        for i in range(0, len(text), size):
+            if i:
+                time.sleep(self.chunk_delay)
+            yield text[i:i + size]
+
+
+# ─────────────────────────────────────
+# 流量制御
+# ─────────────────────────────────────
+class TokenBucket:
+    """rate 個/秒で補充され、最大 capacity 個ためられるトークンバケット（スレッドセーフ）。"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class LLMClient:
+    def __init__(self, backend, max_concurrency=4, rate_per_minute=60, max_retries=3,
+                 base_delay=1.0, max_delay=20.0, queue_timeout=30.0):
+        self.backend = backend
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket(rate_per_minute / 60, capacity=max(1, max_concurrency))
+
+    def stream(self, prompt):
+        """回答をテキスト片ごとに返す。最初のチャンクより前の一時的エラーは再試行する。"""
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            raise LLMBusyError("no free slot")
+        try:
+            attempt = 0
+            while True:
+                if not self._bucket.acquire(timeout=self.queue_timeout):
+                    raise LLMBusyError("rate limit wait timed out")
+                started = False
+                try:
+                    for piece in self.backend.stream(prompt):
+                        started = True
+                        yield piece
+                    return
+                except Exception as e:
+                    if started or not is_transient(e):
+                        raise
+                    if attempt >= self.max_retries:
+                        if type(e).__name__ in ("ResourceExhausted", "TooManyRequests"):
+                            raise LLMQuotaError(str(e)) from e
+                        raise LLMError(str(e)) from e
+                    delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                    delay *= 0.5 + random.random() / 2
+                    logger.warning("transient %s from %s, retry %d in %.1fs",
+                                   type(e).__name__, self.backend.name, attempt + 1, delay)
+                    attempt += 1
+                    time.sleep(delay)
+        finally:
+            self._slots.release()
+
+    def generate(self, prompt):
+        return "".join(self.stream(prompt))
+
+
+# ─────────────────────────────────────
+# プロセス共有のクライアント
+# ─────────────────────────────────────
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def backend_name():
+    return os.environ.get("AI_CFO_LLM_BACKEND", "gemini")
+
+
+def make_backend(api_key=None):
+    """環境変数 AI_CFO_LLM_BACKEND のバックエンドを作る。
+
+    AI_CFO_LLM_ENDPOINT（例: http://127.0.0.1:8766）を指定すると、Gemini への問い合わせを
+    そのエンドポイントに送る（benchmarks/stub_llm_server.py で SDK を含めた通しの確認ができる）。
+    """
+    name = backend_name()
+    if name == "stub":
+        return StubBackend()
+    if name == "gemini":
+        return GeminiBackend(api_key, endpoint=os.environ.get("AI_CFO_LLM_ENDPOINT"))
+    raise ValueError(f"unknown LLM backend: {name}")
+
+
+def get_client(api_key=None):
+    """バックエンドごとに 1 つだけ作ったクライアントを返す（全セッション共有）。"""
+    name = backend_name()
+    key = (name, api_key)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            backend = make_backend(api_key)
+            client = LLMClient(
+                backend,
+                max_concurrency=int(os.environ.get("AI_CFO_LLM_CONCURRENCY", "4")),
+                rate_per_minute=float(os.environ.get("AI_CFO_LLM_RPM", "60")),
+            )
+            _clients[key] = client
+        return client
+
+
+# ─────────────────────────────────────
+# 事前読み込み
+# ─────────────────────────────────────
+_prewarm_thread = None
+
+
+def _import_sdk():
+    started = time.perf_counter()
+    try:
+        import google.generativeai  # noqa: F401
+    except Exception as e:
+        logger.warning("prewarm failed: %s", e)
+        return
+    logger.info("prewarmed google.generativeai in %.0fms", (time.perf_counter() - started) * 1000)
+
+
+def prewarm():
+    """Gemini SDK の import を裏のスレッドで 1 回だけ始める（プロセスで 1 回）。
+
+    スタブのとき・AI_CFO_PREWARM=0 のときは何もしない。起動したスレッド（または None）を返す。
+    """
+    global _prewarm_thread
+    if backend_name() != "gemini" or os.environ.get("AI_CFO_PREWARM", "1") == "0":
+        return None
+    with _clients_lock:
+        if _prewarm_thread is None:
+            _prewarm_thread = threading.Thread(target=_import_sdk, name="llm-prewarm", daemon=True)
+            _prewarm_thread.start()
+    return _prewarm_thread
@@ -0,0 +1,280 @@
+"""
+計測（処理ごとの時間・カウンター）
+=======================================
+再実行 1 回ごとに「どの処理に何ミリ秒かかったか」を記録し、
+カウンター（再実行回数・AI 診断回数・キャッシュヒット・エラー種別）と合わせて書き出す。
+
+    AI_CFO_METRICS=1                  記録を有効にする（既定は無効）
+    AI_CFO_METRICS_FILE=metrics.prom  Prometheus テキスト形式のファイルに書き出す（1 秒に 1 回まで）
+    AI_CFO_METRICS_PORT=9464          http://localhost:9464/metrics で Prometheus 形式を返す
+    AI_CFO_METRICS_HOST=0.0.0.0       待ち受けるアドレス（既定は 127.0.0.1。外から集めるときだけ変える）
+
+FILE / PORT を指定した場合も記録は有効になる。再実行ごとの内訳は
+ロガー "ai_cfo.metrics" に 1 行の JSON で出す。
+
+処理の区切りは lap(name) で付ける。直前の区切りからの経過時間が name に加算されるので、
+既存のコードを with ブロックで囲み直す必要はない。無効のときの lap() は何もせずに戻る。
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("ai_cfo.metrics")
+
+ENABLED = (os.environ.get("AI_CFO_METRICS", "").lower() in ("1", "true", "on")
+           or bool(os.environ.get("AI_CFO_METRICS_FILE")) or bool(os.environ.get("AI_CFO_METRICS_PORT")))
+HISTORY = 20
+MAX_SESSIONS = 1_000
+FILE_INTERVAL = 1.0
+# 再実行時間のヒストグラムの区切り（秒）
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Streamlit の制御フロー用の例外（エラーとして数えない）
+_CONTROL_FLOW = {"RerunException", "StopException"}
+
+_local = threading.local()
+_lock = threading.Lock()
+_counters = {}
+_phase_totals = {}
+_durations = {}
+_history = OrderedDict()
+_gauge_sources = {}
+_file_written = 0.0
+
+
+# ─────────────────────────────────────
+# 再実行ごとの記録
+# ─────────────────────────────────────
+class RerunRecord:
+    __slots__ = ("kind", "session", "started", "last", "phases")
+
+    def __init__(self, kind, session):
+        self.kind = kind
+        self.session = session
+        self.started = self.last = time.perf_counter()
+        self.phases = {}
+
+    def lap(self, name):
+        now = time.perf_counter()
+        self.phases[name] = self.phases.get(name, 0.0) + (now - self.last)
+        self.last = now
+
+    def to_dict(self):
+        return {
+            "kind": self.kind, "session": self.session,
+            "total_ms": round((self.last - self.started) * 1000, 2),
+            "phases_ms": {k: round(v * 1000, 2) for k, v in self.phases.items()},
+        }
+
+
+def begin_rerun(kind, session, force=False):
+    """スクリプト先頭で呼ぶ。無効（かつ force でない）なら何もしない。"""
+    if not (ENABLED or force):
+        _local.record = _local.pending = None
+        return None
+    record = RerunRecord(kind, session)
+    _local.record = _local.pending = record
+    return record
+
+
+def end_rerun():
+    """スクリプト末尾で呼ぶ。内訳をログ・集計・セッション履歴に残す。"""
+    record = getattr(_local, "record", None)
+    _local.record = _local.pending = None
+    if record is None:
+        return None
+    data = record.to_dict()
+    total = record.last - record.started
+    with _lock:
+        _inc(("reruns_total", (("kind", record.kind),)))
+        for name, seconds in record.phases.items():
+            key = (record.kind, name)
+            s, n = _phase_totals.get(key, (0.0, 0))
+            _phase_totals[key] = (s + seconds, n + 1)
+        counts = _durations.setdefault(record.kind, [0] * (len(BUCKETS) + 1) + [0.0])
+        for i, bound in enumerate(BUCKETS):
+            if total <= bound:
+                counts[i] += 1
+        counts[len(BUCKETS)] += 1
+        counts[-1] += total
+        history = _history.pop(record.session, None) or deque(maxlen=HISTORY)
+        history.append(data)
+        _history[record.session] = history
+        while len(_history) > MAX_SESSIONS:
+            _history.popitem(last=False)
+    logger.info(json.dumps(data, ensure_ascii=False))
+    _maybe_write_file()
+    return data
+
+
+def lap(name):
+    """直前の区切りからの時間を name に加算する。"""
+    record = getattr(_local, "record", None)
+    if record is not None:
+        record.lap(name)
+
+
+def timed_fragment(context):
+    """フラグメント関数用のデコレーター。context() は (セッション ID, 強制記録するか) を返す。
+
+    ページ全体の実行中に呼ばれたときはその記録に続けて加算し、
+    フラグメントだけが再実行されたときは kind="fragment" の記録を新しく作って閉じる。
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            pending = getattr(_local, "pending", None)
+            _local.pending = None
+            owner = pending is None
+            if owner:
+                session, force = context()
+                begin_rerun("fragment", session, force)
+                _local.pending = None
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if type(e).__name__ not in _CONTROL_FLOW:
+                    count_error(e)
+                raise
+            finally:
+                if owner:
+                    end_rerun()
+        return wrapper
+    return decorator
+
+
+# ─────────────────────────────────────
+# カウンター
+# ─────────────────────────────────────
+def _inc(key, value=1):
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def count(name, value=1, **labels):
+    if not ENABLED and getattr(_local, "record", None) is None:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _inc(key, value)
+
+
+def count_error(exc):
+    count("errors_total", type=type(exc).__name__)
+
+
+def add_gauges(prefix, source):
+    """書き出し時に呼ばれ、{名前: 値} を返す関数を登録する（キャッシュの統計など）。
+
+    prefix ごとに 1 つだけ保持するので、再実行のたびに呼んでも増えない。
+    """
+    _gauge_sources[prefix] = source
+
+
+def history(session):
+    with _lock:
+        return list(_history.get(session, ()))
+
+
+# ─────────────────────────────────────
+# 書き出し（Prometheus テキスト形式）
+# ─────────────────────────────────────
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def render_prometheus():
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        phases = sorted(_phase_totals.items())
+        durations = {k: list(v) for k, v in _durations.items()}
+
+    seen = set()
+    for (name, labels), value in counters:
+        metric = f"ai_cfo_{name}"
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} counter")
+            seen.add(metric)
+        lines.append(f"{metric}{_labels(labels)} {value}")
+
+    if phases:
+        lines.append("# TYPE ai_cfo_phase_seconds summary")
+        for (kind, phase), (total, n) in phases:
+            labels = _labels((("kind", kind), ("phase", phase)))
+            lines.append(f"ai_cfo_phase_seconds_sum{labels} {total:.6f}")
+            lines.append(f"ai_cfo_phase_seconds_count{labels} {n}")
+
+    if durations:
+        lines.append("# TYPE ai_cfo_rerun_seconds histogram")
+        for kind, counts in sorted(durations.items()):
+            for bound, n in zip(BUCKETS, counts):
+                lines.append(f'ai_cfo_rerun_seconds_bucket{{kind="{kind}",le="{bound}"}} {n}')
+            lines.append(f'ai_cfo_rerun_seconds_bucket{{kind="{kind}",le="+Inf"}} {counts[len(BUCKETS)]}')
+            lines.append(f'ai_cfo_rerun_seconds_sum{{kind="{kind}"}} {counts[-1]:.6f}')
+            lines.append(f'ai_cfo_rerun_seconds_count{{kind="{kind}"}} {counts[len(BUCKETS)]}')
+
+    for prefix, source in sorted(_gauge_sources.items()):
+        for name, value in source().items():
+            lines.append(f"# TYPE ai_cfo_{prefix}_{name} gauge")
+            lines.append(f"ai_cfo_{prefix}_{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _maybe_write_file():
+    global _file_written
+    path = os.environ.get("AI_CFO_METRICS_FILE")
+    now = time.monotonic()
+    if not path or now - _file_written < FILE_INTERVAL:
+        return
+    _file_written = now
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(render_prometheus())
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("metrics file write failed: %s", e)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+def start_exporter():
+    """AI_CFO_METRICS_PORT が指定されていれば、/metrics を返す HTTP サーバーを 1 つだけ起動する。
+
+    セッションごとの内訳が見えるので、既定ではローカル（127.0.0.1）だけで待ち受ける。
+    """
+    global _server
+    port = os.environ.get("AI_CFO_METRICS_PORT")
+    if not port:
+        return None
+    host = os.environ.get("AI_CFO_METRICS_HOST", "127.0.0.1")
+    with _lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, int(port)), _Handler)
+            threading.Thread(target=_server.serve_forever, name="metrics-exporter", daemon=True).start()
+            logger.info("metrics exporter listening on %s:%s", host, port)
+    return _server
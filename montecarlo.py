@@ -0,0 +1,145 @@
+"""
+モンテカルロ資金ショート・リスク
+=======================================
+STEP 1 の数値と STEP 2 のシナリオを中心に、
+月次売上・変動費率・回収／支払サイト（m_rec / m_pay）を確率的に揺らし、
+大量の資金繰りパスを NumPy でまとめて計算する。
+
+パスは chunk_size 本ずつ生成し、sketch.CashStreamStats で集計してから捨てるので、
+パス数をいくら増やしてもピークメモリは (chunk_size, n_months + 1) の配列数枚分と
+月ごとの分位点スケッチに収まる。
+
+financing（engine.FINANCING_DEFAULTS のキー）を渡すと、各チャンクに借入金の返済と当座貸越を
+engine.finance で当てはめてから集計し、パスごとに必要な当座貸越枠の
+分布も求める（solver.min_credit_line と同じ定義）。
+events（cash_events の予定）を渡すと、賞与・税金などの累計を各チャンクに 1 回足してから
+借入・当座貸越を当てはめる（予定の件数によらず、足し算はチャンクあたり 1 回）。
+"""
+
+import numpy as np
+
+import cash_events
+import engine
+from sketch import CashStreamStats, QuantileSketch
+
+CHUNK_SIZE = 16_384
+BANDS = (5, 50, 95)
+
+
+# ─────────────────────────────────────
+# パス生成
+# ─────────────────────────────────────
+def simulate_chunks(revenue, cogs, fixed_cost, cash, receivables, payables,
+                    sales_change=0, cost_cut=0.0, invest=0, ramp_months=1,
+                    n_months=24, n_paths=100_000,
+                    rev_sigma=0.10, v_rate_sigma=0.05, rec_sigma=0.2, pay_sigma=0.2,
+                    chunk_size=CHUNK_SIZE, seed=None, revenue_base=None):
+    """現預金パスを (chunk, n_months + 1) の配列で順に返すジェネレーター。
+
+    - 月次売上: シナリオの売上推移 × 対数正規ノイズ（平均 1、月ごとに独立、rev_sigma）。
+      revenue_base（(1, n_months)、seasonal.baseline の戻り値など）を渡すと、売上推移は
+      engine.project と同じく基準売上 × 伸び率になる
+    - 変動費率: パスごとに sim_v_rate × (1 + v_rate_sigma × 標準正規)、0 未満は 0
+    - 回収／支払サイト: パスごとに m_rec / m_pay ＋ 標準偏差 rec_sigma / pay_sigma ヶ月、0 未満は 0
+    """
+    rng = np.random.default_rng(seed)
+
+    flows = engine.monthly_flows(revenue, cogs, receivables, payables,
+                                 sales_change, cost_cut, ramp_months, n_months=1)
+    rev_path = engine.scenario_revenue(revenue, sales_change, ramp_months, n_months, revenue_base)[0]
+    sim_v_rate = float(flows["sim_v_rate"][0])
+    m_rec = float(flows["m_rec"][0])
+    m_pay = float(flows["m_pay"][0])
+    sim_fxd = float(fixed_cost) + float(invest)
+
+    done = 0
+    while done < n_paths:
+        n = min(chunk_size, n_paths - done)
+
+        noise = rng.standard_normal((n, n_months))
+        noise *= rev_sigma
+        noise -= rev_sigma ** 2 / 2
+        month_rev = np.exp(noise, out=noise)
+        month_rev *= rev_path
+
+        v_rate = np.maximum(sim_v_rate * (1 + v_rate_sigma * rng.standard_normal((n, 1))), 0.0)
+        path_rec = np.maximum(m_rec + rec_sigma * rng.standard_normal((n, 1)), 0.0)
+        path_pay = np.maximum(m_pay + pay_sigma * rng.standard_normal((n, 1)), 0.0)
+
+        month_cgs = month_rev * v_rate
+        ar = month_rev * path_rec
+        ap = month_cgs * path_pay
+
+        out = np.empty((n, n_months + 1))
+        out[:, 0] = cash
+        flow = out[:, 1:]
+        np.subtract(month_rev, month_cgs, out=flow)
+        flow -= sim_fxd
+        flow -= ar
+        flow[:, 0] += receivables
+        flow[:, 1:] += ar[:, :-1]
+        flow += ap
+        flow[:, 0] -= payables
+        flow[:, 1:] -= ap[:, :-1]
+        np.cumsum(out, axis=1, out=out)
+
+        done += n
+        yield out
+
+
+# ─────────────────────────────────────
+# 集計
+# ─────────────────────────────────────
+def run(revenue, cogs, fixed_cost, cash, receivables, payables,
+        n_months=24, n_paths=100_000, chunk_size=CHUNK_SIZE, financing=None, events=None, start=None,
+        **kwargs):
+    """パスを生成しながら集計し、資金ショート・リスクの要約を返す。
+
+    戻り値（配列は長さ n_months + 1、添字 0 が現在）:
+        p_short           : その月に残高がマイナスのパスの割合
+        p_short_cum       : その月までに一度でもマイナスになったパスの割合
+        expected_shortfall: 期間中の最大不足額（最低残高のマイナス分）の期待値
+        shortfall_if_short: ショートしたパスに限った最大不足額の平均
+        bands             : {5: P5, 50: P50, 95: P95} の月別残高
+        mean              : 月別残高の平均
+        min               : 月別残高の最小値
+    financing を渡したときは、残高は返済・貸越を反映したものになり、次も返す:
+        credit_line       : {5: P5, 50: P50, 95: P95} の必要な当座貸越枠
+        interest_cost     : 同じ分位点の貸越利息（必要な枠を使ったとき）
+        p_needs_credit    : 当座貸越が必要になるパスの割合
+    start は events の期首の月（None なら来月）。revenue_base などの残りの引数は simulate_chunks に渡す。
+    分位点の精度は sketch.py を参照。
+    """
+    stats = CashStreamStats(n_months + 1)
+    shift = None
+    if events is not None and len(events):
+        shift = cash_events.cumulative(events, cash_events.default_start() if start is None else start, n_months)
+    need = None
+    if financing:
+        financing = {**engine.FINANCING_DEFAULTS, **financing}
+        need = QuantileSketch(2)
+        n_need = 0
+    for chunk in simulate_chunks(revenue, cogs, fixed_cost, cash, receivables, payables,
+                                 n_months=n_months, n_paths=n_paths,
+                                 chunk_size=chunk_size, **kwargs):
+        if shift is not None:
+            chunk += shift
+        if need is not None:
+            # 枠の制限なしで 1 回当てはめる（solver.min_credit_line と同じ）。枠が足りているパスは
+            # それがそのまま結果なので、枠を超えるパスだけ枠ありで当てはめ直す
+            fin = engine.finance(chunk, **dict(financing, credit_line=np.inf))
+            peak = fin["peak_overdraft"]
+            need.update(np.column_stack([peak, fin["overdraft_interest"]]))
+            n_need += int((peak > 0).sum())
+            over = peak > financing["credit_line"]
+            if over.any():
+                fin["cash"][over] = engine.finance(chunk[over], **financing)["cash"]
+            chunk = fin["cash"]
+        stats.update(chunk)
+    out = stats.result(BANDS)
+    if need is not None:
+        quantiles = {b: need.quantile(b / 100) for b in BANDS}
+        out["credit_line"] = {b: float(q[0]) for b, q in quantiles.items()}
+        out["interest_cost"] = {b: float(q[1]) for b, q in quantiles.items()}
+        out["p_needs_credit"] = n_need / max(stats.n, 1)
+    return out
@@ -0,0 +1,178 @@
+"""
+AI-CFO ルール診断（即時の一次診断）
+=======================================
+AI-CFO のプロンプトが Gemini に求めている判断のうち、数値だけで決まるものをルールで先に出す。
+
+- 資金が減る原因: 「赤字垂れ流し」か「売上増加による運転資金の増加（黒字倒産リスク）」か
+- 利益を圧迫している最大の要因: 投資（固定費増）か、変動費率（業界の目安より重い分）か
+- 現預金月商倍率（最低時）・安全余裕率・回収／支払サイトを業界の目安と比べた判定
+
+入力は diagnosis.INPUT_FIELDS をキーに持つ dict（画面・バッチ・プロンプトと同じ値）。
+各値はスカラーでも同じ長さの配列でもよく、バッチでは全行を 1 回の呼び出しで判定する。
+Gemini の回答を待たずに毎回の再実行で出せるよう、NumPy の四則演算だけで完結させている。
+"""
+
+import numpy as np
+
+from formatting import jp_format
+
+# ─────────────────────────────────────
+# 業界の目安
+# ─────────────────────────────────────
+# 中小企業の業種別の平均的な値（月数は売上・仕入の何ヶ月分か）。
+#   v_rate: 変動費率（原価率）、m_rec: 売掛金の回収サイト、m_pay: 買掛金の支払サイト、
+#   cash_months: 手元に置きたい現預金（月商の何ヶ月分か）
+BENCHMARKS = {
+    "製造業":         {"v_rate": 0.65, "m_rec": 2.0, "m_pay": 1.5, "cash_months": 2.0},
+    "建設業":         {"v_rate": 0.75, "m_rec": 2.5, "m_pay": 2.0, "cash_months": 2.0},
+    "IT・サービス業": {"v_rate": 0.35, "m_rec": 1.5, "m_pay": 1.0, "cash_months": 2.0},
+    "飲食業":         {"v_rate": 0.35, "m_rec": 0.2, "m_pay": 1.0, "cash_months": 1.0},
+    "小売業":         {"v_rate": 0.70, "m_rec": 0.5, "m_pay": 1.2, "cash_months": 1.0},
+    "卸売業":         {"v_rate": 0.85, "m_rec": 2.0, "m_pay": 1.8, "cash_months": 1.5},
+    "医療・福祉":     {"v_rate": 0.20, "m_rec": 2.0, "m_pay": 1.0, "cash_months": 2.0},
+    "その他":         {"v_rate": 0.50, "m_rec": 1.5, "m_pay": 1.2, "cash_months": 1.5},
+}
+DEFAULT_INDUSTRY = "その他"
+
+# サイトが目安の何倍を超えたら「長い」、何倍未満なら「短い」とするか
+CYCLE_TOLERANCE = 1.25
+# 安全余裕率（%）の判定の境目
+SAFETY_MARGIN_SAFE = 20.0
+SAFETY_MARGIN_CAUTION = 10.0
+
+# 判定の番号 → 表示名（番号は配列に入れるためのもの。並びを変えない）
+CASH_CAUSES = ("資金を減らす要因なし", "赤字垂れ流しによる資金枯渇", "売上増加による運転資金の増加（黒字倒産リスク）")
+DRIVERS = ("特になし", "投資（固定費増）", "変動費率（原価の重さ）", "もともとの固定費の重さ")
+LEVELS = ("安全", "注意", "危険")
+CYCLES = ("目安どおり", "目安より長い", "目安より短い")
+
+# labels() が返す列（バッチ・API の出力の列名）
+LABEL_FIELDS = ("cash_cause", "main_driver", "cash_level", "margin_level", "rec_cycle", "pay_cycle")
+
+
+def benchmark(industry):
+    """業種の目安（知らない業種は「その他」）。"""
+    return BENCHMARKS.get(industry, BENCHMARKS[DEFAULT_INDUSTRY])
+
+
+def _benchmark_columns(industry, n):
+    """業種（スカラーまたは並び）を目安の列ごとの配列 (n,) にする。"""
+    if isinstance(industry, str) or industry is None:
+        rows = [benchmark(industry)] * n
+    else:
+        rows = [benchmark(ind) for ind in industry]
+    return {key: np.array([row[key] for row in rows], dtype=float) for key in BENCHMARKS[DEFAULT_INDUSTRY]}
+
+
+def _cycle(actual, expected):
+    return np.where(actual > expected * CYCLE_TOLERANCE, 1,
+                    np.where(actual < expected / CYCLE_TOLERANCE, 2, 0))
+
+
+# ─────────────────────────────────────
+# 判定（ベクトル化）
+# ─────────────────────────────────────
+def diagnose(data):
+    """判定結果を番号の配列の dict で返す（1 件でも長さ 1 の配列）。
+
+    - "cash_cause": CASH_CAUSES の番号。予測期間の営業利益の合計と、売上の変化で増える運転資金
+      （売掛金の増加 − 買掛金の増加）を比べ、資金を減らしている側を原因とする。
+      黒字でも、運転資金の増加があって途中でショートする場合は運転資金の側とする。
+    - "driver": DRIVERS の番号。投資額（月額）と、変動費率が業界の目安を超える分の負担（月額）の大きい方。
+      どちらもないのに赤字なら「もともとの固定費の重さ」。
+    - "cash_level": LEVELS の番号。ショートする・月商倍率がマイナスなら危険、業界の目安未満なら注意。
+    - "margin_level": LEVELS の番号。安全余裕率 20% 以上で安全、10% 以上で注意。
+    - "rec_cycle" / "pay_cycle": CYCLES の番号。回収／支払サイトを業界の目安と比べたもの。
+    ほかに判定の根拠として "op_profit"（目標売上での月次営業利益）、"working_capital"（運転資金の増加額）、
+    "cost_pressure"（変動費率が目安を超える分の月額負担）を返す。
+    """
+    rev = np.atleast_1d(np.asarray(data["rev"], dtype=float))
+    n = len(rev)
+    target_rev, sim_v_rate, invest, bep_rev, months_sales_ratio, m_rec, m_pay, safety_margin_ratio = (
+        np.broadcast_to(np.asarray(data[f], dtype=float), (n,))
+        for f in ("target_rev", "sim_v_rate", "invest", "bep_rev", "months_sales_ratio",
+                  "m_rec", "m_pay", "safety_margin_ratio"))
+    # 画面は None / 月、バッチは -1 / 月（プロンプトと同じく 0ヶ月目は「ショートなし」扱い）
+    short_month = data["short_month"]
+    short = np.broadcast_to(np.asarray(np.nan if short_month is None else short_month, dtype=float) > 0, (n,))
+    short = short | (np.asarray(data["min_cash"], dtype=float) < 0)
+    horizon = np.broadcast_to(np.asarray(data["horizon"], dtype=float), (n,))
+    bench = _benchmark_columns(data["industry"], n)
+
+    # engine.finalize と同じ限界利益率で、損益分岐点から月次営業利益を戻す
+    mg_rate = np.maximum(1.0 - sim_v_rate, 0.001)
+    op_profit = (target_rev - bep_rev) * mg_rate
+    profit_total = op_profit * horizon
+    # 売上が rev → target_rev になったときの売掛金の増加 − 買掛金の増加（原価率は変更後の値で近似）
+    working_capital = (target_rev - rev) * (m_rec - sim_v_rate * m_pay)
+
+    loss = np.maximum(-profit_total, 0.0)
+    wc_drain = np.maximum(working_capital, 0.0)
+    # 黒字でも、運転資金が先に出ていくせいで途中でショートするなら運転資金が原因
+    # （利益は毎月少しずつ入るが、売掛金は売上が増えた月にまとめて膨らむ）
+    wc_first = (wc_drain > 0) & ((wc_drain > profit_total) | short)
+    cash_cause = np.where(loss > 0, np.where(loss >= wc_drain, 1, 2), np.where(wc_first, 2, 0))
+
+    cost_pressure = target_rev * np.maximum(sim_v_rate - bench["v_rate"], 0.0)
+    driver = np.where((invest > 0) & (invest >= cost_pressure), 1,
+                      np.where(cost_pressure > 0, 2, np.where(op_profit < 0, 3, 0)))
+
+    cash_level = np.where(short | (months_sales_ratio < 0), 2,
+                          np.where(months_sales_ratio < bench["cash_months"], 1, 0))
+    margin_level = np.where(safety_margin_ratio >= SAFETY_MARGIN_SAFE, 0,
+                            np.where(safety_margin_ratio >= SAFETY_MARGIN_CAUTION, 1, 2))
+
+    return {
+        "cash_cause": cash_cause, "driver": driver, "cash_level": cash_level, "margin_level": margin_level,
+        "rec_cycle": _cycle(m_rec, bench["m_rec"]), "pay_cycle": _cycle(m_pay, bench["m_pay"]),
+        "op_profit": op_profit, "working_capital": working_capital, "cost_pressure": cost_pressure,
+        "bench_cash_months": bench["cash_months"], "bench_m_rec": bench["m_rec"], "bench_m_pay": bench["m_pay"],
+        "bench_v_rate": bench["v_rate"],
+    }
+
+
+def labels(verdict):
+    """diagnose() の番号を表示名の列にする（バッチの出力用）。"""
+    return {
+        "cash_cause": [CASH_CAUSES[i] for i in verdict["cash_cause"]],
+        "main_driver": [DRIVERS[i] for i in verdict["driver"]],
+        "cash_level": [LEVELS[i] for i in verdict["cash_level"]],
+        "margin_level": [LEVELS[i] for i in verdict["margin_level"]],
+        "rec_cycle": [CYCLES[i] for i in verdict["rec_cycle"]],
+        "pay_cycle": [CYCLES[i] for i in verdict["pay_cycle"]],
+    }
+
+
+# ─────────────────────────────────────
+# 表示（画面用）
+# ─────────────────────────────────────
+def render(data, verdict, i=0):
+    """i 件目の判定を画面用の Markdown（箇条書き）にする。"""
+    ind = data["industry"] if isinstance(data["industry"], str) else data["industry"][i]
+    cause = verdict["cash_cause"][i]
+    driver = verdict["driver"][i]
+    lines = [f"- **資金が減る原因**: {CASH_CAUSES[cause]}"]
+    if cause == 1:
+        lines.append(f"  - 目標売上でも毎月 {jp_format(-verdict['op_profit'][i])} の赤字です。")
+    elif cause == 2:
+        lines.append(f"  - 利益は出ていますが、売掛金の増加などで {jp_format(verdict['working_capital'][i])} の資金が寝ます。")
+
+    if driver == 1:
+        lines.append(f"- **最大の要因**: {DRIVERS[driver]}（月 {jp_format(_at(data['invest'], i))}）")
+    elif driver == 2:
+        lines.append(f"- **最大の要因**: {DRIVERS[driver]}（変動費率 {_at(data['sim_v_rate'], i):.1%}、"
+                     f"{ind}の目安 {verdict['bench_v_rate'][i]:.0%} を超える分が月 {jp_format(verdict['cost_pressure'][i])}）")
+    else:
+        lines.append(f"- **最大の要因**: {DRIVERS[driver]}")
+
+    lines.append(f"- **現預金月商倍率（最低時）**: {_at(data['months_sales_ratio'], i):.1f}ヶ月 → "
+                 f"{LEVELS[verdict['cash_level'][i]]}（{ind}の目安 {verdict['bench_cash_months'][i]:.1f}ヶ月）")
+    lines.append(f"- **安全余裕率**: {_at(data['safety_margin_ratio'], i):.1f}% → {LEVELS[verdict['margin_level'][i]]}")
+    lines.append(f"- **回収サイト**: {_at(data['m_rec'], i):.1f}ヶ月 → {CYCLES[verdict['rec_cycle'][i]]}"
+                 f"（目安 {verdict['bench_m_rec'][i]:.1f}ヶ月）／ **支払サイト**: {_at(data['m_pay'], i):.1f}ヶ月 → "
+                 f"{CYCLES[verdict['pay_cycle'][i]]}（目安 {verdict['bench_m_pay'][i]:.1f}ヶ月）")
+    return "\n".join(lines)
+
+
+def _at(value, i):
+    return float(np.atleast_1d(value)[i]) if np.ndim(value) else float(value)
@@ -0,0 +1,160 @@
+"""
+シナリオ保存と比較
+=======================================
+STEP 2 のレバー（売上変化・原価率変動・固定費増減・目標達成期間）に名前を付けて
+サーバー側に保存し、何本でも重ねて比べられるようにする。
+
+- 保存先はローカルの SQLite（WAL モード）。持ち主（URL の ?ws=）ごとに分けて保存する。
+  STEP 1 の数値は保存せず、比べるときの STEP 1 の数値の上にレバーだけを当てはめる。
+- 計算結果は「STEP 1 の数値 + レバー + 予測期間」の組ごとにメモしておく（プロセス内で共有）。
+  比べるときはメモにない組だけを集めて engine.project を 1 回呼ぶので、
+  1 本追加・編集しても再計算されるのはその 1 本だけになる。
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+import engine
+from grid_cache import BASE_FIELDS
+
+DEFAULT_PATH = os.environ.get(
+    "AI_CFO_SCENARIO_DB",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "scenarios.sqlite3"),
+)
+
+LEVER_FIELDS = ("sales_change", "cost_cut", "invest", "ramp_months")
+# 比較表に出す KPI（engine.project の戻り値のうちスカラーのもの）
+KPI_FIELDS = ("min_cash", "short_month", "target_op_profit", "safety_margin_ratio", "bep_rev", "target_rev")
+MAX_NAME_LENGTH = 40
+MAX_SCENARIOS = 200
+
+
+# ─────────────────────────────────────
+# 保存（SQLite）
+# ─────────────────────────────────────
+class ScenarioStore:
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS scenarios ("
+                " owner TEXT NOT NULL, name TEXT NOT NULL,"
+                " sales_change REAL NOT NULL, cost_cut REAL NOT NULL,"
+                " invest REAL NOT NULL, ramp_months REAL NOT NULL,"
+                " created REAL NOT NULL, updated REAL NOT NULL,"
+                " PRIMARY KEY (owner, name))")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def list(self, owner):
+        """保存した順に [{"name", "sales_change", "cost_cut", "invest", "ramp_months"}, ...] を返す。"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT name, sales_change, cost_cut, invest, ramp_months FROM scenarios"
+                " WHERE owner = ? ORDER BY created", (owner,)).fetchall()
+        return [dict(zip(("name",) + LEVER_FIELDS, row)) for row in rows]
+
+    def save(self, owner, name, levers):
+        """同じ名前があれば上書きする。件数が上限に達していれば ValueError。"""
+        name = name.strip()[:MAX_NAME_LENGTH]
+        if not name:
+            raise ValueError("シナリオ名を入力してください。")
+        now = time.time()
+        values = tuple(float(levers[f]) for f in LEVER_FIELDS)
+        with self._connect() as conn:
+            count = conn.execute(
+                "SELECT COUNT(*) FROM scenarios WHERE owner = ? AND name != ?", (owner, name)).fetchone()[0]
+            if count >= MAX_SCENARIOS:
+                raise ValueError(f"保存できるシナリオは {MAX_SCENARIOS} 件までです。")
+            conn.execute(
+                "INSERT INTO scenarios (owner, name, sales_change, cost_cut, invest, ramp_months, created, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (owner, name) DO UPDATE SET"
+                " sales_change = excluded.sales_change, cost_cut = excluded.cost_cut,"
+                " invest = excluded.invest, ramp_months = excluded.ramp_months, updated = excluded.updated",
+                (owner, name) + values + (now, now))
+        return name
+
+    def delete(self, owner, name):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM scenarios WHERE owner = ? AND name = ?", (owner, name))
+
+
+# ─────────────────────────────────────
+# 計算結果のメモ（全セッション共有）
+# ─────────────────────────────────────
+class ResultMemo:
+    """(STEP 1 の数値, レバー, 予測期間) → 資金推移と KPI の LRU（スレッドセーフ）。"""
+
+    def __init__(self, max_entries=20_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_of(base, levers, n_months, revenue_base=None):
+        key = (tuple(int(base[f]) for f in BASE_FIELDS)
+               + tuple(float(levers[f]) for f in LEVER_FIELDS) + (int(n_months),))
+        if revenue_base is not None:
+            key += (tuple(np.rint(revenue_base).astype(np.int64).reshape(-1).tolist()),)
+        return key
+
+    def compare(self, base, scenarios, n_months=engine.N_MONTHS, revenue_base=None):
+        """scenarios（レバーの dict の並び）をまとめて評価する。
+
+        戻り値は {"cash": (本数, n_months + 1), KPI 名: (本数,)}。
+        メモにないものだけを 1 回の engine.project で計算する。
+        revenue_base（季節性のある基準売上）を渡すと、それもキーに含めて全本数に当てはめる。
+        """
+        keys = [self.key_of(base, s, n_months, revenue_base) for s in scenarios]
+        with self._lock:
+            found = {k: self._entries[k] for k in keys if k in self._entries}
+            for k in found:
+                self._entries.move_to_end(k)
+        missing = list(dict.fromkeys(k for k in keys if k not in found))
+        if missing:
+            n_base = len(BASE_FIELDS)
+            levers = np.array([k[n_base:n_base + len(LEVER_FIELDS)] for k in missing])
+            result = engine.project(
+                *(base[f] for f in BASE_FIELDS),
+                sales_change=levers[:, 0], cost_cut=levers[:, 1],
+                invest=levers[:, 2], ramp_months=levers[:, 3], n_months=n_months,
+                revenue_base=revenue_base,
+            )
+            for i, k in enumerate(missing):
+                found[k] = (result["cash"][i], {f: result[f][i] for f in KPI_FIELDS})
+            with self._lock:
+                for k in missing:
+                    self._entries[k] = found[k]
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        n_points = n_months + 1
+        out = {"cash": np.stack([found[k][0] for k in keys]) if keys else np.empty((0, n_points))}
+        for f in KPI_FIELDS:
+            out[f] = np.array([found[k][1][f] for k in keys])
+        return out
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
@@ -0,0 +1,137 @@
+"""
+季節性のある売上の基準線
+=======================================
+過去 12〜60ヶ月の月次売上から「水準 + 傾き + 月ごとの季節効果」を最小二乗で当てはめ、
+予測期間の基準売上（季節の波を含む）を作る。engine.project に revenue_base として渡すと、
+STEP 2 のレバー（売上変化・目標達成期間）はこの基準線に掛け算で効く。
+
+    売上[t] = 水準 + 傾き × t + 季節効果[t の月]      （季節効果は 12ヶ月の合計が 0）
+
+- 実績は古い順に並べ、最後の列を「先月（直近の確定月）」とする。予測 1ヶ月目はその翌月。
+- 複数社は (社数, 月数) の配列で渡す。長さの違う実績は stack_histories で右詰め（前を nan）にする。
+  社ごとに正規方程式を組み、欠測の並びが同じ社（実績の長さが同じ社など）は 1 回の逆行列でまとめて解く。
+- 24ヶ月未満の実績は季節効果と傾きを区別できないので、傾きは 0 とする。
+  12ヶ月未満の実績は季節効果も 0（= 平均の横ばい）とする。
+"""
+
+import re
+
+import numpy as np
+
+PERIOD = 12
+MIN_MONTHS = 12
+MAX_MONTHS = 60
+MIN_TREND_MONTHS = 24
+
+
+def parse_history(text):
+    """貼り付けた月次売上（1 行に 1ヶ月、またはタブ・空白区切り、古い順）を配列にする。
+
+    「1,234,567」のような桁区切りも読む。数値でないもの・件数が 12〜60 でないときは ValueError。
+    """
+    values = []
+    for token in re.split(r"[\s、]+", text.strip()):
+        if not token:
+            continue
+        try:
+            values.append(float(token.replace(",", "").replace("円", "")))
+        except ValueError:
+            raise ValueError(f"数値として読めません: {token}") from None
+    if not MIN_MONTHS <= len(values) <= MAX_MONTHS:
+        raise ValueError(f"月次実績は {MIN_MONTHS}〜{MAX_MONTHS}ヶ月分を入力してください（今は {len(values)}ヶ月分）。")
+    return np.array(values)
+
+
+def stack_histories(histories, length=None):
+    """長さの違う実績の並びを、右詰め（最後の列 = 直近の月）の (社数, length) 配列にする。"""
+    length = length or max((len(h) for h in histories), default=0)
+    out = np.full((len(histories), length), np.nan)
+    for i, h in enumerate(histories):
+        h = np.asarray(h, dtype=float)[-length:]
+        if len(h):
+            out[i, length - len(h):] = h
+    return out
+
+
+def _design(length):
+    """列 = [水準, 傾き, 季節効果 × (PERIOD − 1)]。季節効果は最後の月を −(他の合計) とする効果コード。"""
+    pos = np.arange(length)
+    season = pos % PERIOD
+    X = np.zeros((length, 2 + PERIOD - 1))
+    X[:, 0] = 1.0
+    X[:, 1] = pos - (length - 1)          # 直近の月で 0
+    last = season == PERIOD - 1
+    X[~last, 2 + season[~last]] = 1.0
+    X[last, 2:] = -1.0
+    return X
+
+
+def fit(history):
+    """実績 (社数, 月数)（1 社なら (月数,) でもよい。nan は欠測）に基準線を当てはめる。
+
+    戻り値は {"level", "trend", "season" (社数, PERIOD), "n_obs", "length"}。
+    level は直近の月の水準、season の列は実績の列番号 mod PERIOD の並び。
+    """
+    y = np.atleast_2d(np.asarray(history, dtype=float))
+    n, length = y.shape
+    observed = ~np.isnan(y)
+    X = _design(length)
+    p = X.shape[1]
+    xty = np.where(observed, y, 0.0) @ X
+
+    # XᵀWX は「どの月が欠測か」だけで決まるので、欠測の並びが同じ社はまとめて 1 回だけ解く
+    # （ポートフォリオでは実績の長さが数通りしかないことが多い）
+    packed = np.packbits(observed, axis=1)
+    if packed.shape[1] <= 8:
+        # 64 ヶ月以内なら欠測の並びを 1 つの整数にして並べ替える（行単位の unique より速い）
+        keys = np.pad(packed, ((0, 0), (0, 8 - packed.shape[1]))).view(np.uint64).reshape(-1)
+        _, first, group = np.unique(keys, return_index=True, return_inverse=True)
+        patterns = packed[first]
+    else:
+        patterns, group = np.unique(packed, axis=0, return_inverse=True)
+    group = group.reshape(-1)
+    w = np.unpackbits(patterns, axis=1, count=length).astype(float)
+    xtx = (w @ (X[:, :, None] * X[:, None, :]).reshape(length, p * p)).reshape(len(w), p, p)
+    n_obs = w.sum(axis=1)
+
+    # 区別できない係数は 0 に固定する（その行・列を単位行列にする）
+    fixed = np.zeros((len(w), p), dtype=bool)
+    fixed[:, 1] = n_obs < MIN_TREND_MONTHS
+    fixed[:, 2:] = (n_obs < MIN_MONTHS)[:, None]
+    fixed[:, 0] = n_obs == 0
+    xtx[fixed[:, :, None] | fixed[:, None, :]] = 0.0
+    xtx[:, np.arange(p), np.arange(p)] += fixed
+    # 欠測で 1 度も出てこない月があっても解けるよう、ごく小さいリッジを足す
+    xtx += np.eye(p) * 1e-9 * np.maximum(n_obs, 1)[:, None, None]
+    xty[fixed[group]] = 0.0
+    if len(w) <= 64:
+        inverse = np.linalg.inv(xtx)
+        coef = np.empty((n, p))
+        for g in range(len(w)):
+            rows = np.flatnonzero(group == g)
+            coef[rows] = xty[rows] @ inverse[g].T
+    else:
+        coef = np.linalg.solve(xtx[group], xty[..., None])[..., 0]
+    n_obs = n_obs[group]
+
+    season = np.concatenate([coef[:, 2:], -coef[:, 2:].sum(axis=1, keepdims=True)], axis=1)
+    return {"level": coef[:, 0], "trend": coef[:, 1], "season": season, "n_obs": n_obs, "length": length}
+
+
+def baseline(model, n_months):
+    """予測 1〜n_months ヶ月目の基準売上 (社数, n_months)。マイナスにはしない。"""
+    h = np.arange(1, n_months + 1)
+    phase = (model["length"] - 1 + h) % PERIOD
+    path = (model["level"][:, None] + model["trend"][:, None] * h[None, :]
+            + model["season"][:, phase])
+    return np.maximum(path, 0.0)
+
+
+def seasonal_index(model):
+    """予測 1〜PERIOD ヶ月目の季節指数（平均水準 = 1）(社数, PERIOD)。水準が 0 以下の社は 1。"""
+    h = np.arange(1, PERIOD + 1)
+    season = model["season"][:, (model["length"] - 1 + h) % PERIOD]
+    level = model["level"][:, None]
+    out = np.ones_like(season)
+    np.divide(level + season, level, out=out, where=level > 0)
+    return out
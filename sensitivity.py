@@ -0,0 +1,123 @@
+"""
+感度分析（トルネード）
+=======================================
+STEP 1 の数値（売上・原価・固定費・売掛金・買掛金）と STEP 2 の 4 つのレバーを
+1 つずつ ±X% 動かし、月次営業利益・最低預金残高・損益分岐点売上高がどれだけ動くかを求める。
+
+基準 1 行と、各入力の「下げ」「上げ」の 2 行ずつを縦に積み、engine.project を 1 回だけ呼ぶ。
+
+レバーは今の値が 0 のことが多いので、「X% 動かす」を次のように読み替える。
+    売上変化・原価率変動 : ±X ポイント（どちらも元から % の値）
+    固定費の増減         : 今の固定費の ±X%（円）
+    目標達成期間         : スライダー幅（6ヶ月）の ±X%（1ヶ月未満にはならない）
+
+弾力性は「出力の変化率（%）÷ 入力を動かした幅（%）」を上げ・下げの中心差分で求めたもの。
+基準の出力が 0 のときは nan。
+
+季節性のある基準売上（revenue_base）を渡すと、月間売上高を動かす行ではその基準売上も同じ割合で動かす。
+賞与・税金などの予定（events）・設備投資（capex_months）・借入金と当座貸越（financing）を渡すと、
+画面の最低預金残高と同じ順（予定 → 借入・貸越）で全行の残高に当てはめる（solver.solve と同じ）。
+"""
+
+import numpy as np
+
+import cash_events
+import engine
+
+BASE_INPUTS = ("revenue", "cogs", "fixed_cost", "receivables", "payables")
+LEVER_INPUTS = ("sales_change", "cost_cut", "invest", "ramp_months")
+INPUTS = BASE_INPUTS + LEVER_INPUTS
+OUTPUTS = ("target_op_profit", "min_cash", "bep_rev")
+
+INPUT_LABELS = {
+    "revenue": "月間売上高", "cogs": "月間売上原価", "fixed_cost": "月間固定費",
+    "receivables": "売掛金", "payables": "買掛金",
+    "sales_change": "売上目標の変化", "cost_cut": "仕入・外注単価", "invest": "固定費の増減",
+    "ramp_months": "目標達成期間",
+}
+OUTPUT_LABELS = {"target_op_profit": "月次営業利益（目標時）", "min_cash": "最低預金残高", "bep_rev": "損益分岐点売上高"}
+
+RAMP_SPAN = 6.0
+
+
+def _deltas(values, pct):
+    """各入力を動かす幅（絶対値）。"""
+    step = pct / 100
+    return {
+        **{f: abs(values[f]) * step for f in BASE_INPUTS},
+        "sales_change": pct,
+        "cost_cut": pct,
+        "invest": abs(values["fixed_cost"]) * step,
+        "ramp_months": RAMP_SPAN * step,
+    }
+
+
+def analyze(revenue, cogs, fixed_cost, cash, receivables, payables,
+            sales_change=0, cost_cut=0.0, invest=0, ramp_months=1,
+            pct=10.0, n_months=engine.N_MONTHS, revenue_base=None,
+            events=None, start=None, capex_months=0, capex_month=1, financing=None):
+    """全入力の ±pct% の結果を 1 回の engine.project で求める。
+
+    revenue_base は engine.project と同じ（1 社分の (n_months,) または (1, n_months)）。
+    events・start・capex_months・capex_month・financing は solver.solve と同じ
+    （設備投資は行ごとの固定費の増加に比例するので、固定費の増減を動かした行では設備投資も変わる）。
+
+    戻り値は {出力名: {"base", "low", "high", "elasticity"}}。
+    low / high / elasticity は INPUTS の順の (入力数,) の配列で、
+    low は入力を下げたとき、high は上げたときの出力。
+    """
+    values = {
+        "revenue": revenue, "cogs": cogs, "fixed_cost": fixed_cost, "cash": cash,
+        "receivables": receivables, "payables": payables,
+        "sales_change": sales_change, "cost_cut": cost_cut, "invest": invest, "ramp_months": ramp_months,
+    }
+    deltas = _deltas(values, pct)
+    n = len(INPUTS)
+
+    # 行 0 が基準、行 1..n が各入力を下げたもの、行 n+1..2n が上げたもの
+    columns = {k: np.full(2 * n + 1, float(v)) for k, v in values.items()}
+    idx = np.arange(n)
+    for i, name in enumerate(INPUTS):
+        columns[name][1 + i] -= deltas[name]
+        columns[name][1 + n + i] += deltas[name]
+    # 目標達成期間は 1ヶ月未満、金額は負にならないようにする
+    columns["ramp_months"] = np.maximum(columns["ramp_months"], 1.0)
+    for name in BASE_INPUTS:
+        columns[name] = np.maximum(columns[name], 0.0)
+
+    if revenue_base is not None:
+        # 月間売上高の上げ・下げは基準売上の全月に同じ割合で効かせる
+        ratio = columns["revenue"] / revenue if revenue > 0 else np.ones(2 * n + 1)
+        revenue_base = np.asarray(revenue_base, dtype=float).reshape(1, n_months) * ratio[:, None]
+    result = engine.project(**columns, n_months=n_months, revenue_base=revenue_base)
+    if start is None:
+        start = cash_events.default_start()
+    if events is not None and len(events):
+        result = cash_events.apply(result, events, start)
+    if capex_months:
+        # 設備投資の一括払い: capex_month ヶ月目以降の残高を invest × capex_months だけ減らす
+        capex = cash_events.cumulative(cash_events.capex(capex_months, start, capex_month), start, n_months)
+        result = engine.with_cash(result, result["cash"] + np.maximum(columns["invest"], 0.0)[:, None] * capex)
+    if financing:
+        result = engine.apply_financing(result, **{**engine.FINANCING_DEFAULTS, **financing})
+
+    # 実際に動かせた幅（下限で止まった分を除く）
+    moved = np.array([columns[name][1 + n + i] - columns[name][1 + i] for i, name in enumerate(INPUTS)])
+    scale = np.array([deltas[name] for name in INPUTS])
+    out = {}
+    for key in OUTPUTS:
+        y = np.asarray(result[key], dtype=float)
+        base = y[0]
+        low, high = y[1 + idx], y[1 + n + idx]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # 上げ・下げの幅（通常は 2 × pct%、下限で止まったときはその分だけ）で出力の変化率を割る
+            change = (high - low) / abs(base) * 100 if base != 0 else np.full(n, np.nan)
+            elasticity = np.where(moved > 0, change / (pct * moved / scale), np.nan)
+        out[key] = {"base": base, "low": low, "high": high, "elasticity": elasticity}
+    return out
+
+
+def ranking(entry):
+    """出力の振れ幅が大きい順の入力の並び（INPUTS の添字）。"""
+    swing = np.abs(entry["high"] - entry["low"])
+    return np.argsort(-swing, kind="stable")
@@ -0,0 +1,157 @@
+"""
+目標逆算（ゴールシーク）
+=======================================
+「最低預金残高が 0 を下回らない範囲で、いくらまで投資できるか」などを
+スライダーを動かさずに直接求める。
+
+各月の現預金残高は、固定費の増減（invest）・売上変化（sales_change）・
+原価率変動（cost_cut）のどれについても、他のレバーを固定すれば一次式
+    cash_t(x) = a_t + b_t × x
+になる。そこで基準値と基準値＋Δの 2 点を engine.project でまとめて計算し、
+全月の「cash_t(x) >= 下限」を満たす x の区間を閉じた式で求める。
+企業・シナリオが何千件あっても engine 呼び出しは 1 回で済む。
+
+min_credit_line は、資金ショートを避けるのに必要な当座貸越枠の下限と、その利息を求める。
+レバーグリッドやモンテカルロのパスなど、何本の資金推移でも 1 回の engine.finance で評価する。
+"""
+
+import numpy as np
+
+import cash_events
+import engine
+
+# 傾きを求めるときの刻み幅（レバーごと）
+_STEPS = {"sales_change": 10.0, "cost_cut": 10.0}
+# 売上変化・原価率変動（%）の下限。これ未満だと売上・変動費率がマイナスになる
+LEVER_MIN = -100.0
+
+
+def _feasible_interval(a, b, floor):
+    """全列で a + b × d >= floor を満たす d の区間 [lower, upper] を行ごとに返す。
+
+    満たす d がない行は lower = upper = nan。
+    """
+    a = a - floor
+    # 差分で求めた傾きの丸め誤差を 0 とみなす
+    b = np.where(np.abs(b) <= 1e-9 * (np.abs(a) + 1.0), 0.0, b)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        root = -a / b
+    lower = np.where(b > 0, root, -np.inf).max(axis=1)
+    upper = np.where(b < 0, root, np.inf).min(axis=1)
+    infeasible = ((b == 0) & (a < 0)).any(axis=1) | (lower > upper)
+    lower = np.where(infeasible, np.nan, lower)
+    upper = np.where(infeasible, np.nan, upper)
+    return lower, upper
+
+
+def solve(revenue, cogs, fixed_cost, cash, receivables, payables,
+          sales_change=0, cost_cut=0.0, invest=0, ramp_months=1,
+          n_months=engine.N_MONTHS, cash_floor=0.0, financing=None, events=None, start=None,
+          capex_months=0, capex_month=1, revenue_base=None):
+    """他のレバーを今の値に固定したまま、各レバーの限界値を求める。
+
+    financing（engine.FINANCING_DEFAULTS のキー）を渡すと、借入金の返済を残高から引き、
+    当座貸越の枠の分だけ下限を下げて判定する（貸越の利息はレバーに対して一次式にならないので含めない）。
+    events（cash_events の予定、start は期首の月）を渡すと、その累計を各月の残高に足して判定する
+    （予定はレバーによらず一定なので、一次式のまま求まる）。
+    capex_months を渡すと、固定費の増加（invest が正のとき）の capex_months ヶ月分を capex_month ヶ月目に
+    一括で払う設備投資も含める（app.py の設備投資と同じ。投資額に比例するので max_invest の傾きに足す）。
+    revenue_base（(1 または シナリオ数, n_months)、seasonal.baseline の戻り値など）は engine.project に
+    そのまま渡す（売上変化は基準売上への掛け算なので、残高は各レバーに対して一次式のまま）。
+
+    戻り値は配列の dict（各シナリオ 1 要素）:
+        max_invest       : 最低預金残高 >= cash_floor を保てる固定費増（invest）の上限
+        min_sales_change : 資金ショートを避けられる売上変化（%）の下限
+        max_sales_change : 同・上限（売上急増による運転資金不足で上限が出ることがある）
+        max_cost_cut     : 耐えられる原価率変動（%、＋が悪化）の上限
+    上限・下限がない場合は ±inf、どの値でも条件を満たせない場合は nan。売上変化・原価率変動は
+    LEVER_MIN（−100%）未満にはできないので、下限はそこで止め、上限がそれを下回るときは nan にする。
+    """
+    args = [a.reshape(-1) for a in np.broadcast_arrays(*[
+        np.asarray(v, dtype=float) for v in (
+            revenue, cogs, fixed_cost, cash, receivables, payables,
+            sales_change, cost_cut, invest, ramp_months)])]
+    n = len(args[0])
+    (revenue, cogs, fixed_cost, cash, receivables, payables,
+     sales_change, cost_cut, invest, ramp_months) = [np.tile(a, 3) for a in args]
+
+    # [基準, 売上変化+Δ, 原価率変動+Δ] を縦に積んで 1 回で計算する
+    sales_change[n:2 * n] += _STEPS["sales_change"]
+    cost_cut[2 * n:] += _STEPS["cost_cut"]
+    if revenue_base is not None:
+        revenue_base = np.asarray(revenue_base, dtype=float).reshape(-1, n_months)
+        if len(revenue_base) > 1:
+            revenue_base = np.tile(revenue_base, (3, 1))
+    cash_matrix = engine.project(
+        revenue, cogs, fixed_cost, cash, receivables, payables,
+        sales_change, cost_cut, invest, ramp_months, n_months=n_months, revenue_base=revenue_base)["cash"]
+
+    if events is not None and len(events):
+        cash_matrix = cash_events.shift(cash_matrix, events, cash_events.default_start() if start is None else start)
+    if financing:
+        financing = {**engine.FINANCING_DEFAULTS, **financing}
+        payments, _, _ = engine.loan_schedule(
+            financing["loan_balance"], financing["loan_principal"], financing["loan_rate"], n_months)
+        cash_matrix = cash_matrix.copy()
+        cash_matrix[:, 1:] -= np.cumsum(payments, axis=1)
+        cash_floor = cash_floor - financing["credit_line"]
+
+    months = np.arange(n_months + 1, dtype=float)
+    # 設備投資の一括払い: capex_month ヶ月目以降の残高を invest × capex_months だけ減らす
+    capex_step = capex_months * (months >= capex_month)
+    no_capex = cash_matrix[:n]
+    if capex_months:
+        cash_matrix = cash_matrix - np.tile(np.maximum(args[8], 0.0), 3)[:, None] * capex_step
+    base = cash_matrix[:n]
+    out = {}
+
+    # 固定費の増減は t ヶ月目の残高を t × invest だけ減らす（傾きは厳密に −t）。
+    # 設備投資は invest が正のときだけ掛かるので、invest >= 0 の側は傾き −t − capex_step で解き、
+    # その上限が 0 未満（invest = 0 でも足りない）なら設備投資なしの側（傾き −t）で解き直す
+    slope = -np.broadcast_to(months, base.shape)
+    _, upper = _feasible_interval(no_capex, slope, cash_floor)
+    out["max_invest"] = args[8] + upper
+    if capex_months:
+        # invest = x（>= 0）のときの残高 = 設備投資なしの残高 − t × (x − 今の invest) − capex_step × x
+        _, upper = _feasible_interval(no_capex + months * args[8][:, None], slope - capex_step, cash_floor)
+        out["max_invest"] = np.where(upper >= 0, upper, out["max_invest"])
+
+    slope = (cash_matrix[n:2 * n] - base) / _STEPS["sales_change"]
+    lower, upper = _feasible_interval(base, slope, cash_floor)
+    out["min_sales_change"], out["max_sales_change"] = _clip_to_domain(args[6] + lower, args[6] + upper)
+
+    slope = (cash_matrix[2 * n:] - base) / _STEPS["cost_cut"]
+    _, upper = _feasible_interval(base, slope, cash_floor)
+    _, out["max_cost_cut"] = _clip_to_domain(np.full(n, -np.inf), args[7] + upper)
+    return out
+
+
+def _clip_to_domain(lower, upper, low=LEVER_MIN):
+    """区間 [lower, upper] をレバーの取りうる範囲（low 以上）に収める。範囲に入らない行は nan。"""
+    empty = upper < low
+    return (np.where(empty, np.nan, np.maximum(lower, low)),
+            np.where(empty, np.nan, upper))
+
+
+def min_credit_line(cash, loan_balance=0.0, loan_principal=0.0, loan_rate=0.0,
+                    overdraft_rate=0.0, cash_floor=0.0):
+    """資金推移 (本数, n_months + 1) ごとに、残高を cash_floor 以上に保つのに必要な当座貸越枠を求める。
+
+    cash は当座貸越を含めない残高（engine.project・レバーグリッド・モンテカルロのパス。
+    予定された資金イベントは cash_events.apply / shift で先に足しておく）。
+    枠の制限なしで engine.finance を当てはめたときの貸越残高の最大値が、必要な枠の下限になる
+    （枠がそれ以上なら貸越の動きは変わらないので、利息も同じになる）。
+
+    戻り値は配列の dict（各本 1 要素）:
+        credit_line   : 必要な当座貸越枠（不要なら 0）
+        interest_cost : その枠を使ったときの期間中の貸越利息
+        peak_month    : 貸越残高が最大になる月（不要なら -1）
+    """
+    fin = engine.finance(cash, loan_balance, loan_principal, loan_rate,
+                         credit_line=np.inf, overdraft_rate=overdraft_rate, cash_floor=cash_floor)
+    need = fin["peak_overdraft"]
+    return {
+        "credit_line": need,
+        "interest_cost": fin["overdraft_interest"],
+        "peak_month": np.where(need > 0, fin["overdraft"].argmax(axis=1), -1),
+    }
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# テストはリポジトリ直下のモジュールを import する（pytest をどこから起動しても同じ）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,134 @@
+"""/v1/simulate の応答と batch.evaluate_chunk の結果との一致（実際に HTTP で呼ぶ）。"""
+
+import asyncio
+import json
+import threading
+import time
+
+import numpy as np
+
+import api
+import batch
+import metrics
+import rules
+
+COMPANIES = [
+    {"id": "A", "industry": "製造業", "revenue": 5_000_000, "cogs": 3_000_000, "fixed_cost": 1_500_000,
+     "cash": 2_000_000, "receivables": 5_000_000, "payables": 3_000_000},
+    {"id": "B", "industry": "小売業", "revenue": "12000000", "cogs": 9_000_000, "fixed_cost": 2_800_000,
+     "cash": 30_000_000, "receivables": 4_000_000, "payables": 6_000_000,
+     "revenue_history": [10_000_000 + 2_000_000 * np.sin(m / 2) for m in range(24)]},
+    {"id": "C", "revenue": "不明", "cogs": 1, "fixed_cost": 1, "cash": 1, "receivables": 0, "payables": 0},
+]
+SCENARIOS = [{"name": "現状"}, {"name": "攻め", "sales_change": 20, "invest": 500_000, "ramp_months": 3},
+             {"name": "守り", "sales_change": -15, "cost_cut": -5}]
+
+
+async def _post(path, body):
+    srv = await asyncio.start_server(api.ApiServer().handle, "127.0.0.1", 0, limit=api.MAX_HEADER_BYTES)
+    host, port = srv.sockets[0].getsockname()[:2]
+    async with srv:
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(f"POST {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode("ascii") + body)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+    head, _, payload = response.partition(b"\r\n\r\n")
+    return head.decode("latin-1"), json.loads(payload)
+
+
+def _payload_json(payload):
+    return json.dumps(payload, ensure_ascii=False, default=float).encode("utf-8")
+
+
+def test_simulate_matches_evaluate_chunk():
+    payload = {"companies": COMPANIES, "scenarios": SCENARIOS, "n_months": 18}
+    head, body = asyncio.run(_post("/v1/simulate", _payload_json(payload)))
+    assert head.startswith("HTTP/1.1 200")
+    assert body["n_months"] == 18
+    results = body["results"]
+
+    rows = api.expand_rows(json.loads(_payload_json(payload)))
+    cols = batch.evaluate_chunk(rows, 0, 18, with_cash=True)
+    assert len(results) == len(rows) == 9
+    for i, (row, result) in enumerate(zip(rows, results)):
+        assert (result["id"], result["scenario"]) == (row["id"], row["scenario"])
+        if cols["error"][i]:
+            assert result["error"] == cols["error"][i]
+            continue
+        for f in api.YEN_FIELDS:
+            assert result[f] == int(np.rint(cols[f][i])), f
+        for f in (f for f in api.RATIO_FIELDS if f in cols):
+            assert result[f] == round(float(cols[f][i]), 4), f
+        assert result["cf_line"] == np.rint(cols["cash"][i]).astype(np.int64).tolist()
+        assert result["short_month"] == (cols["short_month"][i] if cols["short_month"][i] >= 0 else None)
+        for f in rules.LABEL_FIELDS:
+            assert result[f] == cols[f][i], f
+    # 会社 C は売上が読めないのでエラー行
+    assert all("error" in r for r in results[6:])
+    assert not any("error" in r for r in results[:6])
+
+
+def test_simulate_rejects_bad_requests():
+    head, body = asyncio.run(_post("/v1/simulate", b'{"scenarios": []}'))
+    assert head.startswith("HTTP/1.1 400") and "company" in body["error"]
+    head, body = asyncio.run(_post("/v1/simulate", _payload_json({"company": COMPANIES[0], "n_months": 0})))
+    assert head.startswith("HTTP/1.1 400") and "n_months" in body["error"]
+
+
+def test_unknown_paths_share_one_metrics_series(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", True)
+    for path in ("/nope", "/v2/simulate", "/wp-admin/x"):
+        head, _ = asyncio.run(_post(path, b"{}"))
+        assert head.startswith("HTTP/1.1 404")
+    text = metrics.render_prometheus()
+    assert 'path="other"' in text
+    for path in ("/nope", "/v2/simulate", "/wp-admin/x"):
+        assert f'path="{path}"' not in text
+
+
+async def _request(host, port, path, body=b""):
+    reader, writer = await asyncio.open_connection(host, port)
+    method = "POST" if body else "GET"
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: test\r\nContent-Length: {len(body)}\r\n"
+                 f"Connection: close\r\n\r\n".encode("ascii") + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return response
+
+
+def test_health_check_answers_during_large_simulate(monkeypatch):
+    # 最大行数の計算中も、イベントループが止まらず /healthz が計算の終わりを待たずに返る
+    payload = {"company": COMPANIES[0], "n_months": api.MAX_MONTHS,
+               "scenarios": [{"sales_change": i % 60 - 30} for i in range(api.MAX_SIMULATE_ROWS)]}
+    started = threading.Event()
+    finished = []
+    evaluate = api.evaluate
+
+    def timed_evaluate(*args):
+        started.set()
+        try:
+            return evaluate(*args)
+        finally:
+            finished.append(time.perf_counter())
+
+    monkeypatch.setattr(api, "evaluate", timed_evaluate)
+    answered = []
+
+    async def run():
+        srv = await asyncio.start_server(api.ApiServer().handle, "127.0.0.1", 0, limit=api.MAX_HEADER_BYTES)
+        host, port = srv.sockets[0].getsockname()[:2]
+        async with srv:
+            big = asyncio.create_task(_request(host, port, "/v1/simulate", _payload_json(payload)))
+            # 計算が始まってから問い合わせる（ループが止まっていれば、ここに戻るのは計算の後）
+            while not started.is_set():
+                await asyncio.sleep(0.001)
+            health = await _request(host, port, "/healthz")
+            answered.append(time.perf_counter())
+            assert health.startswith(b"HTTP/1.1 200")
+            assert (await big).startswith(b"HTTP/1.1 200")
+
+    asyncio.run(run())
+    assert answered[0] < finished[0]
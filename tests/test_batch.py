@@ -0,0 +1,76 @@
+"""batch.run の再開（.progress）が、前回と同じ条件のときだけ続きを書くこと。"""
+
+import io
+import json
+
+import pytest
+
+import batch
+
+HEADER = "id,revenue,cogs,fixed_cost,cash,receivables,payables\n"
+
+
+def _write_input(path, n):
+    path.write_text(HEADER + "".join(f"{i},5000000,3000000,1500000,{i * 100000},5000000,3000000\n"
+                                     for i in range(n)), encoding="utf-8")
+    return str(path)
+
+
+def _run(input_path, output, **kwargs):
+    return batch.run(input_path, output, workers=1, chunk_size=4, log=io.StringIO(), **kwargs)
+
+
+def _progress(output):
+    with open(output + ".progress", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_resume_continues_from_progress(tmp_path):
+    input_path = _write_input(tmp_path / "in.csv", 10)
+    output = str(tmp_path / "out.csv")
+    assert _run(input_path, output, n_months=12) == 10
+    # 途中（8 行目まで）で止まったことにして、同じ条件で続きを書く
+    state = _progress(output)
+    with open(output, "rb") as f:
+        lines = f.readlines()
+    position = sum(len(line) for line in lines[:9])
+    with open(output + ".progress", "w", encoding="utf-8") as f:
+        json.dump(dict(state, rows_done=8, position=position), f)
+    assert _run(input_path, output, n_months=12) == 10
+    with open(output, "rb") as f:
+        assert f.readlines() == lines
+
+
+@pytest.mark.parametrize("change", ["n_months", "input", "chunk_size"])
+def test_resume_refuses_different_settings(tmp_path, change):
+    input_path = _write_input(tmp_path / "in.csv", 10)
+    output = str(tmp_path / "out.csv")
+    _run(input_path, output, n_months=12)
+    with open(output, "rb") as f:
+        before = f.read()
+
+    if change == "n_months":
+        call = lambda: _run(input_path, output, n_months=24)
+    elif change == "input":
+        other = _write_input(tmp_path / "other.csv", 10)
+        call = lambda: _run(other, output, n_months=12)
+    else:
+        call = lambda: batch.run(input_path, output, workers=1, chunk_size=5, n_months=12, log=io.StringIO())
+    with pytest.raises(SystemExit, match="--restart"):
+        call()
+    with open(output, "rb") as f:
+        assert f.read() == before
+    # --restart なら最初からやり直す
+    _run(input_path, output, n_months=24, restart=True)
+    assert _progress(output)["n_months"] == 24
+
+
+def test_progress_without_new_keys_still_resumes(tmp_path):
+    # 予測期間・入力ファイルを記録していない古い .progress は、そのまま続きから実行する
+    input_path = _write_input(tmp_path / "in.csv", 6)
+    output = str(tmp_path / "out.csv")
+    _run(input_path, output, n_months=12)
+    state = _progress(output)
+    with open(output + ".progress", "w", encoding="utf-8") as f:
+        json.dump({k: state[k] for k in ("rows_done", "position", "chunk_size", "format")}, f)
+    assert _run(input_path, output, n_months=12) == 6
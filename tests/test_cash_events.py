@@ -0,0 +1,80 @@
+"""cash_events の予定の展開（繰り返し）と当てはめ。"""
+
+import numpy as np
+import pytest
+
+import cash_events
+import engine
+
+START = np.datetime64("2026-11")
+
+
+def naive_occurrences(events, start, n_months):
+    """予定を 1 件ずつ、1 回ずつ数える（比較用）。"""
+    out = []
+    for e in events:
+        offset = int((e["month"] - np.datetime64(start, "M")).astype(int))
+        months = range(offset, n_months, int(e["every"])) if e["every"] > 0 else [offset]
+        out += [(m + 1, int(e["day"]), float(e["amount"]), int(e["kind"])) for m in months if 0 <= m < n_months]
+    return sorted(out)
+
+
+def _as_rows(occ):
+    return sorted(zip(occ["month"].tolist(), occ["day"].tolist(), occ["amount"].tolist(), occ["kind"].tolist()))
+
+
+def test_occurrences_expand_recurrences():
+    rng = np.random.default_rng(0)
+    rows = [(START + int(m), int(d), -float(a), int(e), int(k))
+            for m, d, a, e, k in zip(rng.integers(-40, 40, 300), rng.integers(1, 32, 300),
+                                     rng.integers(1, 100, 300) * 10_000, rng.choice([0, 1, 3, 6, 12, 24], 300),
+                                     rng.integers(0, len(cash_events.KINDS), 300))]
+    events = cash_events.schedule(rows)
+    for n_months in (1, 6, 12, 37):
+        assert _as_rows(cash_events.occurrences(events, START, n_months)) == \
+            naive_occurrences(events, START, n_months)
+
+
+def test_occurrences_skip_forward_from_past_start():
+    # 2025-02 から 5ヶ月ごと: 2026-11 以降の最初の回は 2027-03（期首から 5ヶ月目）
+    events = cash_events.schedule([(np.datetime64("2025-02"), 10, -1.0, 5, cash_events.OTHER)])
+    occ = cash_events.occurrences(events, START, 12)
+    assert occ["month"].tolist() == [5, 10]
+    assert cash_events.occurrences(cash_events.empty(), START, 12)["month"].size == 0
+
+
+def test_bonus_and_taxes_months():
+    months = lambda s: sorted({m for m, _, _ in cash_events.summary(s, START, 12)})
+    assert months(cash_events.bonus(1_000_000, START)) == ["2026-12", "2027-07"]
+    # 3 月決算: 確定申告は 5 月末、中間申告は 11 月末
+    assert months(cash_events.taxes(2_000_000, 1_000_000, 3, START)) == ["2027-05"]
+    summary = cash_events.summary(cash_events.taxes(2_000_000, 1_000_000, 3, START, interim=True), START, 12)
+    assert summary == [("2026-11", "法人税等", -1_000_000.0), ("2026-11", "消費税", -500_000.0),
+                       ("2027-05", "法人税等", -1_000_000.0), ("2027-05", "消費税", -500_000.0)]
+
+
+def test_parse():
+    events = cash_events.parse("# コメント\n2027-07-10, -3,000,000, 12\n2027/3 500000\n2027-12-25、-1,200,000円")
+    assert events["month"].tolist() == [np.datetime64("2027-07"), np.datetime64("2027-03"),
+                                        np.datetime64("2027-12")]
+    assert events["day"].tolist() == [10, 31, 25]
+    assert events["amount"].tolist() == [-3_000_000.0, 500_000.0, -1_200_000.0]
+    assert events["every"].tolist() == [12, 0, 0]
+    assert cash_events.parse("").size == 0
+    with pytest.raises(ValueError, match="2 行目"):
+        cash_events.parse("2027-07 -1\n2027-13 -1")
+
+
+def test_apply_matches_adding_each_occurrence():
+    events = cash_events.combine(cash_events.bonus(1_000_000, START), cash_events.capex(3_000_000, START, 4),
+                                 cash_events.schedule([(START - 3, 31, 200_000.0, 3, cash_events.OTHER)]))
+    result = engine.project(5_000_000, 3_000_000, 1_500_000, 4_000_000, 5_000_000, 3_000_000,
+                            sales_change=np.linspace(-30, 30, 61), n_months=24)
+    out = cash_events.apply(result, events, START)
+    expected = result["cash"].copy()
+    for month, _, amount, _ in naive_occurrences(events, START, 24):
+        expected[:, month:] += amount
+    np.testing.assert_allclose(out["cash"], expected)
+    np.testing.assert_allclose(out["min_cash"], expected.min(axis=1))
+    short = np.where((expected < 0).any(axis=1), (expected < 0).argmax(axis=1), -1)
+    np.testing.assert_array_equal(out["short_month"], short)
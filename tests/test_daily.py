@@ -0,0 +1,65 @@
+"""daily.project_daily の月末残高と、月次のエンジン（engine.project）との一致。
+
+売掛金・買掛金がちょうど 1ヶ月分で、締めが月末・支払が翌月 10 日なら、各月の入金（支払）は
+前月の売上（原価）そのもので、月次のエンジンと同じ月末残高になる（差は円未満の丸めだけ）。
+10 日・25 日・月末は土日・祝日でずらしても月をまたがないので、祝日の並びにもよらない。
+"""
+
+import numpy as np
+import pytest
+
+import cash_events
+import daily
+import engine
+
+TERMS = (31, 1, 10)
+START = np.datetime64("2026-11")
+
+
+def _scenarios(k, seed=0):
+    rng = np.random.default_rng(seed)
+    revenue = rng.uniform(1_000_000, 30_000_000, k)
+    cogs = revenue * rng.uniform(0.2, 0.9, k)
+    return dict(revenue=revenue, cogs=cogs, fixed_cost=rng.uniform(200_000, 8_000_000, k),
+                cash=rng.uniform(0, 50_000_000, k), receivables=revenue, payables=cogs,
+                sales_change=rng.integers(-30, 31, k).astype(float), cost_cut=rng.uniform(-10, 10, k),
+                invest=rng.uniform(-500_000, 500_000, k), ramp_months=rng.integers(1, 7, k).astype(float))
+
+
+def _rounding(n_months):
+    # 入金・支払・固定費・期首残高を月ごとに円に丸めるので、1ヶ月あたり数円までずれうる
+    return 4.0 * (n_months + 1)
+
+
+@pytest.mark.parametrize("n_months", [engine.N_MONTHS, 24])
+def test_month_end_matches_monthly_engine(n_months):
+    s = _scenarios(200)
+    out = daily.project_daily(**s, n_months=n_months, start=START, sales_terms=TERMS, cost_terms=TERMS)
+    expected = engine.project(**s, n_months=n_months)["cash"]
+    assert out["month_end_cash"].dtype == np.int64
+    np.testing.assert_allclose(out["month_end_cash"], expected, rtol=0, atol=_rounding(n_months))
+    # 月中の最低残高は月末残高を上回らず、期間の最低残高はその最小
+    assert (out["month_min_cash"] <= out["month_end_cash"][:, 1:]).all()
+    np.testing.assert_array_equal(out["min_cash"],
+                                  np.minimum(out["month_min_cash"].min(axis=1), out["month_end_cash"][:, 0]))
+
+
+def test_month_end_with_events():
+    s = _scenarios(100, seed=1)
+    events = cash_events.combine(cash_events.bonus(1_000_000, START, day=25),
+                                 cash_events.schedule([(START + 2, 10, 3_000_000.0, 0, cash_events.OTHER),
+                                                       (START - 1, 25, -250_000.0, 3, cash_events.OTHER)]))
+    out = daily.project_daily(**s, n_months=12, start=START, sales_terms=TERMS, cost_terms=TERMS, events=events)
+    expected = cash_events.shift(engine.project(**s, n_months=12)["cash"], events, START)
+    np.testing.assert_allclose(out["month_end_cash"], expected, rtol=0, atol=_rounding(12))
+
+
+def test_daily_balances_agree_with_month_end():
+    s = _scenarios(20, seed=2)
+    out = daily.project_daily(**s, n_months=12, start=START, daily=True)
+    assert out["cash"].shape == (20, len(out["dates"]))
+    month_end = np.flatnonzero(np.diff(out["dates"].astype("datetime64[M]"), append=out["dates"][-1] + 1))
+    np.testing.assert_array_equal(out["cash"][:, month_end], out["month_end_cash"][:, 1:])
+    np.testing.assert_array_equal(out["min_cash"], np.minimum(out["cash"].min(axis=1), out["month_end_cash"][:, 0]))
+    short = (out["cash"] < 0).any(axis=1)
+    np.testing.assert_array_equal(out["short_day"] >= 0, short)
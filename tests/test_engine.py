@@ -0,0 +1,96 @@
+"""engine.project と、元の app.py の 1 シナリオずつのループとの一致。"""
+
+import numpy as np
+import pytest
+
+import engine
+
+
+def reference(rev, cgs, fxd, csh, rec, pay, sales_change=0, cost_cut=0.0, invest=0, ramp_months=1,
+              n_months=engine.N_MONTHS):
+    """抽出前の app.py の計算をそのまま写したもの（予測期間だけ可変）。"""
+    v_rate = cgs / rev if rev > 0 else 0.0
+    m_rec = rec / rev if rev > 0 else 0.0
+    m_pay = pay / cgs if cgs > 0 else 0.0
+
+    target_rev = rev * (1 + sales_change / 100)
+    sim_v_rate = v_rate * (1 + cost_cut / 100)
+    sim_fxd = fxd + invest
+
+    mg_rate = max(1.0 - sim_v_rate, 0.001)
+    bep_rev = sim_fxd / mg_rate
+    bep_diff = target_rev - bep_rev
+
+    target_op_profit = target_rev - (target_rev * sim_v_rate) - sim_fxd
+    safety_margin_ratio = (bep_diff / target_rev * 100) if target_rev > 0 else 0.0
+    invest_payback_sales = invest / mg_rate if invest > 0 and mg_rate > 0 else 0.0
+
+    cf_line = [csh]
+    current_act_csh = csh
+    prev_ar_balance = rec
+    prev_ap_balance = pay
+    for i in range(1, n_months + 1):
+        if ramp_months <= 1:
+            month_rev = target_rev
+        else:
+            progress = min(i / ramp_months, 1.0)
+            month_rev = rev + (target_rev - rev) * progress
+        month_cgs = month_rev * sim_v_rate
+        month_op_profit = month_rev - month_cgs - sim_fxd
+        curr_ar_balance = month_rev * m_rec
+        curr_ap_balance = month_cgs * m_pay
+        month_cash_flow = month_op_profit - (curr_ar_balance - prev_ar_balance) + (curr_ap_balance - prev_ap_balance)
+        current_act_csh += month_cash_flow
+        cf_line.append(current_act_csh)
+        prev_ar_balance = curr_ar_balance
+        prev_ap_balance = curr_ap_balance
+
+    min_cash = min(cf_line)
+    short_month = next((i for i, x in enumerate(cf_line) if x < 0), None)
+    return {
+        "cash": cf_line, "min_cash": min_cash, "short_month": -1 if short_month is None else short_month,
+        "bep_rev": bep_rev, "safety_margin_ratio": safety_margin_ratio, "target_rev": target_rev,
+        "sim_v_rate": sim_v_rate, "target_op_profit": target_op_profit,
+        "invest_payback_sales": invest_payback_sales,
+        "months_sales_ratio": min_cash / target_rev if target_rev > 0 else 0,
+    }
+
+
+def _scenarios(k, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "rev": rng.choice([0, 1_000_000, 5_000_000, 30_000_000], k) * rng.uniform(0.5, 1.5, k),
+        "cgs": rng.choice([0, 1], k, p=[0.1, 0.9]) * rng.uniform(0, 20_000_000, k),
+        "fxd": rng.uniform(0, 10_000_000, k),
+        "csh": rng.uniform(0, 50_000_000, k),
+        "rec": rng.uniform(0, 20_000_000, k),
+        "pay": rng.uniform(0, 10_000_000, k),
+        "sales_change": rng.integers(-50, 51, k).astype(float),
+        "cost_cut": rng.uniform(-20, 20, k),
+        "invest": rng.uniform(-5_000_000, 5_000_000, k),
+        "ramp_months": rng.integers(1, 7, k).astype(float),
+    }
+
+
+@pytest.mark.parametrize("n_months", [engine.N_MONTHS, 24])
+def test_project_matches_original_loop(n_months):
+    s = _scenarios(300)
+    out = engine.project(s["rev"], s["cgs"], s["fxd"], s["csh"], s["rec"], s["pay"],
+                         s["sales_change"], s["cost_cut"], s["invest"], s["ramp_months"], n_months=n_months)
+    assert out["cash"].shape == (300, n_months + 1)
+    for i in range(300):
+        ref = reference(*(s[f][i] for f in s), n_months=n_months)
+        np.testing.assert_allclose(out["cash"][i], ref["cash"], rtol=1e-12, atol=1e-6)
+        for field in ("min_cash", "bep_rev", "safety_margin_ratio", "target_rev", "sim_v_rate",
+                      "target_op_profit", "invest_payback_sales", "months_sales_ratio"):
+            assert out[field][i] == pytest.approx(ref[field], rel=1e-12, abs=1e-6), field
+        assert out["short_month"][i] == ref["short_month"]
+
+
+def test_project_broadcasts_scalars_against_levers():
+    out = engine.project(5_000_000, 3_000_000, 1_500_000, 2_000_000, 5_000_000, 3_000_000,
+                         sales_change=[-20, 0, 20], invest=300_000)
+    for i, change in enumerate((-20, 0, 20)):
+        ref = reference(5_000_000, 3_000_000, 1_500_000, 2_000_000, 5_000_000, 3_000_000,
+                        sales_change=change, invest=300_000)
+        np.testing.assert_allclose(out["cash"][i], ref["cash"])
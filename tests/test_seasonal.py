@@ -0,0 +1,95 @@
+"""seasonal.fit が合成した季節の波と傾きを取り戻すこと。"""
+
+import numpy as np
+import pytest
+
+import daily
+import engine
+import montecarlo
+import seasonal
+import sensitivity
+
+PHASE = 2 * np.pi * np.arange(seasonal.PERIOD) / seasonal.PERIOD
+SEASON = 800_000 * np.sin(PHASE) + 300_000 * np.cos(2 * PHASE)   # 12ヶ月の合計は 0
+
+
+def _history(length, level=10_000_000, trend=50_000, noise=0.0, seed=0):
+    pos = np.arange(length)
+    y = level + trend * (pos - (length - 1)) + SEASON[pos % seasonal.PERIOD]
+    return y + np.random.default_rng(seed).normal(0, noise, length)
+
+
+@pytest.mark.parametrize("length", [24, 36, 60])
+def test_fit_recovers_exact_season(length):
+    # 解くときに足すごく小さいリッジの分だけずれるので、許容は 1 円未満
+    model = seasonal.fit(_history(length))
+    assert model["level"][0] == pytest.approx(10_000_000, abs=1.0)
+    assert model["trend"][0] == pytest.approx(50_000, abs=1e-2)
+    np.testing.assert_allclose(model["season"][0], SEASON, atol=1.0)
+    # 予測も同じ式の続き
+    h = np.arange(1, 13)
+    expected = 10_000_000 + 50_000 * h + SEASON[(length - 1 + h) % seasonal.PERIOD]
+    np.testing.assert_allclose(seasonal.baseline(model, 12)[0], expected, rtol=0, atol=1.0)
+
+
+def test_fit_with_noise_and_missing_months():
+    histories = [_history(n, level=5_000_000 * (i + 1), noise=50_000, seed=i)
+                 for i, n in enumerate((60, 48, 36, 36))]
+    histories[2] = histories[2].copy()
+    histories[2][[3, 17]] = np.nan
+    model = seasonal.fit(seasonal.stack_histories(histories))
+    for i, h in enumerate(histories):
+        n = len(h)
+        # 残差の標準偏差 50,000 円に対して、推定のずれは十分小さい
+        assert abs(model["trend"][i] - 50_000) < 10_000
+        np.testing.assert_allclose(model["season"][i], SEASON, atol=120_000)
+        assert model["n_obs"][i] == n - np.isnan(h).sum()
+        idx = seasonal.seasonal_index(model)[i]
+        assert idx.mean() == pytest.approx(1.0, abs=1e-9)
+
+
+def test_short_history_falls_back():
+    # 24ヶ月未満は傾き 0、12ヶ月未満は季節効果も 0（平均の横ばい）
+    model = seasonal.fit(seasonal.stack_histories([_history(18, trend=0), _history(6, trend=0)], 18))
+    assert (model["trend"] == 0).all()
+    np.testing.assert_allclose(model["season"][0], SEASON, atol=1.0)
+    assert (model["season"][1] == 0).all()
+    assert model["level"][1] == pytest.approx(_history(6, trend=0).mean(), abs=1.0)
+
+
+def test_constant_baseline_matches_flat_revenue():
+    # 毎月同じ基準売上（= 月間売上高）なら、感度分析・日次・モンテカルロは季節性なしと同じ結果
+    company = dict(revenue=5_000_000, cogs=3_000_000, fixed_cost=1_500_000, cash=4_000_000,
+                   receivables=5_000_000, payables=3_000_000)
+    levers = dict(sales_change=12, cost_cut=-3.0, invest=200_000, ramp_months=4)
+    flat = np.full((1, 18), 5_000_000.0)
+
+    sens = sensitivity.analyze(**company, **levers, n_months=18)
+    with_base = sensitivity.analyze(**company, **levers, n_months=18, revenue_base=flat)
+    for key in sensitivity.OUTPUTS:
+        for part in ("base", "low", "high"):
+            np.testing.assert_allclose(with_base[key][part], sens[key][part], rtol=1e-12, err_msg=key)
+
+    start = np.datetime64("2026-11")
+    day = daily.project_daily(**company, **levers, n_months=18, start=start)
+    day_base = daily.project_daily(**company, **levers, n_months=18, start=start, revenue_base=flat)
+    np.testing.assert_array_equal(day_base["month_end_cash"], day["month_end_cash"])
+    np.testing.assert_array_equal(day_base["min_cash"], day["min_cash"])
+
+    mc = montecarlo.run(**company, **levers, n_months=18, n_paths=2_000, seed=0)
+    mc_base = montecarlo.run(**company, **levers, n_months=18, n_paths=2_000, seed=0, revenue_base=flat)
+    np.testing.assert_allclose(mc_base["p_short_cum"], mc["p_short_cum"])
+    np.testing.assert_allclose(mc_base["mean"], mc["mean"], rtol=1e-12)
+
+
+def test_seasonal_baseline_reaches_every_view():
+    # 季節の波があれば、どの計算も同じ基準売上で動く（engine.project と月末残高がそろう）
+    company = dict(revenue=5_000_000, cogs=3_000_000, fixed_cost=1_500_000, cash=4_000_000,
+                   receivables=5_000_000, payables=3_000_000)
+    base = 5_000_000 + 5 * SEASON[np.arange(12)][None, :]
+    projected = engine.project(**company, n_months=12, revenue_base=base)
+    sens = sensitivity.analyze(**company, n_months=12, revenue_base=base)
+    assert sens["min_cash"]["base"] == pytest.approx(projected["min_cash"][0])
+    mc = montecarlo.run(**company, n_months=12, n_paths=1_000, seed=0, rev_sigma=0.0, v_rate_sigma=0.0,
+                        rec_sigma=0.0, pay_sigma=0.0, revenue_base=base)
+    np.testing.assert_allclose(mc["mean"], projected["cash"][0])
@@ -0,0 +1,54 @@
+"""sensitivity.analyze の基準・上げ下げが、画面の最低預金残高と同じ計算になること。"""
+
+import numpy as np
+import pytest
+
+import cash_events
+import engine
+import sensitivity
+
+START = np.datetime64("2026-11")
+COMPANY = dict(revenue=5_000_000, cogs=3_000_000, fixed_cost=1_500_000, cash=6_000_000,
+               receivables=5_000_000, payables=3_000_000)
+LEVERS = dict(sales_change=10, cost_cut=-2.0, invest=300_000, ramp_months=3)
+EVENTS = cash_events.combine(cash_events.bonus(1_200_000, START),
+                             cash_events.taxes(2_000_000, 900_000, 3, START, interim=True))
+FINANCING = dict(loan_balance=12_000_000, loan_principal=250_000, loan_rate=1.5,
+                 credit_line=3_000_000, overdraft_rate=4.0)
+
+
+def card_min_cash(invest=LEVERS["invest"], **changes):
+    """app.py の KPI カードと同じ順（予定・設備投資 → 借入・貸越）の最低預金残高。"""
+    inputs = {**COMPANY, **LEVERS, "invest": invest, **changes}
+    result = engine.project(**inputs, n_months=18)
+    events = cash_events.combine(EVENTS, cash_events.capex(max(invest, 0) * 12, START, 3))
+    result = cash_events.apply(result, events, START)
+    return engine.apply_financing(result, **{**engine.FINANCING_DEFAULTS, **FINANCING})["min_cash"][0]
+
+
+@pytest.mark.parametrize("pct", [10.0, 30.0])
+def test_min_cash_includes_events_capex_and_financing(pct):
+    sens = sensitivity.analyze(**COMPANY, **LEVERS, pct=pct, n_months=18, events=EVENTS, start=START,
+                               capex_months=12, capex_month=3, financing=FINANCING)
+    entry = sens["min_cash"]
+    assert entry["base"] == pytest.approx(card_min_cash())
+    # 固定費の増減を動かした行は、設備投資もその固定費の増加に合わせて変わる
+    i = sensitivity.INPUTS.index("invest")
+    step = COMPANY["fixed_cost"] * pct / 100
+    assert entry["low"][i] == pytest.approx(card_min_cash(LEVERS["invest"] - step))
+    assert entry["high"][i] == pytest.approx(card_min_cash(LEVERS["invest"] + step))
+    i = sensitivity.INPUTS.index("sales_change")
+    assert entry["high"][i] == pytest.approx(card_min_cash(sales_change=LEVERS["sales_change"] + pct))
+
+
+def test_without_events_matches_plain_projection():
+    sens = sensitivity.analyze(**COMPANY, **LEVERS, n_months=18)
+    plain = engine.project(**COMPANY, **LEVERS, n_months=18)
+    for key in sensitivity.OUTPUTS:
+        assert sens[key]["base"] == pytest.approx(plain[key][0])
+    # 予定・借入は損益（営業利益・損益分岐点）には効かない
+    with_events = sensitivity.analyze(**COMPANY, **LEVERS, n_months=18, events=EVENTS, start=START,
+                                      financing=FINANCING)
+    for key in ("target_op_profit", "bep_rev"):
+        np.testing.assert_allclose(with_events[key]["low"], sens[key]["low"])
+    assert with_events["min_cash"]["base"] < sens["min_cash"]["base"]
@@ -0,0 +1,66 @@
+"""sketch.py の分位点の精度（np.quantile による厳密値との順位誤差）。"""
+
+import numpy as np
+import pytest
+
+import montecarlo
+from sketch import CashStreamStats, QuantileSketch
+
+# 許容する順位誤差（|推定値の順位 − 目標順位| / パス数）。sketch.py の実測値（P5/P95 0.12%、P50 0.2%）に余裕を持たせたもの
+RANK_TOLERANCE = {5: 0.003, 50: 0.005, 95: 0.003}
+
+
+def _rank_error(sorted_values, estimate, q):
+    """推定値が厳密な順位のどこに入るかと、目標順位 q とのずれ（パス数に対する割合）。"""
+    n = len(sorted_values)
+    lo = np.searchsorted(sorted_values, estimate, side="left") / n
+    hi = np.searchsorted(sorted_values, estimate, side="right") / n
+    # 同じ値が並ぶ区間のどこかに q が入れば誤差 0
+    return max(lo - q, q - hi, 0.0)
+
+
+@pytest.fixture(scope="module")
+def paths():
+    chunks = list(montecarlo.simulate_chunks(
+        5_000_000, 3_000_000, 1_500_000, 3_000_000, 5_000_000, 3_000_000,
+        sales_change=10, n_months=12, n_paths=200_000, seed=1))
+    return chunks, np.sort(np.concatenate(chunks), axis=0)
+
+
+def test_cash_stream_bands_match_exact_quantiles(paths):
+    chunks, exact = paths
+    stats = CashStreamStats(exact.shape[1])
+    for chunk in chunks:
+        stats.update(chunk)
+    result = stats.result((5, 50, 95))
+    assert result["n_paths"] == len(exact)
+    for band, tolerance in RANK_TOLERANCE.items():
+        for month in range(1, exact.shape[1]):
+            err = _rank_error(exact[:, month], result["bands"][band][month], band / 100)
+            assert err <= tolerance, (band, month, err)
+    np.testing.assert_array_equal(result["min"], exact[0])
+
+
+@pytest.mark.parametrize("dist", ["normal", "lognormal", "mixture", "sorted"])
+def test_quantile_sketch_rank_error(dist):
+    rng = np.random.default_rng(0)
+    n = 300_000
+    if dist == "normal":
+        values = rng.normal(0, 1e6, n)
+    elif dist == "lognormal":
+        values = rng.lognormal(14, 1.0, n)
+    elif dist == "mixture":
+        values = np.where(rng.random(n) < 0.2, rng.normal(-5e6, 1e6, n), rng.normal(3e6, 5e5, n))
+    else:
+        # 順序に偏りのある流し方（小さい順に届く）
+        values = np.sort(rng.normal(0, 1e6, n))
+    sketch = QuantileSketch(1)
+    for start in range(0, n, montecarlo.CHUNK_SIZE):
+        sketch.update(values[start:start + montecarlo.CHUNK_SIZE, None])
+    exact = np.sort(values)
+    for band, tolerance in RANK_TOLERANCE.items():
+        estimate = sketch.quantile(band / 100)[0]
+        assert _rank_error(exact, estimate, band / 100) <= tolerance
+        # 値としても np.quantile と近い（分布の幅に対して 1% 以内）
+        spread = exact[-1] - exact[0]
+        assert abs(estimate - np.quantile(values, band / 100)) <= 0.01 * spread
@@ -0,0 +1,102 @@
+"""solver.solve の限界値で、最低預金残高がちょうど下限になること。"""
+
+import numpy as np
+import pytest
+
+import cash_events
+import engine
+import seasonal
+import solver
+
+START = np.datetime64("2026-11")
+FLOOR = 1_000_000.0
+# 残高は数千万円の規模なので、1 円未満のずれは丸め誤差とみなす
+ATOL = 1e-3
+
+
+def _companies(k, seed=0):
+    rng = np.random.default_rng(seed)
+    return dict(
+        revenue=rng.uniform(1_000_000, 30_000_000, k),
+        cogs=rng.uniform(0.2, 0.9, k) * rng.uniform(1_000_000, 30_000_000, k),
+        fixed_cost=rng.uniform(200_000, 8_000_000, k),
+        cash=rng.uniform(0, 50_000_000, k),
+        receivables=rng.uniform(0, 30_000_000, k),
+        payables=rng.uniform(0, 15_000_000, k),
+        sales_change=rng.integers(-30, 31, k).astype(float),
+        cost_cut=rng.uniform(-10, 10, k),
+        invest=rng.uniform(-500_000, 500_000, k),
+        ramp_months=rng.integers(1, 7, k).astype(float),
+    )
+
+
+def _min_cash(inputs, lever, value, events=None, capex_months=0, capex_month=1, **kwargs):
+    """lever だけを value に変えて、app.py と同じ順（予定・設備投資を足す）で最低残高を出す。"""
+    inputs = {**inputs, lever: value}
+    result = engine.project(**inputs, **kwargs)
+    n_months = result["cash"].shape[1] - 1
+    cash = result["cash"]
+    if events is not None:
+        cash = cash_events.shift(cash, events, START)
+    if capex_months:
+        for i, invest in enumerate(np.broadcast_to(inputs["invest"], len(cash))):
+            cash[i] += cash_events.cumulative(
+                cash_events.capex(max(invest, 0.0) * capex_months, START, capex_month), START, n_months)
+    return cash.min(axis=1)
+
+
+def _check_limits(inputs, out, **kwargs):
+    checked = 0
+    for key, lever in (("max_invest", "invest"), ("min_sales_change", "sales_change"),
+                       ("max_sales_change", "sales_change"), ("max_cost_cut", "cost_cut")):
+        limit = out[key]
+        finite = np.isfinite(limit)
+        at_limit = _min_cash(inputs, lever, np.where(finite, limit, 0.0), **kwargs)
+        clamped = finite & (limit == solver.LEVER_MIN)
+        exact = finite & ~clamped
+        np.testing.assert_allclose(at_limit[exact], FLOOR, rtol=0, atol=ATOL, err_msg=key)
+        # −100% で止めた下限は、そこでも残高が下限を割らない
+        assert (at_limit[clamped] >= FLOOR - ATOL).all(), key
+        checked += exact.sum()
+    assert checked > 0
+
+
+@pytest.mark.parametrize("n_months", [engine.N_MONTHS, 24])
+def test_limits_hit_floor(n_months):
+    inputs = _companies(400)
+    out = solver.solve(**inputs, n_months=n_months, cash_floor=FLOOR)
+    _check_limits(inputs, out, n_months=n_months)
+
+
+def test_limits_with_events_and_capex():
+    inputs = _companies(400, seed=1)
+    events = cash_events.combine(cash_events.bonus(800_000, START),
+                                 cash_events.taxes(1_500_000, 700_000, 3, START, interim=True))
+    out = solver.solve(**inputs, n_months=12, cash_floor=FLOOR, events=events, start=START,
+                       capex_months=12, capex_month=3)
+    _check_limits(inputs, out, n_months=12, events=events, capex_months=12, capex_month=3)
+    # 設備投資を含めた上限は、含めない上限を超えない
+    no_capex = solver.solve(**inputs, n_months=12, cash_floor=FLOOR, events=events, start=START)
+    both = np.isfinite(out["max_invest"]) & np.isfinite(no_capex["max_invest"])
+    assert (out["max_invest"][both] <= no_capex["max_invest"][both] + ATOL).all()
+
+
+def test_limits_with_seasonal_baseline():
+    inputs = _companies(200, seed=2)
+    months = np.arange(36)
+    rng = np.random.default_rng(3)
+    history = (inputs["revenue"][:, None] * (1 + 0.3 * np.sin(2 * np.pi * months / 12))
+               * rng.uniform(0.95, 1.05, (200, 36)))
+    base = seasonal.baseline(seasonal.fit(history), 18)
+    out = solver.solve(**inputs, n_months=18, cash_floor=FLOOR, revenue_base=base)
+    _check_limits(inputs, out, n_months=18, revenue_base=base)
+
+
+def test_limits_stay_in_lever_domain():
+    # 現預金が薄く固定費が重い会社: 売上・原価率をどう動かしても足りない
+    out = solver.solve(1_000_000, 500_000, 2_000_000, 100_000, 0, 0, n_months=6)
+    assert np.isnan(out["min_sales_change"]).all() or (out["min_sales_change"] >= solver.LEVER_MIN).all()
+    assert np.isnan(out["max_cost_cut"]).all() or (out["max_cost_cut"] >= solver.LEVER_MIN).all()
+    # 現預金が十分なら、売上がほぼ 0 でも持つので下限は −100% で止まる
+    out = solver.solve(1_000_000, 500_000, 100_000, 100_000_000, 0, 0, n_months=6)
+    assert out["min_sales_change"][0] == solver.LEVER_MIN